@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Bearer token checks and per-role rate limits for the HTTP proxy engine.
+
+With --verify-jwt the proxy verifies the Authorization header of every
+request itself, as PostgREST would (jwtutil.decode_jwt_token: HS256 with
+PGRST_JWT_SECRET, exp enforced), and answers missing, invalid and expired
+tokens with 401 without touching the upstream. Verified tokens are kept in
+an LRU cache until their exp, so a device sending the same token with every
+upload costs a dict lookup instead of an HMAC and a JSON decode.
+
+--rate-limit ROLE=RATE[:BURST] admits RATE requests per second per role
+(token bucket, BURST defaults to one second's worth) and answers the rest
+with 429 and Retry-After, which uploader.py honours. ROLE "*" limits the
+roles without their own limit. Limits apply per worker process.
+
+renew_authorization() re-signs the token of a spooled upload that expired
+while it waited, so the upload is not refused when the spool drains.
+"""
+
+import math
+import time
+from collections import OrderedDict
+
+import typer
+
+import jwtutil
+
+
+DEFAULT_TOKEN_CACHE = 10000
+ANY_ROLE = "*"
+RENEW_MARGIN = 60  # Seconds of validity a spooled token needs left to be replayed as it is
+RENEWED_HOURS = 1
+
+
+class AuthError(Exception):
+    """A request refused by the proxy: status, message and, for 429, seconds until it may retry."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_rate_limits(specs):
+    """{role: (rate, burst)} from ROLE=RATE[:BURST] strings; raises ValueError on a bad spec."""
+    limits = {}
+    for spec in specs or ():
+        role, sep, value = spec.partition("=")
+        rate, _, burst = value.partition(":")
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else max(rate, 1.0)
+        except ValueError:
+            rate = burst = 0.0
+        if not sep or not role or rate <= 0 or burst < 1:
+            raise ValueError(f"Bad rate limit {spec!r}: expected ROLE=RATE[:BURST] with RATE > 0 and BURST >= 1")
+        limits[role] = (rate, burst)
+    return limits
+
+
+def renew_authorization(authorization, spooled_at):
+    """
+    The Authorization header to replay an upload spooled at `spooled_at` with.
+
+    A token signed with PGRST_JWT_SECRET that was valid when the upload was
+    spooled but is (nearly) expired now is replaced by a fresh one with the
+    same role and claims. Anything else is returned unchanged, so forged or
+    already expired tokens still get their 401 from PostgREST.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return authorization
+    try:
+        claims = jwtutil.decode_jwt_token(token.strip(), verify_exp=False)
+    except typer.BadParameter:
+        return authorization
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or exp <= spooled_at or exp > time.time() + RENEW_MARGIN:
+        return authorization
+    extra = {k: v for k, v in claims.items() if k not in ("role", "iat", "exp", "iss")}
+    try:
+        renewed = jwtutil.cached_jwt_token(claims.get("role", ""), RENEWED_HOURS, extra or None)
+    except typer.BadParameter:  # Not one of jwtutil.ROLES
+        return authorization
+    return f"Bearer {renewed}"
+
+
+class RateLimiter:
+    """Token bucket per role; roles without a limit (and no "*") are not limited."""
+
+    def __init__(self, limits, clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self.buckets = {}  # role -> [tokens, last refill]
+        self.limited = 0
+
+    def acquire(self, role):
+        """Take one token for role; returns 0 if admitted, else seconds until a token is available."""
+        limit = self.limits.get(role) or self.limits.get(ANY_ROLE)
+        if limit is None:
+            return 0
+        rate, burst = limit
+        now = self.clock()
+        bucket = self.buckets.setdefault(role, [burst, now])
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        self.limited += 1
+        return (1 - bucket[0]) / rate
+
+
+class TokenVerifier:
+    """Verifies bearer tokens with jwtutil, caching verified claims per token until exp."""
+
+    def __init__(self, cache_size=DEFAULT_TOKEN_CACHE, limiter=None, clock=time.time):
+        self.cache_size = cache_size
+        self.limiter = limiter
+        self.clock = clock
+        self.cache = OrderedDict()  # token -> (claims, exp or None)
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def claims(self, token):
+        """Verified claims of a token; raises AuthError(401) if it is invalid or expired."""
+        now = self.clock()
+        cached = self.cache.get(token)
+        if cached is not None:
+            claims, exp = cached
+            if exp is None or now < exp:
+                self.hits += 1
+                self.cache.move_to_end(token)
+                return claims
+            del self.cache[token]
+            raise AuthError(401, "Token has expired")
+        self.misses += 1
+        try:
+            claims = jwtutil.decode_jwt_token(token)
+        except typer.BadParameter as e:  # decode_jwt_token's way of rejecting a token
+            raise AuthError(401, e.message)
+        exp = claims.get("exp")
+        self.cache[token] = (claims, float(exp) if isinstance(exp, (int, float)) else None)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return claims
+
+    def check(self, authorization):
+        """Role of an Authorization header value; raises AuthError (401, or 429 over the role's rate)."""
+        scheme, _, token = (authorization or "").strip().partition(" ")
+        token = token.strip()
+        try:
+            if scheme.lower() != "bearer" or not token:
+                raise AuthError(401, "Missing bearer token")
+            claims = self.claims(token)
+        except AuthError:
+            self.rejected += 1
+            raise
+        role = str(claims.get(jwtutil.ROLE_CLAIM_KEY, ""))
+        if self.limiter is not None:
+            wait = self.limiter.acquire(role)
+            if wait:
+                raise AuthError(429, f"Rate limit of role '{role}' exceeded", math.ceil(wait))
+        return role
+
+    def stats(self):
+        return {
+            "token_cache_size": len(self.cache),
+            "token_cache_hits_total": self.hits,
+            "token_cache_misses_total": self.misses,
+        }
+
+    def summary(self):
+        limited = self.limiter.limited if self.limiter is not None else 0
+        return (f"[*] Token check: {self.rejected} rejected, {limited} rate limited, "
+                f"{self.hits} cache hits / {self.misses} misses")
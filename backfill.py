@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Backfill historical IoTaWatt readings straight into TimescaleDB with COPY.
+
+PostgREST's CSV endpoint is fine for live uploads but slow for years of
+history. This loader reads CSV files in either layout:
+
+  narrow   timestamp,device,sensor,Watts,Volts,... as upload_sample.py
+           writes them (any subset of the table's columns)
+  export   an IoTaWatt CSV export: a time column, then one column per
+           series named Sensor or Sensor.Unit (Net.Watts, Net.Volts, ...);
+           the device comes from --device
+
+Rows are split into time-range chunks (--chunk-hours) spilled to temporary
+files, then loaded by parallel workers, each with its own connection, using
+COPY ... FROM STDIN in text (CSV) or binary format.
+
+Each chunk is loaded in one transaction that first deletes, for each
+(device, sensor) series in the chunk, the rows between the series' first and
+last timestamp in the input, so a chunk replaces rather than duplicates data
+and leaves other sensors and the rest of the chunk's time range alone. The
+transaction also records the chunk's checksum in a backfill_chunks ledger table. Re-running a backfill skips
+chunks already loaded; a failed or interrupted chunk rolls back and is simply
+loaded again.
+
+With IOTAWATT_LAYOUT=normalized (see init_db.sh) new device and sensor names
+are added to the lookup tables once, before the parallel load, so their
+SMALLINT ids stay dense; each chunk is then copied into a temporary staging
+table and its rows are inserted with their ids in one statement.
+
+History older than the continuous aggregates' refresh windows (init_db.sh)
+is not picked up by their policies, so afterwards the loaded range is
+refreshed explicitly in every rollup, finest first.
+
+Usage:
+    uv run backfill.py history/*.csv --workers 4
+    uv run backfill.py export.csv --device hfs02a --format binary
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import List, Optional
+import typer
+
+
+POSTGRES_HOST = os.environ.get("POSTGRES_HOST", "localhost")
+POSTGRES_PORT = os.environ.get("POSTGRES_EXTERNAL_PORT", "5432")
+POSTGRES_USER = os.environ.get("POSTGRES_USER", "postgres")
+POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD", "")
+POSTGRES_DB = os.environ.get("POSTGRES_DB", "postgres")
+IOTAWATT_SCHEMA = os.environ.get("IOTAWATT_SCHEMA", "public")
+IOTAWATT_TABLE = os.environ.get("IOTAWATT_TABLE", "iotawatt")
+IOTAWATT_LAYOUT = os.environ.get("IOTAWATT_LAYOUT", "text")
+DATA_TABLE = f"{IOTAWATT_TABLE}_data" if IOTAWATT_LAYOUT == "normalized" else IOTAWATT_TABLE
+LEDGER_TABLE = "backfill_chunks"
+STAGE_TABLE = "backfill_stage"
+ROLLUPS = ("1m", "15m", "1h", "1d")  # Continuous aggregates <table>_<suffix>, each built from the previous
+
+COLUMNS = ("timestamp", "device", "sensor", "Watts", "Volts", "Amps", "VA", "Wh", "PF", "Hz", "VAR", "VARh")
+MEASURES = COLUMNS[3:]
+UNITS = {name.lower(): name for name in MEASURES}
+NULLS = {"", "null", "nan", "none", "\\n"}
+TIME_COLUMNS = {"time", "timestamp", "datetime", "date"}
+
+DEFAULT_CHUNK_HOURS = 24
+DEFAULT_WORKERS = 4
+PROGRESS_INTERVAL = 5.0
+RETRIES = 3
+MAX_OPEN_CHUNKS = 64  # Chunk files kept open while spilling; the least recently written are closed and reopened
+
+# COPY binary format: signature, flags, header extension length; each tuple is
+# a field count then (length, bytes) per field with -1 for NULL; -1 ends the data
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+FIELD_COUNT = struct.pack("!h", len(COLUMNS))
+FLOAT8 = struct.Struct("!id")
+TIMESTAMPTZ = struct.Struct("!iq")
+NULL_FIELD = struct.pack("!i", -1)
+
+app = typer.Typer(help="Backfill IoTaWatt history into TimescaleDB with COPY")
+
+
+class CopyFormat(str, Enum):
+    csv = "csv"
+    binary = "binary"
+
+
+def import_psycopg2():
+    try:
+        import psycopg2
+        import psycopg2.sql
+    except ImportError:
+        raise RuntimeError("The 'psycopg2' package is required (uv sync)")
+    return psycopg2
+
+
+def default_dsn():
+    return (f"host={POSTGRES_HOST} port={POSTGRES_PORT} dbname={POSTGRES_DB} "
+            f"user={POSTGRES_USER} password={POSTGRES_PASSWORD}")
+
+
+def parse_timestamp(text):
+    """Parse an ISO 8601 time (UTC if no offset) or Unix seconds."""
+    text = text.strip()
+    try:
+        return datetime.fromtimestamp(float(text), timezone.utc)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(text)
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+def parse_value(text):
+    return None if text.strip().lower() in NULLS else float(text)
+
+
+def open_input(path):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, newline="")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, newline="")
+
+
+def read_rows(path, device=None):
+    """
+    Yield (timestamp, device, sensor, measures) from a narrow or export CSV file,
+    where measures is a tuple of floats or None in MEASURES order.
+    """
+    with open_input(path) as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        lowered = [name.lower() for name in header]
+        if "sensor" in lowered:
+            yield from read_narrow(path, reader, header, device)
+            return
+        if not header or lowered[0] not in TIME_COLUMNS:
+            raise ValueError(f"{path}: expected a timestamp,device,sensor,... or time,<sensor>,... header")
+        if device is None:
+            raise ValueError(f"{path}: IoTaWatt exports have no device column, pass --device")
+        series = []  # (column, sensor, measure index)
+        for i, name in enumerate(header[1:], 1):
+            sensor, _, unit = name.rpartition(".")
+            if not sensor or unit.lower() not in UNITS:
+                sensor, unit = name, "Watts"
+            series.append((i, sensor, MEASURES.index(UNITS[unit.lower()])))
+        sensors = list(dict.fromkeys(sensor for _, sensor, _ in series))
+        for line, fields in enumerate(reader, 2):
+            if not fields:
+                continue
+            try:
+                ts = parse_timestamp(fields[0])
+                values = {sensor: [None] * len(MEASURES) for sensor in sensors}
+                for i, sensor, measure in series:
+                    values[sensor][measure] = parse_value(fields[i]) if i < len(fields) else None
+            except ValueError as e:
+                raise ValueError(f"{path}:{line}: {e}")
+            for sensor in sensors:
+                yield ts, device, sensor, tuple(values[sensor])
+
+
+def read_narrow(path, reader, header, device):
+    lookup = {name.lower(): name for name in COLUMNS}
+    unknown = [name for name in header if name.lower() not in lookup]
+    if unknown:
+        raise ValueError(f"{path}: unknown columns {', '.join(unknown)}")
+    index = {lookup[name.lower()]: i for i, name in enumerate(header)}
+    if "timestamp" not in index or ("device" not in index and device is None):
+        raise ValueError(f"{path}: needs timestamp and device columns (or --device)")
+    measures = [(MEASURES.index(name), i) for name, i in index.items() if name in MEASURES]
+    for line, fields in enumerate(reader, 2):
+        if not fields:
+            continue
+        try:
+            values = [None] * len(MEASURES)
+            for measure, i in measures:
+                values[measure] = parse_value(fields[i])
+            row_device = fields[index["device"]] if "device" in index else device
+            yield parse_timestamp(fields[index["timestamp"]]), row_device, fields[index["sensor"]], tuple(values)
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"{path}:{line}: {e}")
+
+
+def encode_binary(ts, device, sensor, values):
+    """One tuple in COPY binary format."""
+    micros = (ts - PG_EPOCH) // timedelta(microseconds=1)
+    parts = [FIELD_COUNT, TIMESTAMPTZ.pack(8, micros)]
+    for text in (device, sensor):
+        data = text.encode()
+        parts.append(struct.pack("!i", len(data)) + data)
+    for value in values:
+        parts.append(NULL_FIELD if value is None else FLOAT8.pack(8, value))
+    return b"".join(parts)
+
+
+class Chunk:
+    """Rows of one time range, spilled to a file in COPY format; suspend() closes it until the next row."""
+
+    def __init__(self, directory, start, end, copy_format):
+        self.start = start
+        self.end = end
+        self.rows = 0
+        self.devices = set()
+        self.series = {}  # (device, sensor) -> [first, last timestamp]
+        self.path = os.path.join(directory, f"chunk-{int(start.timestamp())}.{copy_format.value}")
+        self.binary = copy_format == CopyFormat.binary
+        self._file = open(self.path, "wb")
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line)
+        self._hash = hashlib.sha256(f"{start.isoformat()}/{end.isoformat()}/{copy_format.value}\n".encode())
+        if self.binary:
+            self._write(PGCOPY_HEADER)
+
+    def _write(self, data):
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(data)
+        self._hash.update(data)
+
+    def suspend(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, ts, device, sensor, values):
+        self.rows += 1
+        self.devices.add(device)
+        span = self.series.get((device, sensor))
+        if span is None:
+            self.series[(device, sensor)] = [ts, ts]
+        elif ts < span[0]:
+            span[0] = ts
+        elif ts > span[1]:
+            span[1] = ts
+        if self.binary:
+            self._write(encode_binary(ts, device, sensor, values))
+        else:
+            # Floats go out as repr() so both formats load identical values; an unquoted empty field is NULL
+            self._csv.writerow([ts.isoformat(), device, sensor, *(None if v is None else repr(v) for v in values)])
+            self._write(self._line.getvalue().encode())
+            self._line.seek(0)
+            self._line.truncate()
+
+    def delete_params(self):
+        """Parameters of Loader.delete_sql: per-series names and first/last timestamps, then their overall span."""
+        keys = sorted(self.series)
+        firsts, lasts = [self.series[key][0] for key in keys], [self.series[key][1] for key in keys]
+        return [device for device, _ in keys], [sensor for _, sensor in keys], firsts, lasts, min(firsts), max(lasts)
+
+    def close(self):
+        if self.binary:
+            self._write(PGCOPY_TRAILER)
+        self.suspend()
+        self.checksum = self._hash.hexdigest()
+
+
+def spill(paths, device, directory, chunk_hours, copy_format):
+    """Read all inputs and split their rows into time-range chunks; returns the chunks by start time."""
+    span = chunk_hours * 3600
+    chunks = {}
+    open_chunks = OrderedDict()  # Chunks with an open file, least recently written first
+    for path in paths:
+        count = 0
+        for ts, row_device, sensor, values in read_rows(path, device):
+            key = int(ts.timestamp() // span)
+            chunk = chunks.get(key)
+            if chunk is None:
+                start = datetime.fromtimestamp(key * span, timezone.utc)
+                chunk = chunks[key] = Chunk(directory, start, start + timedelta(seconds=span), copy_format)
+            if key in open_chunks:
+                open_chunks.move_to_end(key)
+            else:
+                open_chunks[key] = chunk
+                if len(open_chunks) > MAX_OPEN_CHUNKS:
+                    open_chunks.popitem(last=False)[1].suspend()
+            chunk.add(ts, row_device, sensor, values)
+            count += 1
+        print(f"[*] Read {count:,} rows from {path}")
+    for chunk in chunks.values():
+        chunk.close()
+    return [chunks[key] for key in sorted(chunks)]
+
+
+class Loader:
+    """Loads chunks with one connection per worker thread."""
+
+    def __init__(self, dsn, copy_format, force=False):
+        self.psycopg2 = import_psycopg2()
+        sql = self.psycopg2.sql
+        self.dsn = dsn
+        self.force = force
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        table = sql.Identifier(IOTAWATT_SCHEMA, DATA_TABLE)
+        self.ledger = sql.Identifier(IOTAWATT_SCHEMA, LEDGER_TABLE)
+        columns = sql.SQL(", ").join(map(sql.Identifier, COLUMNS))
+        options = sql.SQL("FORMAT binary" if copy_format == CopyFormat.binary else "FORMAT csv")
+        self.before_copy = []
+        self.after_copy = []
+        self.add_names_sql = []
+        if IOTAWATT_LAYOUT != "normalized":
+            self.copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH ({})").format(table, columns, options)
+            self.delete_sql = sql.SQL(
+                "DELETE FROM {} r USING unnest(%s::text[], %s::text[], %s::timestamptz[], %s::timestamptz[]) "
+                "k (device, sensor, first_ts, last_ts) WHERE r.timestamp >= %s AND r.timestamp <= %s "
+                "AND r.device = k.device AND r.sensor = k.sensor AND r.timestamp BETWEEN k.first_ts AND k.last_ts"
+            ).format(table)
+            return
+        stage = sql.Identifier(STAGE_TABLE)
+        devices = sql.Identifier(IOTAWATT_SCHEMA, f"{IOTAWATT_TABLE}_devices")
+        sensors = sql.Identifier(IOTAWATT_SCHEMA, f"{IOTAWATT_TABLE}_sensors")
+        measures = sql.SQL(", ").join(sql.SQL("s.") + sql.Identifier(name) for name in MEASURES)
+        self.before_copy.append(sql.SQL(
+            "CREATE TEMP TABLE IF NOT EXISTS {} (timestamp TIMESTAMPTZ, device TEXT, sensor TEXT, {}) "
+            "ON COMMIT DELETE ROWS"
+        ).format(stage, sql.SQL(", ").join(sql.SQL("{} DOUBLE PRECISION").format(sql.Identifier(name))
+                                             for name in MEASURES)))
+        self.copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH ({})").format(stage, columns, options)
+        self.delete_sql = sql.SQL(
+            "DELETE FROM {} r USING unnest(%s::text[], %s::text[], %s::timestamptz[], %s::timestamptz[]) "
+            "k (device, sensor, first_ts, last_ts) JOIN {} d ON d.name = k.device JOIN {} n ON n.name = k.sensor "
+            "WHERE r.timestamp >= %s AND r.timestamp <= %s "
+            "AND r.device_id = d.id AND r.sensor_id = n.id AND r.timestamp BETWEEN k.first_ts AND k.last_ts"
+        ).format(table, devices, sensors)
+        # Only names not there yet: ON CONFLICT alone would use up an identity value per row tried.
+        # ON CONFLICT stays to cover a name added concurrently, e.g. by a live upload.
+        for lookup, column in ((devices, "device"), (sensors, "sensor")):
+            self.add_names_sql.append(sql.SQL(
+                "INSERT INTO {} (name) SELECT n.name FROM unnest(%s::text[]) n (name) "
+                "WHERE NOT EXISTS (SELECT 1 FROM {} l WHERE l.name = n.name) ON CONFLICT (name) DO NOTHING"
+            ).format(lookup, lookup))
+            self.after_copy.append(sql.SQL(
+                "INSERT INTO {} (name) SELECT DISTINCT s.{} FROM {} s "
+                "WHERE NOT EXISTS (SELECT 1 FROM {} l WHERE l.name = s.{}) ON CONFLICT (name) DO NOTHING"
+            ).format(lookup, sql.Identifier(column), stage, lookup, sql.Identifier(column)))
+        self.after_copy.append(sql.SQL(
+            "INSERT INTO {} SELECT s.timestamp, d.id, n.id, {} FROM {} s "
+            "JOIN {} d ON d.name = s.device JOIN {} n ON n.name = s.sensor"
+        ).format(table, measures, stage, devices, sensors))
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = self.psycopg2.connect(self.dsn)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def create_ledger(self):
+        conn = self.connection()
+        with conn, conn.cursor() as cur:
+            cur.execute(self.psycopg2.sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {} (
+                    checksum TEXT PRIMARY KEY,
+                    chunk_start TIMESTAMPTZ NOT NULL,
+                    chunk_end TIMESTAMPTZ NOT NULL,
+                    devices TEXT[] NOT NULL,
+                    rows BIGINT NOT NULL,
+                    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """).format(self.ledger))
+
+    def add_names(self, chunks):
+        """Add the chunks' new device and sensor names to the lookup tables (normalized layout)."""
+        if not self.add_names_sql:
+            return
+        names = (sorted({device for chunk in chunks for device, _ in chunk.series}),
+                 sorted({sensor for chunk in chunks for _, sensor in chunk.series}))
+        conn = self.connection()
+        with conn, conn.cursor() as cur:
+            for statement, values in zip(self.add_names_sql, names):
+                cur.execute(statement, (values,))
+
+    def load(self, chunk):
+        """Load one chunk in a single transaction; returns rows loaded, 0 if it was already loaded."""
+        for attempt in range(1, RETRIES + 1):
+            conn = self.connection()
+            try:
+                with conn, conn.cursor() as cur:
+                    if not self.force:
+                        cur.execute(self.psycopg2.sql.SQL("SELECT 1 FROM {} WHERE checksum = %s").format(self.ledger),
+                                    (chunk.checksum,))
+                        if cur.fetchone():
+                            return 0
+                    devices = sorted(chunk.devices)
+                    cur.execute(self.delete_sql, chunk.delete_params())
+                    for statement in self.before_copy:
+                        cur.execute(statement)
+                    with open(chunk.path, "rb") as f:
+                        cur.copy_expert(self.copy_sql, f, size=1 << 20)
+                    for statement in self.after_copy:
+                        cur.execute(statement)
+                    cur.execute(
+                        self.psycopg2.sql.SQL(
+                            "INSERT INTO {} (checksum, chunk_start, chunk_end, devices, rows) VALUES (%s, %s, %s, %s, %s) "
+                            "ON CONFLICT (checksum) DO UPDATE SET loaded_at = now()"
+                        ).format(self.ledger),
+                        (chunk.checksum, chunk.start, chunk.end, devices, chunk.rows),
+                    )
+                return chunk.rows
+            except self.psycopg2.OperationalError as e:
+                conn.close()  # Lost connection; a new one is opened for the retry
+                if attempt == RETRIES:
+                    raise
+                print(f"[!] Chunk {chunk.start.isoformat()} failed ({str(e).strip()}), retrying")
+                time.sleep(attempt)
+
+    def refresh_rollups(self, start, end):
+        """Refresh the rollups that exist over whole days around [start, end); returns their names."""
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = (end - timedelta(microseconds=1)).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        conn = self.psycopg2.connect(self.dsn)
+        conn.autocommit = True  # refresh_continuous_aggregate cannot run inside a transaction
+        refreshed = []
+        try:
+            with conn.cursor() as cur:
+                for suffix in ROLLUPS:
+                    name = f"{DATA_TABLE}_{suffix}"
+                    qualified = self.psycopg2.sql.Identifier(IOTAWATT_SCHEMA, name).as_string(conn)
+                    cur.execute("SELECT to_regclass(%s)", (qualified,))
+                    if cur.fetchone()[0] is None:
+                        continue
+                    cur.execute("CALL refresh_continuous_aggregate(%s::regclass, %s, %s)", (qualified, start, end))
+                    refreshed.append(name)
+        finally:
+            conn.close()
+        return refreshed
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+
+@app.command()
+def backfill(
+    files: List[str] = typer.Argument(..., help="CSV files (.gz allowed, '-' for stdin)"),
+    device: Optional[str] = typer.Option(None, "--device", "-d", help="Device name for IoTaWatt exports"),
+    workers: int = typer.Option(DEFAULT_WORKERS, "--workers", "-w", help="Parallel COPY connections"),
+    chunk_hours: int = typer.Option(DEFAULT_CHUNK_HOURS, "--chunk-hours", help="Time range per chunk"),
+    copy_format: CopyFormat = typer.Option(CopyFormat.csv, "--format", "-f", help="COPY format"),
+    dsn: Optional[str] = typer.Option(None, "--dsn", help="libpq connection string (default from POSTGRES_* in .env)"),
+    force: bool = typer.Option(False, "--force", help="Reload chunks the ledger says are already loaded"),
+    spill_dir: Optional[str] = typer.Option(None, "--spill-dir", help="Directory for chunk files (default: system temp)"),
+    refresh: bool = typer.Option(True, "--refresh/--no-refresh", help="Refresh the rollups over the loaded range"),
+):
+    """
+    Load CSV files into the IoTaWatt hypertable with COPY, in parallel time-range chunks.
+    Re-running with the same files is safe: loaded chunks are skipped or replaced.
+    """
+    if chunk_hours < 1:
+        raise typer.BadParameter("--chunk-hours must be >= 1")
+    try:
+        loader = Loader(dsn or default_dsn(), copy_format, force)
+    except RuntimeError as e:
+        print(f"[-] {e}")
+        raise typer.Exit(1)
+
+    with tempfile.TemporaryDirectory(prefix="backfill-", dir=spill_dir) as directory:
+        started = time.monotonic()
+        try:
+            chunks = spill(files, device, directory, chunk_hours, copy_format)
+        except (OSError, ValueError) as e:
+            print(f"[-] {e}")
+            raise typer.Exit(1)
+        total_rows = sum(chunk.rows for chunk in chunks)
+        print(f"[*] {total_rows:,} rows in {len(chunks)} chunks of {chunk_hours} h, "
+              f"read in {time.monotonic() - started:.1f} s; loading with {workers} workers")
+
+        started = time.monotonic()
+        loaded = skipped = done = 0
+        last_progress = started
+        try:
+            loader.create_ledger()
+            loader.add_names(chunks)
+            with ThreadPoolExecutor(workers, thread_name_prefix="copy") as pool:
+                futures = {pool.submit(loader.load, chunk): chunk for chunk in chunks}
+                for future in as_completed(futures):
+                    rows = future.result()
+                    done += 1
+                    if rows:
+                        loaded += rows
+                    else:
+                        skipped += 1
+                    now = time.monotonic()
+                    if now - last_progress >= PROGRESS_INTERVAL or done == len(chunks):
+                        last_progress = now
+                        print(f"[*] {done}/{len(chunks)} chunks, {loaded:,} rows, "
+                              f"{loaded / max(now - started, 1e-9):,.0f} rows/s")
+            elapsed = time.monotonic() - started
+            if refresh and loaded:
+                refresh_started = time.monotonic()
+                refreshed = loader.refresh_rollups(min(c.start for c in chunks), max(c.end for c in chunks))
+                if refreshed:
+                    print(f"[*] Refreshed {', '.join(refreshed)} in {time.monotonic() - refresh_started:.1f} s")
+        except loader.psycopg2.Error as e:
+            print(f"[-] Backfill failed: {str(e).strip()}")
+            print("[*] Chunks loaded so far are committed; re-run to load the rest")
+            raise typer.Exit(1)
+        finally:
+            loader.close()
+
+    print(f"[+] Loaded {loaded:,} rows in {elapsed:.1f} s ({loaded / max(elapsed, 1e-9):,.0f} rows/s), "
+          f"{skipped} chunks already loaded")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark show_db.fetch_range (sharded, concurrent) against one request for the whole range.
+
+By default the API is a stand-in PostgREST in a separate process that
+serves synthetic rows and sleeps per request and per row to stand in for
+database time, so the result shows what concurrency buys the client. With
+--live it runs against the PostgREST configured in .env, where the
+speedup also depends on how many cores the database can use.
+
+    uv run python -m benchmarks.fetch --days 2 --workers 1,2,4,8
+    uv run python -m benchmarks.fetch --live --start 2025-01-01 --end 2025-02-01
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import typer
+
+STAND_IN_PORT = 9388
+INTERVAL = 60  # Seconds between readings in the stand-in data
+
+
+def stand_in(port, devices, sensors, latency, row_seconds):
+    """Serve GET /<table> with timestamp gte/lt and device eq filters over synthetic readings."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            query = parse_qsl(urlsplit(self.path).query)
+            lower, upper, limit = None, None, None
+            names = [f"dev{i:03d}" for i in range(devices)]
+            for name, value in query:
+                op, _, operand = value.partition(".")
+                if name == "timestamp" and op == "gte":
+                    lower = datetime.fromisoformat(operand)
+                elif name == "timestamp" and op == "lt":
+                    upper = datetime.fromisoformat(operand)
+                elif name == "device":
+                    names = [n for n in names if (n == operand if op == "eq" else n > operand)]
+                elif name == "limit":
+                    limit = int(value)
+            if limit is not None:  # Device discovery: select=device&order=device.asc&limit=1
+                rows = [{"device": n} for n in names[:limit]]
+                names = []
+            else:
+                rows = []
+            first = -(-int(lower.timestamp()) // INTERVAL) * INTERVAL
+            for ts in range(first, int(upper.timestamp()), INTERVAL):
+                stamp = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                for device in sorted(names):
+                    for s in range(sensors):
+                        rows.append({"timestamp": stamp, "device": device, "sensor": f"Circuit{s}", "Watts": 1.0})
+            time.sleep(latency + row_seconds * len(rows))
+            body = json.dumps(rows).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def main(
+    days: float = typer.Option(2.0, "--days", help="Range to fetch from the stand-in"),
+    devices: int = typer.Option(10, "--devices", help="Stand-in devices"),
+    sensors: int = typer.Option(8, "--sensors", help="Stand-in sensors per device"),
+    latency_ms: float = typer.Option(20.0, "--latency-ms", help="Stand-in time per request"),
+    row_us: float = typer.Option(5.0, "--row-us", help="Stand-in database time per row"),
+    workers: str = typer.Option("1,2,4,8", "--workers", help="Worker counts to try"),
+    shard_hours: float = typer.Option(6.0, "--shard-hours", help="Hours per time shard"),
+    live: bool = typer.Option(False, "--live", help="Use the PostgREST from .env instead of the stand-in"),
+    start: Optional[str] = typer.Option(None, "--start", help="Range start with --live"),
+    end: Optional[str] = typer.Option(None, "--end", help="Range end with --live"),
+):
+    """Time the single-request fetch and fetch_range at several worker counts."""
+    if not live:
+        os.environ.setdefault("PGRST_JWT_SECRET", "benchmark-secret-not-used-by-the-stand-in")
+    import show_db
+
+    show_db.query_cache = None  # Measure the API, not the local cache
+    if live:
+        if not start or not end:
+            raise typer.BadParameter("--live needs --start and --end")
+        range_start, range_end = show_db.parse_time(start), show_db.parse_time(end)
+    else:
+        process = multiprocessing.Process(
+            target=stand_in, args=(STAND_IN_PORT, devices, sensors, latency_ms / 1000, row_us / 1e6), daemon=True
+        )
+        process.start()
+        time.sleep(0.5)
+        show_db.API_CONFIG["base_url"] = f"http://127.0.0.1:{STAND_IN_PORT}"
+        range_end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        range_start = range_end - timedelta(days=days)
+
+    def single():
+        params = [("timestamp", f"gte.{range_start.isoformat()}"), ("timestamp", f"lt.{range_end.isoformat()}"),
+                  ("order", "timestamp.asc,device.asc,sensor.asc")]
+        return show_db.make_api_request(show_db.IOTAWATT_TABLE, params)
+
+    def timed(fn):
+        started = time.perf_counter()
+        rows = fn()
+        if rows is None:
+            raise typer.Exit(1)
+        return time.perf_counter() - started, len(rows)
+
+    print(f"Fetching {range_start.isoformat()} to {range_end.isoformat()}\n")
+    print(f"{'method':<34} {'rows':>10} {'seconds':>8} {'rows/s':>10} {'speedup':>8}")
+    baseline, count = timed(single)
+    print(f"{'single request':<34} {count:>10,} {baseline:>8.2f} {count / baseline:>10,.0f} {1:>8.2f}")
+    for by in ("time", "device"):
+        for n in (int(w) for w in workers.split(",")):
+            elapsed, count = timed(lambda: show_db.fetch_range(range_start, range_end, by=by,
+                                                                shard_hours=shard_hours, workers=n))
+            label = f"by {by}, {n} workers"
+            print(f"{label:<34} {count:>10,} {elapsed:>8.2f} {count / elapsed:>10,.0f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
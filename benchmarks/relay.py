@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark the proxy relay implementations over loopback TCP.
+
+Pushes a fixed volume through each relay function in proxy.py and reports
+throughput and relay-thread CPU seconds per GB relayed.
+
+    uv run python -m benchmarks.relay --megabytes 512
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+import typer
+
+import capture
+import proxy
+
+
+def tcp_pair(listener):
+    """Return a connected (client, server) TCP socket pair via the listener."""
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    return client, server
+
+
+def run_relay(name, relay_fn, total_bytes, log_payload=None):
+    """
+    Relay total_bytes through relay_fn; return (wall seconds, relay CPU seconds).
+
+    log_payload is None, "inline" (write and flush per chunk on the relay
+    thread) or "writer" (hand chunks to a capture.CaptureWriter).
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(2)
+    producer, relay_in = tcp_pair(listener)
+    relay_out, consumer = tcp_pair(listener)
+    listener.close()
+
+    cpu = {}
+    log_dir = tempfile.TemporaryDirectory()
+    log_file = writer = None
+    if log_payload == "inline":
+        log_file = open(os.path.join(log_dir.name, "inline.txt"), "ab")
+
+        def log(data):
+            log_file.write(capture.format_log_record("→", data, True))
+            log_file.flush()
+    elif log_payload == "writer":
+        writer = capture.CaptureWriter(directory=log_dir.name, log_timestamps=True).start()
+
+        def log(data):
+            writer.record("bench", "→", data)
+    else:
+        log = None
+
+    def relay():
+        start = time.thread_time()
+        try:
+            relay_fn(relay_in, relay_out, log)
+        finally:
+            cpu["relay"] = time.thread_time() - start
+            relay_out.shutdown(socket.SHUT_WR)
+
+    def produce():
+        block = os.urandom(256 * 1024)
+        sent = 0
+        while sent < total_bytes:
+            producer.sendall(block)
+            sent += len(block)
+        producer.shutdown(socket.SHUT_WR)
+
+    threads = [threading.Thread(target=relay), threading.Thread(target=produce)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    received = 0
+    buf = bytearray(1024 * 1024)
+    while n := consumer.recv_into(buf):
+        received += n
+    wall = time.perf_counter() - start
+    for t in threads:
+        t.join()
+
+    for s in (producer, relay_in, relay_out, consumer):
+        s.close()
+    if log_file is not None:
+        log_file.close()
+    if writer is not None:
+        writer.stop()
+    log_dir.cleanup()
+    if received < total_bytes:
+        raise RuntimeError(f"{name}: received {received} of {total_bytes} bytes")
+    return wall, cpu["relay"]
+
+
+def main(
+    megabytes: int = typer.Option(256, "--megabytes", "-m", help="Volume to relay per run"),
+    repeat: int = typer.Option(3, "--repeat", "-n", help="Runs per relay, best is reported"),
+):
+    """Compare the copy relay against the recv_into and splice fast paths."""
+    total = megabytes * 1024 * 1024
+    cases = [
+        ("copy + inline payload log", proxy.relay_copy, "inline"),
+        ("copy + capture writer", proxy.relay_copy, "writer"),
+        ("copy", proxy.relay_copy, None),
+        ("buffer (recv_into)", proxy.relay_buffer, None),
+    ]
+    if hasattr(os, "splice"):
+        cases.append(("splice", proxy.relay_splice, None))
+
+    print(f"Relaying {megabytes} MB over loopback, best of {repeat}\n")
+    print(f"{'relay':<30} {'MB/s':>10} {'CPU s/GB':>10}")
+    for name, fn, log_payload in cases:
+        wall, cpu = min(run_relay(name, fn, total, log_payload) for _ in range(repeat))
+        gb = total / 1024**3
+        print(f"{name:<30} {megabytes / wall:>10.0f} {cpu / gb:>10.2f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark start-up time of the `iotawatt` entry point (cli.py).
+
+Each command is run in a fresh interpreter with `python -X importtime`. The
+import time of everything but `site` (which depends on the environment's
+.pth files, not on this repo) is compared with the budget, and wall time
+is shown next to that of a bare `python -c pass`. Exits 1 when a command's
+median import time is over budget.
+
+    uv run python -m benchmarks.startup
+    uv run python -m benchmarks.startup --command "show --help" --budget-ms 400
+"""
+
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import typer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_COMMANDS = ["jwt generate writer", "jwt roles", "--help"]  # --help of a command renders with rich
+DEFAULT_BUDGET_MS = 100.0
+
+
+def run(args, env):
+    """(wall seconds, import seconds outside site, slowest top-level imports) of one run."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(f"{shlex.join(args)} exited with {result.returncode}:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  ") and name.strip() != "site":  # Top level: cumulative covers its imports
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return wall, sum(t for t, _ in imports), sorted(imports, reverse=True)[:3]
+
+
+def main(
+    command: Optional[List[str]] = typer.Option(None, "--command", "-c", help="iotawatt arguments to time (repeatable)"),
+    runs: int = typer.Option(10, "--runs", "-n", help="Runs per command; medians are reported"),
+    budget_ms: float = typer.Option(DEFAULT_BUDGET_MS, "--budget-ms", help="Max median import time per command"),
+):
+    """Time cold starts of iotawatt commands against an import-time budget."""
+    env = dict(os.environ)
+    env.setdefault("PGRST_JWT_SECRET", "benchmark-secret-not-used-for-anything")
+    commands = command or DEFAULT_COMMANDS
+
+    bare = statistics.median(run(["-c", "pass"], env)[0] for _ in range(runs))
+    print(f"{'command':<28} {'wall ms':>8} {'imports ms':>11}  slowest imports")
+    print(f"{'(python -c pass)':<28} {bare * 1000:>8.1f}")
+    over = []
+    for text in commands:
+        samples = [run(["cli.py", *shlex.split(text)], env) for _ in range(runs)]
+        wall = statistics.median(s[0] for s in samples)
+        imports = statistics.median(s[1] for s in samples)
+        slowest = ", ".join(f"{name} {t * 1000:.0f}" for t, name in samples[-1][2])
+        flag = "  OVER BUDGET" if imports * 1000 > budget_ms else ""
+        print(f"{text:<28} {wall * 1000:>8.1f} {imports * 1000:>11.1f}  {slowest}{flag}")
+        if flag:
+            over.append(text)
+    if over:
+        print(f"\n[-] Over the {budget_ms:.0f} ms import budget: {', '.join(over)}")
+        raise typer.Exit(1)
+    print(f"\n[+] All commands within the {budget_ms:.0f} ms import budget")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark suite: ingest, generation and query paths.
+
+Everything runs on this machine without network access. Stand-ins replace
+PostgREST: upload_sample's insert stand-in (counts rows) and the synthetic
+read stand-in from benchmarks.fetch, each in its own process. proxy.py runs
+as a subprocess between the uploader and the insert stand-in.
+
+Scenarios:
+    generate_csv        upload_sample.generate_sample_data, rows/s
+    synthesize          upload_sample.synthesize_chunks (skipped without NumPy)
+    ingest_direct       Uploader -> stand-in
+    ingest_proxy_*      Uploader -> proxy.py (threads / http engine) -> stand-in
+    fetch_single        show_db.make_api_request for a whole range
+    fetch_sharded       show_db.fetch_range, 4 time-shard workers
+    fetch_cached        show_db.fetch_range answered by a warm query cache
+
+Each records throughput, request latency percentiles, client CPU seconds and,
+for scenarios with a server process, its CPU seconds and peak RSS. Results
+are written as JSON; with --baseline they are compared metric by metric and
+the run fails when a metric is worse than the baseline by more than
+--tolerance. Baselines are machine specific: record one per machine.
+
+    uv run python -m benchmarks.suite
+    uv run python -m benchmarks.suite --scale 4 --only ingest --output ingest.json
+    uv run python -m benchmarks.suite --save-baseline
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import typer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_OUTPUT = "bench-results.json"
+DEFAULT_TOLERANCE = 0.25
+TABLE = "iotawatt"
+READ_LATENCY = 0.005  # Read stand-in seconds per request and per row, standing in for database time
+READ_ROW_SECONDS = 2e-6
+STARTUP_TIMEOUT = 10.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout:.0f} s")
+
+
+def process_usage(pid):
+    """(CPU seconds, peak RSS in MB) of a running process, from /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            peak = next((int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM:")), 0.0)
+        return cpu, peak
+    except OSError:
+        return None, None  # Not Linux, or already gone
+
+
+def client_cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(sorted_values, p):
+    from upload_sample import percentile as nearest_rank
+    return nearest_rank(sorted_values, p)
+
+
+def summarize(rows, seconds, cpu, latencies=None, server=None):
+    """One scenario's metrics; server is (cpu seconds, peak RSS MB) of its server process."""
+    result = {"rows": rows, "seconds": round(seconds, 4), "rows_per_s": round(rows / max(seconds, 1e-9), 1),
+              "client_cpu_s": round(cpu, 3)}
+    if latencies:
+        latencies = sorted(latencies)
+        for p in (50, 95, 99):
+            result[f"latency_ms_p{p}"] = round(percentile(latencies, p) * 1000, 3)
+    if server and server[0] is not None:
+        result["server_cpu_s"] = round(server[0], 3)
+        result["server_rss_mb"] = round(server[1], 1)
+    return result
+
+
+def insert_stand_in(port):
+    """upload_sample's insert stand-in, run in its own process."""
+    import upload_sample
+    server = upload_sample.StandInServer(("127.0.0.1", port), upload_sample.StandInHandler)
+    server.latency = 0
+    server.lock = threading.Lock()
+    server.requests = server.rows = 0
+    server.serve_forever()
+
+
+def start_process(target, *args):
+    process = multiprocessing.Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+class Suite:
+    """Runs the scenarios at a scale; each returns its metrics dict."""
+
+    def __init__(self, scale, threads):
+        self.scale = scale
+        self.threads = threads
+        self.insert_port = free_port()
+        self.read_port = free_port()
+        self.processes = []
+
+    def __enter__(self):
+        from benchmarks.fetch import stand_in
+        self.insert_server = start_process(insert_stand_in, self.insert_port)
+        self.read_server = start_process(stand_in, self.read_port, 10, 8, READ_LATENCY, READ_ROW_SECONDS)
+        self.processes += [self.insert_server, self.read_server]
+        wait_for_port(self.insert_port)
+        wait_for_port(self.read_port)
+        return self
+
+    def __exit__(self, *exc):
+        for process in self.processes:
+            process.terminate()
+            process.join(5)
+
+    def generate_csv(self):
+        from upload_sample import generate_sample_data, sensor_names
+        sensors = sensor_names(8)
+        calls = int(5000 * self.scale)
+        cpu, started = client_cpu(), time.perf_counter()
+        for i in range(calls):
+            generate_sample_data(len(sensors), f"dev{i % 100:03d}", sensors)
+        return summarize(calls * len(sensors), time.perf_counter() - started, client_cpu() - cpu)
+
+    def synthesize(self):
+        from upload_sample import import_numpy, sensor_names, synthesize_chunks
+        try:
+            import_numpy()
+        except RuntimeError:
+            return None
+        devices = [f"dev{i:03d}" for i in range(int(50 * self.scale))]
+        end = datetime(2025, 1, 2, tzinfo=timezone.utc)
+        cpu, started = client_cpu(), time.perf_counter()
+        rows = sum(n for n, _ in synthesize_chunks(devices, sensor_names(8), end - timedelta(days=1), end, 60,
+                                                   50_000, 1))
+        return summarize(rows, time.perf_counter() - started, client_cpu() - cpu)
+
+    def upload(self, port, server_pid=None, rows_per_request=100, requests=None):
+        """POST the same CSV body `requests` times from self.threads threads; time each upload."""
+        from upload_sample import generate_sample_data, sensor_names
+        from uploader import Uploader
+        requests = requests or int(2000 * self.scale)
+        body = generate_sample_data(rows_per_request, "bench", sensor_names(rows_per_request)).encode()
+        uploader = Uploader(f"http://127.0.0.1:{port}/{TABLE}", token="benchmark", retries=0, log_path=None,
+                            pool_size=self.threads)
+        per_thread = [requests // self.threads + (i < requests % self.threads) for i in range(self.threads)]
+
+        def worker(count):
+            latencies = []
+            for _ in range(count):
+                began = time.perf_counter()
+                uploader.post(body)
+                latencies.append(time.perf_counter() - began)
+            return latencies
+
+        uploader.post(body)  # Open a connection before timing
+        before = process_usage(server_pid) if server_pid else None
+        cpu, started = client_cpu(), time.perf_counter()
+        with ThreadPoolExecutor(self.threads) as pool:
+            latencies = [x for chunk in pool.map(worker, per_thread) for x in chunk]
+        elapsed = time.perf_counter() - started
+        cpu = client_cpu() - cpu
+        server = None
+        if server_pid:
+            after = process_usage(server_pid)
+            if before[0] is not None and after[0] is not None:
+                server = (after[0] - before[0], after[1])
+        uploader.close()
+        return summarize(requests * rows_per_request, elapsed, cpu, latencies, server)
+
+    def ingest_direct(self):
+        return self.upload(self.insert_port, self.insert_server.pid)
+
+    def ingest_proxy(self, engine):
+        port = free_port()
+        proxy = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "proxy.py"), str(port), "127.0.0.1", str(self.insert_port),
+             "--engine", engine, "--log", "off", "--table", TABLE, "--stats-interval", "0"],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(port)
+            return self.upload(port, proxy.pid)
+        finally:
+            proxy.terminate()
+            proxy.wait(10)
+
+    def ingest_proxy_threads(self):
+        return self.ingest_proxy("threads")
+
+    def ingest_proxy_http(self):
+        return self.ingest_proxy("http")
+
+    def fetch(self, fn, repeat=3):
+        import show_db
+        show_db.API_CONFIG["base_url"] = f"http://127.0.0.1:{self.read_port}"
+        end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        start = end - timedelta(hours=12 * self.scale)
+        before = process_usage(self.read_server.pid)
+        latencies, rows = [], 0
+        cpu = client_cpu()
+        for _ in range(repeat):
+            began = time.perf_counter()
+            result = fn(show_db, start, end)
+            latencies.append(time.perf_counter() - began)
+            if result is None:
+                raise RuntimeError("Fetch from the read stand-in failed")
+            rows += len(result)
+        after = process_usage(self.read_server.pid)
+        server = (after[0] - before[0], after[1]) if before[0] is not None else None
+        return summarize(rows, sum(latencies), client_cpu() - cpu, latencies, server)
+
+    def fetch_single(self):
+        def single(show_db, start, end):
+            show_db.query_cache = None
+            params = [("timestamp", f"gte.{start.isoformat()}"), ("timestamp", f"lt.{end.isoformat()}"),
+                      ("order", "timestamp.asc,device.asc,sensor.asc")]
+            return show_db.make_api_request(show_db.IOTAWATT_TABLE, params)
+        return self.fetch(single)
+
+    def fetch_sharded(self):
+        def sharded(show_db, start, end):
+            show_db.query_cache = None
+            return show_db.fetch_range(start, end, shard_hours=3, workers=4)
+        return self.fetch(sharded)
+
+    def fetch_cached(self):
+        from querycache import QueryCache
+        directory = tempfile.mkdtemp(prefix="bench-cache-")
+        cache = QueryCache(os.path.join(directory, "cache.sqlite"))
+
+        def cached(show_db, start, end):
+            show_db.query_cache = cache
+            return show_db.fetch_range(start, end, shard_hours=3, workers=4)
+        try:
+            import show_db
+            show_db.API_CONFIG["base_url"] = f"http://127.0.0.1:{self.read_port}"
+            end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+            cached(show_db, end - timedelta(hours=12 * self.scale), end)  # Warm the cache
+            return self.fetch(cached)
+        finally:
+            cache.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+SCENARIOS = ("generate_csv", "synthesize", "ingest_direct", "ingest_proxy_threads", "ingest_proxy_http",
+             "fetch_single", "fetch_sharded", "fetch_cached")
+
+
+def direction(metric):
+    """'higher' or 'lower' is better, or None for metrics that are only informational."""
+    if metric.endswith("_per_s"):
+        return "higher"
+    if metric.startswith("latency_") or metric in ("seconds", "client_cpu_s", "server_cpu_s", "server_rss_mb"):
+        return "lower"
+    return None
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric against the baseline; return the regressions as strings."""
+    regressions = []
+    print(f"\n{'scenario':<22} {'metric':<16} {'baseline':>12} {'now':>12} {'change':>8}")
+    for scenario, metrics in results.items():
+        base = baseline.get(scenario)
+        if not metrics or not base:
+            continue
+        for metric, value in metrics.items():
+            better = direction(metric)
+            before = base.get(metric)
+            if better is None or not isinstance(before, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            worse = change < -tolerance if better == "higher" else change > tolerance
+            flag = "  REGRESSION" if worse else ""
+            print(f"{scenario:<22} {metric:<16} {before:>12,.3f} {value:>12,.3f} {change:>+7.0%}{flag}")
+            if worse:
+                regressions.append(f"{scenario}.{metric}: {before:,.3f} -> {value:,.3f} ({change:+.0%})")
+    return regressions
+
+
+def main(
+    scale: float = typer.Option(1.0, "--scale", help="Multiply every scenario's volume"),
+    threads: int = typer.Option(8, "--threads", help="Concurrent uploads in the ingest scenarios"),
+    only: Optional[str] = typer.Option(None, "--only", help="Comma-separated scenario name prefixes to run"),
+    output: str = typer.Option(DEFAULT_OUTPUT, "--output", "-o", help="Results JSON file"),
+    baseline: str = typer.Option(DEFAULT_BASELINE, "--baseline", help="Baseline JSON to compare against"),
+    tolerance: float = typer.Option(DEFAULT_TOLERANCE, "--tolerance", help="Allowed relative change before failing"),
+    save_baseline: bool = typer.Option(False, "--save-baseline", help="Also write the results as the new baseline"),
+):
+    """Run the offline benchmark scenarios and compare them with the baseline."""
+    os.environ.setdefault("PGRST_JWT_SECRET", "benchmark-secret-not-used-by-the-stand-ins")
+    os.environ["SHOW_DB_CACHE"] = "off"
+    sys.path.insert(0, ROOT)
+    prefixes = [p.strip() for p in only.split(",")] if only else [""]
+    selected = [name for name in SCENARIOS if any(name.startswith(p) for p in prefixes)]
+
+    results = {}
+    with Suite(scale, threads) as suite:
+        for name in selected:
+            result = getattr(suite, name)()
+            if result is None:
+                print(f"{name:<22} skipped")
+                continue
+            results[name] = result
+            latency = f", p50 {result['latency_ms_p50']:.1f} ms, p99 {result['latency_ms_p99']:.1f} ms" \
+                if "latency_ms_p50" in result else ""
+            print(f"{name:<22} {result['rows_per_s']:>12,.0f} rows/s in {result['seconds']:.2f} s{latency}")
+
+    report = {
+        "meta": {
+            "taken_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "scale": scale,
+            "threads": threads,
+            "client_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[+] Results written to {output}")
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Baseline saved to {baseline}")
+        return
+
+    if not os.path.exists(baseline):
+        print(f"[*] No baseline at {baseline}; record one with --save-baseline")
+        return
+    with open(baseline) as f:
+        stored = json.load(f)
+    if stored["meta"].get("scale") != scale or stored["meta"].get("threads") != threads:
+        print(f"[!] Baseline was taken with scale {stored['meta'].get('scale')}, "
+              f"threads {stored['meta'].get('threads')}; numbers are not comparable")
+    regressions = compare(results, stored["results"], tolerance)
+    if regressions:
+        print(f"\n[-] {len(regressions)} metrics worse than the baseline by more than {tolerance:.0%}:")
+        for line in regressions:
+            print(f"    {line}")
+        raise typer.Exit(1)
+    print(f"\n[+] No regressions beyond {tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
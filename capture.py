@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+"""
+Batched capture writer for proxy traffic logs, plus capture tools.
+
+Relay loops hand records to a CaptureWriter, which queues them and writes
+them from a single background thread. Two formats are supported:
+
+  text    one file per connection, <hostname>-<port>.txt, optionally gzip or
+          zstd compressed. Human readable, same layout the proxy always wrote.
+  binary  one capture-<stamp>.iwcap file for all connections with
+          length-prefixed records (monotonic timestamp, connection ID,
+          direction) and a .idx file of record offsets, for replay.
+
+Both rotate by size and/or age.
+
+Usage:
+    uv run capture.py info capture-20250101-000000.iwcap
+    uv run capture.py index capture-20250101-000000.iwcap
+    uv run capture.py replay capture-20250101-000000.iwcap localhost 3000 --speed 10
+"""
+
+import array
+import asyncio
+import gzip
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+import typer
+
+
+DEFAULT_QUEUE_SIZE = 10000
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.2  # seconds the writer waits for more records before flushing
+
+UPLOAD = "→"
+DOWNLOAD = "←"
+
+# Binary capture layout (little endian):
+#   file header:   magic, wall clock ns and monotonic ns when the file was opened
+#   record header: payload length, monotonic ns, connection ID, direction, kind
+#   payload:       `length` bytes
+MAGIC = b"IWCAP\x00\x01\n"
+FILE_HEADER = struct.Struct("<8sQQ")
+RECORD_HEADER = struct.Struct("<IQIBB")
+INDEX_ENTRY = "Q"
+
+KIND_DATA = 0  # payload is the relayed bytes
+KIND_COUNT = 1  # payload is a uint32 byte count, data was not captured
+KIND_OPEN = 2  # payload is the connection name, host-port
+KIND_CLOSE = 3  # no payload
+
+DIRECTION_CODES = {UPLOAD: 0, DOWNLOAD: 1}
+COUNT = struct.Struct("<I")
+
+app = typer.Typer(help="Inspect and replay proxy capture files")
+
+
+class Overflow(str, Enum):
+    block = "block"
+    drop = "drop"
+
+
+class Compression(str, Enum):
+    none = "none"
+    gzip = "gzip"
+    zstd = "zstd"
+
+
+class CaptureFormat(str, Enum):
+    text = "text"
+    binary = "binary"
+
+
+SUFFIXES = {
+    Compression.none: "",
+    Compression.gzip: ".gz",
+    Compression.zstd: ".zst",
+}
+
+
+def format_log_header(direction, nbytes, log_timestamps, ts=None):
+    """Format the header line of a log record; ts defaults to now."""
+    if log_timestamps:
+        when = datetime.now() if ts is None else datetime.fromtimestamp(ts)
+        timestamp = when.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        return f"[{timestamp}] [{direction}] {nbytes} bytes\n".encode()
+    return f"[{direction}] {nbytes} bytes\n".encode()
+
+
+def format_log_record(direction, data, log_timestamps, ts=None):
+    """Format a relayed chunk as a log record: header line, payload, newline."""
+    return format_log_header(direction, len(data), log_timestamps, ts) + data + b"\n"
+
+
+def open_capture_file(path, compression):
+    """Open a capture file for appending with the requested compression."""
+    if compression == Compression.gzip:
+        return gzip.open(path, "ab", compresslevel=6)
+    if compression == Compression.zstd:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package (uv sync --extra capture)")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "ab"), closefd=True)
+    return open(path, "ab")
+
+
+def timestamp_suffix():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class CaptureFile:
+    """One open text capture file for a connection, shared by both directions."""
+
+    def __init__(self, base, compression):
+        self.base = base
+        self.compression = compression
+        self.path = f"{base}.txt{SUFFIXES[compression]}"
+        self.handle = open_capture_file(self.path, compression)
+        self.opened_at = time.monotonic()
+        self.size = 0
+
+    def write(self, chunk):
+        self.handle.write(chunk)
+        self.size += len(chunk)
+
+    def flush(self):
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+    def rotate(self):
+        """Close this file, move it aside with a timestamp suffix and reopen a fresh one."""
+        self.close()
+        suffix = SUFFIXES[self.compression]
+        stamp = timestamp_suffix()
+        target = f"{self.base}.{stamp}.txt{suffix}"
+        n = 1
+        while os.path.exists(target):
+            target = f"{self.base}.{stamp}-{n}.txt{suffix}"
+            n += 1
+        os.replace(self.path, target)
+        self.handle = open_capture_file(self.path, self.compression)
+        self.opened_at = time.monotonic()
+        self.size = 0
+
+
+class TextCapture:
+    """Text log files, one per connection."""
+
+    def __init__(self, directory, log_timestamps, compression, rotate_bytes, rotate_seconds):
+        self.directory = directory
+        self.log_timestamps = log_timestamps
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._files = {}
+        self._touched = {}
+        # Records carry monotonic ns; convert to wall clock for display
+        self._wall_offset = time.time() - time.monotonic_ns() / 1e9
+
+    def path_for(self, name):
+        return f"{os.path.join(self.directory, name)}.txt{SUFFIXES[self.compression]}"
+
+    def write(self, name, direction, mono_ns, payload):
+        capture_file = self._files.get(name)
+        if capture_file is None:
+            capture_file = self._files[name] = CaptureFile(os.path.join(self.directory, name), self.compression)
+        ts = self._wall_offset + mono_ns / 1e9
+        if isinstance(payload, int):
+            capture_file.write(format_log_header(direction, payload, self.log_timestamps, ts))
+        else:
+            capture_file.write(format_log_record(direction, payload, self.log_timestamps, ts))
+        self._touched[name] = capture_file
+        if self.rotate_bytes and capture_file.size >= self.rotate_bytes:
+            capture_file.rotate()
+
+    def close_connection(self, name):
+        capture_file = self._files.pop(name, None)
+        if capture_file is not None:
+            self._touched.pop(name, None)
+            capture_file.close()
+
+    def flush(self):
+        for capture_file in self._touched.values():
+            capture_file.flush()
+        self._touched.clear()
+
+    def rotate_aged(self):
+        now = time.monotonic()
+        for capture_file in self._files.values():
+            if capture_file.size and now - capture_file.opened_at >= self.rotate_seconds:
+                capture_file.rotate()
+
+    def close(self):
+        for capture_file in self._files.values():
+            capture_file.close()
+        self._files.clear()
+        self._touched.clear()
+
+
+class BinaryCapture:
+    """A single binary capture file for all connections, with a record offset index."""
+
+    def __init__(self, directory, rotate_bytes, rotate_seconds):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._conn_ids = {}
+        self._next_id = 1
+        self._open()
+
+    def _open(self):
+        stamp = timestamp_suffix()
+        path = os.path.join(self.directory, f"capture-{stamp}.iwcap")
+        n = 1
+        while True:
+            try:
+                # Exclusive create: proxy workers may open captures in the same second
+                self._handle = open(path, "xb")
+                break
+            except FileExistsError:
+                path = os.path.join(self.directory, f"capture-{stamp}-{n}.iwcap")
+                n += 1
+        self.path = path
+        self._index = open(path + ".idx", "wb")
+        self._handle.write(FILE_HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns()))
+        self.size = FILE_HEADER.size
+        self.opened_at = time.monotonic()
+        # Connections that span a rotation are re-announced in the new file
+        for name, conn_id in self._conn_ids.items():
+            self._write_record(conn_id, 0, KIND_OPEN, time.monotonic_ns(), name.encode())
+
+    def _write_record(self, conn_id, direction, kind, mono_ns, payload=b""):
+        self._index.write(struct.pack("<" + INDEX_ENTRY, self.size))
+        self._handle.write(RECORD_HEADER.pack(len(payload), mono_ns, conn_id, direction, kind))
+        self._handle.write(payload)
+        self.size += RECORD_HEADER.size + len(payload)
+
+    def path_for(self, name):
+        return self.path
+
+    def write(self, name, direction, mono_ns, payload):
+        conn_id = self._conn_ids.get(name)
+        if conn_id is None:
+            conn_id = self._conn_ids[name] = self._next_id
+            self._next_id += 1
+            self._write_record(conn_id, 0, KIND_OPEN, mono_ns, name.encode())
+        code = DIRECTION_CODES[direction]
+        if isinstance(payload, int):
+            self._write_record(conn_id, code, KIND_COUNT, mono_ns, COUNT.pack(payload))
+        else:
+            self._write_record(conn_id, code, KIND_DATA, mono_ns, payload)
+        if self.rotate_bytes and self.size >= self.rotate_bytes:
+            self._rotate()
+
+    def close_connection(self, name):
+        conn_id = self._conn_ids.pop(name, None)
+        if conn_id is not None:
+            self._write_record(conn_id, 0, KIND_CLOSE, time.monotonic_ns())
+
+    def flush(self):
+        self._handle.flush()
+        self._index.flush()
+
+    def _rotate(self):
+        self.close()
+        self._open()
+
+    def rotate_aged(self):
+        if self.size > FILE_HEADER.size and time.monotonic() - self.opened_at >= self.rotate_seconds:
+            self._rotate()
+
+    def close(self):
+        self._handle.close()
+        self._index.close()
+
+
+class CaptureWriter:
+    """
+    Write capture records off the relay hot path.
+
+    record()/record_count() only timestamp and enqueue. A background thread
+    drains the bounded queue in batches, formats, writes and flushes once per
+    batch. When the queue is full, Overflow.block makes the caller wait
+    (backpressure on the relay) and Overflow.drop discards the record and
+    counts it in `dropped`.
+
+    Blocking is only safe for the threads engine, where it stalls one relay
+    thread. With event_loop=True (asyncio and http engines) a wait would
+    freeze every connection on the loop, so records are always dropped when
+    the queue is full, and connection closes are retried from the loop.
+    """
+
+    def __init__(
+        self,
+        directory=".",
+        log_timestamps=False,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        overflow=Overflow.block,
+        compression=Compression.none,
+        rotate_bytes=0,
+        rotate_seconds=0,
+        capture_format=CaptureFormat.text,
+        event_loop=False,
+    ):
+        if capture_format == CaptureFormat.binary and compression != Compression.none:
+            raise ValueError("binary captures are mmapped for replay and cannot be compressed")
+        if compression == Compression.zstd:
+            open_capture_file(os.devnull, compression).close()  # Fail fast if zstandard is missing
+        self.directory = directory
+        self.queue_size = queue_size
+        self.log_timestamps = log_timestamps
+        self.event_loop = event_loop
+        self.overflow = Overflow.drop if event_loop else overflow
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.capture_format = capture_format
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._sink = None
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+
+    def path_for(self, name):
+        """Return the capture file path a connection name like host-port is written to."""
+        return self._sink.path_for(name)
+
+    def start(self):
+        if self.capture_format == CaptureFormat.binary:
+            self._sink = BinaryCapture(self.directory, self.rotate_bytes, self.rotate_seconds)
+        else:
+            self._sink = TextCapture(
+                self.directory, self.log_timestamps, self.compression, self.rotate_bytes, self.rotate_seconds
+            )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Drain outstanding records, close all files and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self):
+        return {"written_total": self.written, "dropped_total": self.dropped, "queue_depth": self._queue.qsize()}
+
+    def _put(self, item):
+        if self.overflow == Overflow.block:
+            self._queue.put(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def record(self, name, direction, data):
+        """Queue a payload record for a connection."""
+        return self._put((name, direction, time.monotonic_ns(), data))
+
+    def record_count(self, name, direction, nbytes):
+        """Queue a byte-count-only record for a connection."""
+        return self._put((name, direction, time.monotonic_ns(), nbytes))
+
+    def close_connection(self, name):
+        """Queue closing the connection once its earlier records are written."""
+        if not self.event_loop:
+            self._queue.put((name, None, None, None))
+            return
+        try:
+            self._queue.put_nowait((name, None, None, None))
+        except queue.Full:  # Not dropped, or the connection's file would stay open; try again later
+            asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self.close_connection, name)
+
+    def _write_batch(self, batch):
+        for name, direction, mono_ns, payload in batch:
+            if direction is None:
+                self._sink.close_connection(name)
+                continue
+            self._sink.write(name, direction, mono_ns, payload)
+            self.written += 1
+        self._sink.flush()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                item = ()
+            batch = []
+            while item is not None:
+                if item:
+                    batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                stopping = True
+
+            try:
+                self._write_batch(batch)
+                if self.rotate_seconds:
+                    self._sink.rotate_aged()
+            except Exception as e:
+                print(f"[!] Capture writer error: {e}")
+
+        self._sink.close()
+
+
+class CaptureReader:
+    """Read a binary capture through mmap, using its .idx file when present."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a binary capture file")
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.wall_ns, self.mono_ns = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a binary capture file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+    def scan_offsets(self):
+        """Walk the length prefixes and return every complete record offset."""
+        offsets = array.array(INDEX_ENTRY)
+        offset, end = FILE_HEADER.size, len(self.mm)
+        while offset + RECORD_HEADER.size <= end:
+            length = RECORD_HEADER.unpack_from(self.mm, offset)[0]
+            if offset + RECORD_HEADER.size + length > end:
+                break  # Truncated trailing record, e.g. capture still being written
+            offsets.append(offset)
+            offset += RECORD_HEADER.size + length
+        return offsets
+
+    def offsets(self):
+        """Return record offsets from the index file, or by scanning if it is missing."""
+        index_path = self.path + ".idx"
+        if not os.path.exists(index_path):
+            return self.scan_offsets()
+        offsets = array.array(INDEX_ENTRY)
+        with open(index_path, "rb") as f:
+            data = f.read()
+        offsets.frombytes(data[: len(data) - len(data) % offsets.itemsize])
+        return offsets
+
+    def record(self, offset):
+        """Return (mono_ns, conn_id, direction, kind, payload start, payload length) at offset."""
+        length, mono_ns, conn_id, direction, kind = RECORD_HEADER.unpack_from(self.mm, offset)
+        return mono_ns, conn_id, direction, kind, offset + RECORD_HEADER.size, length
+
+
+def open_reader(path):
+    """Open a capture for a CLI command, reporting bad files as parameter errors."""
+    try:
+        return CaptureReader(path)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e))
+
+
+def build_index(path):
+    """Rebuild the .idx file for a binary capture; returns the record count."""
+    with CaptureReader(path) as reader:
+        offsets = reader.scan_offsets()
+    with open(path + ".idx", "wb") as f:
+        offsets.tofile(f)
+    return len(offsets)
+
+
+def load_connections(reader):
+    """Group the upload records of a capture by connection, in capture order."""
+    connections = {}
+    for offset in reader.offsets():
+        mono_ns, conn_id, direction, kind, start, length = reader.record(offset)
+        conn = connections.setdefault(conn_id, {"name": str(conn_id), "sends": [], "closed": False})
+        if kind == KIND_OPEN:
+            conn["name"] = bytes(reader.mm[start:start + length]).decode()
+        elif kind == KIND_CLOSE:
+            conn["closed"] = True
+        elif kind == KIND_DATA and direction == DIRECTION_CODES[UPLOAD]:
+            conn["sends"].append((mono_ns, start, length))
+    return [conn for conn in connections.values() if conn["sends"]]
+
+
+async def replay_connection(conn, mm, host, port, start_ns, started, speed, limiter, stats, response_timeout):
+    """Open a connection and re-send one recorded connection's upload traffic on schedule."""
+
+    def due(mono_ns):
+        return started + (mono_ns - start_ns) / 1e9 / speed if speed > 0 else 0
+
+    loop = asyncio.get_running_loop()
+    delay = due(conn["sends"][0][0]) - loop.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    async with limiter:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            stats["errors"] += 1
+            print(f"[!] {conn['name']}: connect failed: {e}")
+            return
+
+        async def drain_responses():
+            while data := await reader.read(65536):
+                stats["received"] += len(data)
+
+        receiver = asyncio.create_task(drain_responses())
+        try:
+            for mono_ns, start, length in conn["sends"]:
+                delay = due(mono_ns) - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(mm[start:start + length])
+                await writer.drain()
+                stats["sent"] += length
+                stats["records"] += 1
+            if conn["closed"] and writer.can_write_eof():
+                writer.write_eof()  # The device closed too; lets the target finish and hang up
+            try:
+                await asyncio.wait_for(asyncio.shield(receiver), response_timeout)
+            except asyncio.TimeoutError:
+                pass
+        except OSError as e:
+            stats["errors"] += 1
+            print(f"[!] {conn['name']}: {e}")
+        finally:
+            receiver.cancel()
+            writer.close()
+            stats["connections"] += 1
+
+
+async def replay_capture(reader, host, port, speed, concurrency, response_timeout, limit=None):
+    connections = load_connections(reader)[:limit]
+    stats = {"connections": 0, "records": 0, "sent": 0, "received": 0, "errors": 0}
+    if not connections:
+        return stats, 0.0
+    start_ns = min(conn["sends"][0][0] for conn in connections)
+    limiter = asyncio.Semaphore(concurrency)
+    started = asyncio.get_running_loop().time()
+    await asyncio.gather(*(
+        replay_connection(conn, reader.mm, host, port, start_ns, started, speed, limiter, stats, response_timeout)
+        for conn in connections
+    ))
+    return stats, asyncio.get_running_loop().time() - started
+
+
+@app.command()
+def info(path: str = typer.Argument(..., help="Binary capture file")):
+    """Summarise a binary capture file."""
+    with open_reader(path) as reader:
+        offsets = reader.offsets()
+        conns = set()
+        totals = {UPLOAD: 0, DOWNLOAD: 0}
+        first = last = None
+        for offset in offsets:
+            mono_ns, conn_id, direction, kind, _, length = reader.record(offset)
+            conns.add(conn_id)
+            first = mono_ns if first is None else first
+            last = mono_ns
+            if kind in (KIND_DATA, KIND_COUNT):
+                nbytes = length if kind == KIND_DATA else COUNT.unpack_from(reader.mm, offset + RECORD_HEADER.size)[0]
+                totals[UPLOAD if direction == DIRECTION_CODES[UPLOAD] else DOWNLOAD] += nbytes
+        opened = datetime.fromtimestamp(reader.wall_ns / 1e9, timezone.utc)
+
+    print(f"\nCapture: {path}")
+    print("=" * 80)
+    print(f"Opened At: {opened}")
+    print(f"Records: {len(offsets):,}")
+    print(f"Connections: {len(conns):,}")
+    print(f"Duration: {((last or 0) - (first or 0)) / 1e9:.3f} s")
+    print(f"Bytes {UPLOAD}: {totals[UPLOAD]:,}")
+    print(f"Bytes {DOWNLOAD}: {totals[DOWNLOAD]:,}")
+
+
+@app.command()
+def index(path: str = typer.Argument(..., help="Binary capture file")):
+    """Rebuild the record offset index (.idx) of a binary capture."""
+    open_reader(path).close()
+    count = build_index(path)
+    print(f"Indexed {count:,} records -> {path}.idx")
+
+
+@app.command()
+def replay(
+    path: str = typer.Argument(..., help="Binary capture file"),
+    host: str = typer.Argument(..., help="Target host, e.g. a staging PostgREST"),
+    port: int = typer.Argument(..., help="Target port"),
+    speed: float = typer.Option(1.0, "--speed", "-s", help="Replay speed multiplier; 0 sends as fast as possible"),
+    concurrency: int = typer.Option(1000, "--concurrency", "-c", help="Max simultaneous connections"),
+    response_timeout: float = typer.Option(
+        5.0, "--response-timeout", help="Seconds to wait for responses after a connection's last send"
+    ),
+    limit: Optional[int] = typer.Option(None, "--limit", "-n", help="Replay only the first N connections"),
+):
+    """
+    Re-send the recorded upload traffic of a binary capture to a target.
+
+    Each recorded connection gets its own connection to the target and its
+    upload chunks are sent on the recorded schedule, scaled by --speed.
+    Responses are read and counted but not compared.
+    """
+    if speed < 0:
+        raise typer.BadParameter("--speed must be >= 0")
+
+    with open_reader(path) as reader:
+        stats, elapsed = asyncio.run(
+            replay_capture(reader, host, port, speed, concurrency, response_timeout, limit)
+        )
+
+    rate = stats["sent"] / elapsed / 1e6 if elapsed else 0.0
+    print(f"\nReplayed {stats['connections']:,} connections, {stats['records']:,} records in {elapsed:.2f} s")
+    print(f"Sent: {stats['sent']:,} bytes ({rate:.2f} MB/s)")
+    print(f"Received: {stats['received']:,} bytes")
+    if stats["errors"]:
+        print(f"Errors: {stats['errors']}")
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the IoTaWatt tools: `iotawatt <command> ...`.
+
+    iotawatt jwt generate writer
+    iotawatt show --follow
+    iotawatt upload load --devices 500 --rate 5000
+
+Only the module of the command given is imported, and this module imports
+nothing but the standard library, so `iotawatt jwt ...` does not pay for
+rich, requests or psycopg2. Installed by `uv sync` as the `iotawatt` script;
+`python cli.py ...` works the same. The scripts can still be run directly.
+"""
+
+import importlib
+import sys
+
+# command -> (module, Typer app or single-command function, help)
+COMMANDS = {
+    "jwt": ("jwtutil", "app", "Generate and decode PostgREST JWT tokens"),
+    "show": ("show_db", "app", "Display, follow, export and roll up IoTaWatt data"),
+    "upload": ("upload_sample", "app", "Upload sample data, load test, run an insert stand-in"),
+    "backfill": ("backfill", "app", "Load history CSV files into TimescaleDB with COPY"),
+    "storage": ("storage", "app", "Hypertable size, compression and query latency report"),
+    "proxy": ("proxy", "main", "Relay and log traffic between devices and PostgREST"),
+    "capture": ("capture", "app", "Inspect and replay proxy capture files"),
+}
+
+
+def usage(out=sys.stdout):
+    print("Usage: iotawatt COMMAND [ARGS]...\n\nCommands:", file=out)
+    for name, (_, _, text) in COMMANDS.items():
+        print(f"  {name:<10} {text}", file=out)
+    print("\nRun `iotawatt COMMAND --help` for the options of a command.", file=out)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        usage()
+        return 0
+    if argv[0] not in COMMANDS:
+        print(f"Error: no such command '{argv[0]}'\n", file=sys.stderr)
+        usage(sys.stderr)
+        return 2
+    module_name, attr, _ = COMMANDS[argv[0]]
+    target = getattr(importlib.import_module(module_name), attr)
+    if attr != "app":
+        import typer
+
+        app = typer.Typer(add_completion=False)
+        app.command()(target)
+        target = app
+    return target(args=argv[1:], prog_name=f"iotawatt {argv[0]}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,848 @@
+#!/usr/bin/env python3
+"""
+HTTP-aware proxy engine for proxy.py (--engine http).
+
+Parses HTTP/1.1 requests from IoTaWatt devices instead of relaying raw
+bytes, so the proxy can act on them. Requests it does not handle itself are
+forwarded to the target unchanged over a pool of keep-alive upstream
+connections (--pool-size), or one upstream connection per client without it.
+
+With --coalesce, POSTs of rows to the IoTaWatt table are buffered for a
+short window (or until a row limit) and sent upstream as one bulk JSON
+insert; every client is acknowledged once that insert has committed.
+
+With --spool-dir, uploads that fail upstream are written to a durable spool
+(spool.py), acknowledged, and drained later in batches. An upload still
+waiting after --upstream-timeout is acknowledged and left in flight; it is
+spooled only if it then fails, so it is never both inserted and spooled.
+
+Request bodies sent with Content-Encoding: gzip are decompressed, since
+PostgREST does not accept them. Inserts carrying an Idempotency-Key header
+(uploader.py sends one) are answered once: a retry with the same key gets
+the first response again instead of inserting the rows twice.
+
+With --verify-jwt, bearer tokens are verified at the proxy (auth.py) and
+requests without a valid one are answered with 401 locally; --rate-limit
+caps requests per second per role with 429s.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from auth import AuthError, renew_authorization
+from capture import DOWNLOAD, UPLOAD
+from metrics import (
+    BYTES_DOWN,
+    BYTES_UP,
+    CONNECTIONS_CLOSED,
+    CONNECTIONS_OPENED,
+    AUTH_REJECTED,
+    IDEMPOTENT_REPLAYS,
+    TTFB_SECONDS,
+    UPSTREAM_CONNECT_ERRORS,
+    UPSTREAM_CONNECT_SECONDS,
+    metrics,
+    prefixed,
+)
+
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+DEFAULT_TABLE = os.environ.get("IOTAWATT_TABLE", "iotawatt")
+DEFAULT_COALESCE_MS = 50
+DEFAULT_COALESCE_ROWS = 5000
+DEFAULT_UPSTREAM_TIMEOUT = 10.0
+DEFAULT_POOL_SIZE = 32
+DEFAULT_POOL_IDLE_TIMEOUT = 30.0
+DEFAULT_POOL_HEALTH_INTERVAL = 5.0
+IDEMPOTENCY_KEYS = 10000  # Recent Idempotency-Keys whose response is kept for retries
+
+
+class HttpError(Exception):
+    """Malformed or oversized HTTP message; answered with `status` where possible."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+UPSTREAM_ERRORS = (OSError, ConnectionError, HttpError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+class HttpMessage:
+    """A parsed HTTP/1.1 request or response with a fully read body."""
+
+    def __init__(self, start_line, headers, body=b""):
+        self.start_line = start_line
+        self.headers = headers  # list of (name, value), original case and order
+        self.body = body
+
+    def header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def without_headers(self, *names):
+        drop = {n.lower() for n in names}
+        return [(k, v) for k, v in self.headers if k.lower() not in drop]
+
+    @property
+    def keep_alive(self):
+        connection = (self.header("Connection") or "").lower()
+        if self.start_line.startswith("HTTP/1.0") or self.start_line.endswith("HTTP/1.0"):
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def framed(self):
+        return self.header("Content-Length") is not None or self.header("Transfer-Encoding") is not None
+
+    def content_length(self):
+        return len(self.body) if self.body or self.framed else None
+
+    def serialize(self):
+        """Serialize with a Content-Length body (chunked bodies are already decoded)."""
+        headers = self.without_headers("Content-Length", "Transfer-Encoding")
+        length = self.content_length()
+        if length is not None:
+            headers.append(("Content-Length", str(length)))
+        lines = [self.start_line] + [f"{k}: {v}" for k, v in headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + self.body
+
+
+class HttpRequest(HttpMessage):
+    def __init__(self, start_line, headers, body=b""):
+        super().__init__(start_line, headers, body)
+        try:
+            self.method, self.target, self.version = start_line.split(" ", 2)
+        except ValueError:
+            raise HttpError(400, f"Bad request line: {start_line!r}")
+
+    @property
+    def path(self):
+        return urlsplit(self.target).path
+
+    @property
+    def query(self):
+        return urlsplit(self.target).query
+
+
+class HttpResponse(HttpMessage):
+    def __init__(self, start_line, headers, body=b""):
+        super().__init__(start_line, headers, body)
+        try:
+            self.status = int(start_line.split(" ", 2)[1])
+        except (IndexError, ValueError):
+            raise HttpError(502, f"Bad status line from upstream: {start_line!r}")
+
+    def content_length(self):
+        if self.status in (204, 304) or 100 <= self.status < 200:
+            return None
+        if not self.body and self.header("Content-Length") is not None:
+            return int(self.header("Content-Length"))  # HEAD response, keep the advertised size
+        return len(self.body)
+
+
+def make_response(status, body=b"", content_type=None, extra_headers=()):
+    """Build a response generated by the proxy itself."""
+    headers = list(extra_headers)
+    if content_type:
+        headers.append(("Content-Type", content_type))
+    return HttpResponse(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", headers, body)
+
+
+def error_response(status, message):
+    body = json.dumps({"message": message, "hint": "returned by proxy"}).encode()
+    return make_response(status, body, "application/json; charset=utf-8")
+
+
+def auth_response(error):
+    """401 or 429 for a request refused by the proxy's token check."""
+    response = error_response(error.status, str(error))
+    if error.status == 401:
+        response.headers.append(("WWW-Authenticate", f'Bearer error="invalid_token", error_description="{str(error).replace(chr(34), chr(39))}"'))
+    if error.retry_after is not None:
+        response.headers.append(("Retry-After", str(error.retry_after)))
+    return response
+
+
+async def read_head(reader):
+    """Read a start line and headers; returns None on a clean EOF between messages."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HttpError(400, "Connection closed mid-header")
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "Request header too large")
+    if len(head) > MAX_HEADER_SIZE:
+        raise HttpError(431, "Request header too large")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise HttpError(400, f"Bad header line: {line!r}")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+async def read_body(reader, message, until_eof=False):
+    """Read a message body framed by Content-Length, chunked encoding or (responses) EOF."""
+    if "chunked" in (message.header("Transfer-Encoding") or "").lower():
+        parts, size = [], 0
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            try:
+                chunk_size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+            except ValueError:
+                raise HttpError(400, "Bad chunk size")
+            if chunk_size == 0:
+                while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                    pass  # Discard trailers
+                break
+            size += chunk_size
+            if size > MAX_BODY_SIZE:
+                raise HttpError(413, "Body too large")
+            parts.append(await reader.readexactly(chunk_size))
+            await reader.readexactly(2)
+        return b"".join(parts)
+
+    length = message.header("Content-Length")
+    if length is not None:
+        try:
+            length = int(length)
+        except ValueError:
+            raise HttpError(400, "Bad Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Body too large")
+        return await reader.readexactly(length)
+    if until_eof:
+        parts, size = [], 0
+        while data := await reader.read(65536):
+            size += len(data)
+            if size > MAX_BODY_SIZE:
+                raise HttpError(502, "Upstream body too large")
+            parts.append(data)
+        return b"".join(parts)
+    return b""
+
+
+async def read_request(reader):
+    head = await read_head(reader)
+    if head is None:
+        return None
+    request = HttpRequest(*head)
+    request.body = await read_body(reader, request)
+    if (request.header("Content-Encoding") or "").strip().lower() == "gzip":
+        request.body = gunzip(request.body)
+        request.headers = request.without_headers("Content-Encoding")
+    return request
+
+
+def gunzip(body):
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    try:
+        data = decompressor.decompress(body, MAX_BODY_SIZE + 1)
+    except zlib.error as e:
+        raise HttpError(400, f"Bad gzip body: {e}")
+    if len(data) > MAX_BODY_SIZE:
+        raise HttpError(413, "Body too large")
+    if not decompressor.eof:
+        raise HttpError(400, "Truncated gzip body")
+    return data
+
+
+async def read_response(reader, request_method="GET", sent_at=None):
+    """Read a response; with sent_at (perf_counter when the request was sent), time the first byte."""
+    head = await read_head(reader)
+    if head is None:
+        raise ConnectionError("Upstream closed the connection")
+    if sent_at is not None:
+        metrics.observe(TTFB_SECONDS, time.perf_counter() - sent_at)  # The head is the first read
+    response = HttpResponse(*head)
+    if request_method == "HEAD" or response.status in (204, 304) or 100 <= response.status < 200:
+        return response
+    response.body = await read_body(reader, response, until_eof=not response.framed)
+    return response
+
+
+async def open_upstream(host, port, limit=MAX_HEADER_SIZE):
+    """asyncio.open_connection to the target, recording connect latency and failures."""
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.open_connection(host, port, limit=limit)
+    except OSError:
+        metrics.inc(UPSTREAM_CONNECT_ERRORS)
+        raise
+    metrics.observe(UPSTREAM_CONNECT_SECONDS, time.perf_counter() - started)
+    return conn
+
+
+async def exchange(reader, writer, request):
+    """Send a request on an upstream connection and read its response."""
+    writer.write(request.serialize())
+    await writer.drain()
+    return await read_response(reader, request.method, sent_at=time.perf_counter())
+
+
+async def fetch(host, port, request):
+    """Send one request on a fresh upstream connection and return the response."""
+    reader, writer = await open_upstream(host, port)
+    try:
+        return await exchange(reader, writer, request)
+    finally:
+        writer.close()
+
+
+class UpstreamPool:
+    """
+    Bounded pool of persistent keep-alive connections to the target.
+
+    request() waits for a free slot, reuses an idle connection when one is
+    healthy (a hit) or opens a new one (a miss), and returns the connection
+    to the pool if the response allows keep-alive. A request that fails on a
+    reused connection before any response byte arrives is retried once on a
+    fresh connection: the server closed it while idle and never saw the request.
+    """
+
+    def __init__(self, host, port, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT,
+                 health_interval=DEFAULT_POOL_HEALTH_INTERVAL):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self._idle = []  # (reader, writer, idle since), most recently used last
+        self._slots = None
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self.opened = 0
+        self.closed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _healthy(self, reader, writer, idle_since, now):
+        return not (writer.is_closing() or reader.at_eof() or now - idle_since > self.idle_timeout)
+
+    def _close(self, writer):
+        writer.close()
+        self.closed += 1
+
+    def _take_idle(self):
+        now = asyncio.get_running_loop().time()
+        while self._idle:
+            reader, writer, idle_since = self._idle.pop()
+            if self._healthy(reader, writer, idle_since, now):
+                return reader, writer
+            self._close(writer)
+        return None
+
+    async def _open(self):
+        conn = await open_upstream(self.host, self.port)
+        self.opened += 1
+        return conn
+
+    async def request(self, request):
+        """Send a request on a pooled connection and return the response."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with self._slots:
+            wait = loop.time() - started
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.requests += 1
+
+            conn = self._take_idle()
+            reused = conn is not None
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+                conn = await self._open()
+            reader, writer = conn
+            try:
+                try:
+                    response = await exchange(reader, writer, request)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    stale = isinstance(e, ConnectionError) or not e.partial
+                    if not (reused and stale):
+                        raise
+                    self._close(writer)
+                    self.retries += 1
+                    reader, writer = await self._open()
+                    response = await exchange(reader, writer, request)
+            except BaseException:
+                self._close(writer)  # Includes cancellation: the connection state is unknown
+                raise
+            if response.keep_alive:
+                self._idle.append((reader, writer, loop.time()))
+            else:
+                self._close(writer)
+            return response
+
+    async def check_health(self):
+        """Run forever: close idle connections the server has dropped or that idled too long."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = asyncio.get_running_loop().time()
+            idle = []
+            for reader, writer, idle_since in self._idle:
+                if self._healthy(reader, writer, idle_since, now):
+                    idle.append((reader, writer, idle_since))
+                else:
+                    self._close(writer)
+            self._idle = idle
+
+    def close(self):
+        for _, writer, _ in self._idle:
+            self._close(writer)
+        self._idle = []
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "requests_total": self.requests,
+            "hits_total": self.hits,
+            "misses_total": self.misses,
+            "retries_total": self.retries,
+            "opened_total": self.opened,
+            "closed_total": self.closed,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+        }
+
+    def summary(self):
+        s = self.stats()
+        hit_rate = s["hits_total"] / s["requests_total"] if s["requests_total"] else 0.0
+        avg_wait = s["wait_seconds_total"] / s["requests_total"] if s["requests_total"] else 0.0
+        return (f"[*] Upstream pool: {s['requests_total']} requests, hit rate {hit_rate:.1%}, "
+                f"wait avg {avg_wait * 1000:.2f} ms / max {s['wait_seconds_max'] * 1000:.1f} ms, "
+                f"{s['opened_total']} connections opened")
+
+
+def parse_rows(request):
+    """
+    Return the rows of an insert body as a list of dicts, or None if the body
+    is not something that can safely be merged with other requests.
+
+    CSV follows PostgREST conventions: a header row, and a bare NULL for nulls.
+    """
+    content_type = (request.header("Content-Type") or "").split(";")[0].strip().lower()
+    if content_type == "application/json":
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            return None
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return None
+        return rows
+    if content_type == "text/csv":
+        try:
+            records = list(csv.reader(io.StringIO(request.body.decode("utf-8"))))
+        except (UnicodeDecodeError, csv.Error):
+            return None
+        if not records:
+            return None
+        header, data = records[0], [r for r in records[1:] if r]
+        if any(len(r) != len(header) for r in data):
+            return None  # Let PostgREST report the malformed CSV to the device
+        return [{k: (None if v == "NULL" else v) for k, v in zip(header, r)} for r in data]
+    return None
+
+
+def request_devices(request, rows=None):
+    """Devices a request is about: the rows' device column, or a device=eq.<name> filter."""
+    if rows:
+        return {str(row["device"]) for row in rows if row.get("device") is not None}
+    for name, value in parse_qsl(request.query):
+        if name == "device" and value.startswith("eq."):
+            return {value[3:]}
+    return set()
+
+
+def wants_representation(request):
+    return "return=representation" in (request.header("Prefer") or "")
+
+
+def insert_preferences(request):
+    """The request's Prefer values other than return=, e.g. "missing=default, resolution=merge-duplicates"."""
+    values = (value.strip() for value in (request.header("Prefer") or "").split(","))
+    return ", ".join(sorted(value for value in values if value and not value.startswith("return=")))
+
+
+def bulk_insert_request(table, auth, rows, representation=False, preferences=""):
+    """Build one JSON bulk insert for rows that may not all share the same keys."""
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    prefer = "return=representation" if representation else "return=minimal"
+    headers = [
+        ("Content-Type", "application/json"),
+        ("Prefer", f"{prefer}, {preferences}" if preferences else prefer),
+    ]
+    if auth:
+        headers.append(("Authorization", auth))
+    target = f"/{table}?columns={','.join(columns)}"
+    return HttpRequest(f"POST {target} HTTP/1.1", headers, json.dumps(rows).encode())
+
+
+class Coalescer:
+    """
+    Merge row inserts from many clients into bulk inserts.
+
+    Rows are grouped by Authorization header, since the upstream insert runs
+    as a single role, and by the other Prefer values (resolution=, missing=),
+    which apply to the whole insert. A group is flushed after `window` seconds or once it
+    holds `max_rows` rows; each waiting client then receives the outcome of
+    the bulk insert. If PostgREST rejects a multi-client batch with a 4xx,
+    each client's rows are retried on their own so one bad device does not
+    fail the others.
+    """
+
+    def __init__(self, send, table, window=DEFAULT_COALESCE_MS / 1000, max_rows=DEFAULT_COALESCE_ROWS):
+        self.send = send  # async callable(HttpRequest) -> HttpResponse
+        self.table = table
+        self.window = window
+        self.max_rows = max_rows
+        self.batches = 0
+        self.rows = 0
+        self.requests = 0
+        self._pending = {}
+
+    def stats(self):
+        return {"batches_total": self.batches, "rows_total": self.rows, "requests_total": self.requests}
+
+    async def submit(self, request, rows):
+        """Queue the rows of one client request; resolves to that client's response."""
+        key = (request.header("Authorization", ""), insert_preferences(request))
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = {"rows": [], "waiters": [], "timer": None}
+            loop = asyncio.get_running_loop()
+            batch["timer"] = loop.call_later(self.window, self._flush_soon, key, batch)
+
+        future = asyncio.get_running_loop().create_future()
+        start = len(batch["rows"])
+        batch["rows"].extend(rows)
+        batch["waiters"].append((future, start, len(batch["rows"]), request))
+        if len(batch["rows"]) >= self.max_rows:
+            batch["timer"].cancel()
+            self._flush_soon(key, batch)
+        return await future
+
+    def _flush_soon(self, key, batch):
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+            asyncio.create_task(self._flush(key, batch))
+
+    async def _flush(self, key, batch):
+        auth, preferences = key
+        rows, waiters = batch["rows"], batch["waiters"]
+        representation = any(wants_representation(req) for _, _, _, req in waiters)
+        try:
+            response = await self.send(bulk_insert_request(self.table, auth, rows, representation, preferences))
+        except UPSTREAM_ERRORS as e:
+            response = error_response(502, f"Upstream unavailable: {e}")
+
+        self.batches += 1
+        self.rows += len(rows)
+        self.requests += len(waiters)
+
+        if 400 <= response.status < 500 and len(waiters) > 1:
+            await asyncio.gather(*(self._retry_alone(key, rows, waiter) for waiter in waiters))
+            return
+
+        inserted = None
+        if representation and response.status < 300:
+            try:
+                inserted = json.loads(response.body)
+            except ValueError:
+                inserted = None
+        for future, start, end, request in waiters:
+            if future.done():
+                continue
+            if response.status >= 300:
+                future.set_result(response)
+            elif wants_representation(request) and isinstance(inserted, list):
+                body = json.dumps(inserted[start:end]).encode()
+                future.set_result(make_response(response.status, body, "application/json; charset=utf-8"))
+            else:
+                future.set_result(make_response(response.status))
+
+    async def _retry_alone(self, key, rows, waiter):
+        auth, preferences = key
+        future, start, end, request = waiter
+        try:
+            request = bulk_insert_request(self.table, auth, rows[start:end], wants_representation(request),
+                                          preferences)
+            response = await self.send(request)
+        except UPSTREAM_ERRORS as e:
+            response = error_response(502, f"Upstream unavailable: {e}")
+        if not future.done():
+            future.set_result(response)
+
+
+class HttpProxy:
+    """Per-request HTTP proxy: forwards to the target, coalescing and spooling inserts when enabled."""
+
+    def __init__(self, target_host, target_port, capture=None, log_payload=True, table=DEFAULT_TABLE,
+                 coalesce=False, coalesce_window=DEFAULT_COALESCE_MS / 1000, coalesce_rows=DEFAULT_COALESCE_ROWS,
+                 spool=None, upstream_timeout=DEFAULT_UPSTREAM_TIMEOUT, pool=None, auth=None, spool_resign=False):
+        self.target_host = target_host
+        self.target_port = target_port
+        self.capture = capture
+        self.log_payload = log_payload
+        self.table = table
+        self.coalescer = Coalescer(self.send_upstream, table, coalesce_window, coalesce_rows) if coalesce else None
+        self.spool = spool
+        self.spool_resign = spool_resign
+        self.upstream_timeout = upstream_timeout
+        self.pool = pool
+        self.auth = auth
+        self.replies = OrderedDict()  # (Authorization, Idempotency-Key) -> future of the first response
+        self.late = set()  # Inserts still in flight after upstream_timeout (settle_late)
+
+    async def send_upstream(self, request):
+        """Send a proxy-originated request to the target."""
+        if request.header("Host") is None:
+            request.headers.insert(0, ("Host", f"{self.target_host}:{self.target_port}"))
+        if self.pool is not None:
+            return await self.pool.request(request)
+        return await fetch(self.target_host, self.target_port, request)
+
+    def log(self, name, direction, data):
+        if self.capture is None:
+            return
+        if self.log_payload:
+            self.capture.record(name, direction, data)
+        else:
+            self.capture.record_count(name, direction, len(data))
+
+    async def send_spooled(self, auth, rows, preferences="", spooled_at=None):
+        """Deliver rows drained from the spool; returns the upstream status."""
+        if self.spool_resign and spooled_at is not None:
+            auth = renew_authorization(auth, spooled_at)
+        request = bulk_insert_request(self.table, auth, rows, preferences=preferences)
+        try:
+            response = await asyncio.wait_for(self.send_upstream(request), self.upstream_timeout)
+        except (HttpError, asyncio.IncompleteReadError) as e:
+            raise ConnectionError(f"Bad upstream response: {e}") from e
+        return response.status
+
+    def is_insert(self, request):
+        return request.method == "POST" and request.path == f"/{self.table}" and not request.query
+
+    def spool_rows(self, request, rows):
+        self.spool.append(request.header("Authorization", ""), rows, insert_preferences(request))
+        return make_response(201, extra_headers=[("X-Proxy-Spooled", "true")])
+
+    def settle_late(self, sending, request, rows, connection):
+        """
+        Once an insert that outlived upstream_timeout finishes, spool its rows if
+        the upstream was unavailable, or record them as rejected on another
+        error. Until then they are not spooled: the insert may still commit.
+        """
+        def settled(task):
+            self.late.discard(task)
+            if connection["writer"] is not None:
+                connection["writer"].close()  # Left mid-exchange by the client, which moved on
+            if task.cancelled():
+                return
+            try:
+                status = task.result().status
+            except UPSTREAM_ERRORS:
+                status = 502
+            if status in (502, 503, 504):
+                self.spool_rows(request, rows)
+            elif status >= 400:
+                self.spool.reject(request.header("Authorization", ""), rows, status, insert_preferences(request))
+
+        self.late.add(sending)
+        sending.add_done_callback(settled)
+
+    async def handle_request(self, request, upstream):
+        """Produce the response to one client request. `upstream` holds the client's forwarding connection."""
+        if self.auth is not None:
+            try:
+                self.auth.check(request.header("Authorization"))
+            except AuthError as e:
+                metrics.inc(f'{AUTH_REJECTED}{{status="{e.status}"}}')
+                return auth_response(e)
+        key = request.header("Idempotency-Key")
+        if key is None or not self.is_insert(request):
+            return await self.process_request(request, upstream)
+        key = (request.header("Authorization", ""), key)
+        first = self.replies.get(key)
+        if first is not None:
+            response = await asyncio.shield(first)  # The first attempt may still be in flight
+            if response is not None:
+                metrics.inc(IDEMPOTENT_REPLAYS)
+                return HttpResponse(response.start_line, response.headers + [("X-Proxy-Replayed", "true")],
+                                    response.body)
+        future = self.replies[key] = asyncio.get_running_loop().create_future()
+        while len(self.replies) > IDEMPOTENCY_KEYS:
+            self.replies.popitem(last=False)
+        try:
+            response = await self.process_request(request, upstream)
+        except BaseException:
+            self.replies.pop(key, None)
+            future.set_result(None)
+            raise
+        if response.status >= 500:
+            self.replies.pop(key, None)  # Not committed; a retry must go through
+            future.set_result(None)
+        else:
+            # A copy, as handle_client may change the headers of the one it sends
+            future.set_result(HttpResponse(response.start_line, list(response.headers), response.body))
+        return response
+
+    async def process_request(self, request, upstream):
+        rows = parse_rows(request) if self.is_insert(request) else None
+        for device in request_devices(request, rows):
+            metrics.device(device)
+        if not rows:
+            return await self.forward(request, upstream)
+
+        if self.spool is None:
+            if self.coalescer is not None:
+                return await self.coalescer.submit(request, rows)
+            return await self.forward(request, upstream)
+
+        if self.spool.engaged:
+            return self.spool_rows(request, rows)
+        # The send's own connection state, handed back to the client only if it finishes in time
+        connection = dict(upstream)
+        if self.coalescer is not None:
+            sending = asyncio.ensure_future(self.coalescer.submit(request, rows))
+        else:
+            sending = asyncio.ensure_future(self.forward(request, connection))
+        done, _ = await asyncio.wait({sending}, timeout=self.upstream_timeout)
+        if not done:
+            # Not cancelled and not spooled yet: only one of the two may deliver the rows
+            upstream["reader"] = upstream["writer"] = None
+            self.spool.mark_down(f"no response in {self.upstream_timeout:g} s")
+            self.settle_late(sending, request, rows, connection)
+            return make_response(201, extra_headers=[("X-Proxy-Spooled", "pending")])
+        try:
+            response = sending.result()
+        except UPSTREAM_ERRORS as e:
+            if connection["writer"] is not None:
+                connection["writer"].close()  # State unknown after a failure
+            upstream["reader"] = upstream["writer"] = None
+            self.spool.mark_down(str(e) or type(e).__name__)
+            return self.spool_rows(request, rows)
+        upstream.update(connection)
+        if response.status in (502, 503, 504):
+            self.spool.mark_down(f"status {response.status}")
+            return self.spool_rows(request, rows)
+        return response
+
+    async def forward(self, request, upstream):
+        """Forward a request unchanged over the pool, or the client's own upstream connection."""
+        if self.pool is not None:
+            return await self.pool.request(request)
+        if upstream.get("writer") is None:
+            upstream["reader"], upstream["writer"] = await open_upstream(self.target_host, self.target_port)
+        response = await exchange(upstream["reader"], upstream["writer"], request)
+        if not response.keep_alive:
+            upstream["writer"].close()
+            upstream["writer"] = None
+        return response
+
+    async def handle_client(self, reader, writer):
+        hostname, port = writer.get_extra_info("peername")[:2]
+        name = f"{hostname}-{port}"
+        upstream = {"reader": None, "writer": None}
+        metrics.inc(CONNECTIONS_OPENED)
+        print(f"[+] New connection: {hostname}:{port} -> {self.target_host}:{self.target_port} (http)")
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(error_response(e.status, str(e)).serialize())
+                    break
+                if request is None:
+                    break
+                raw = request.serialize()
+                metrics.inc(BYTES_UP, len(raw))
+                self.log(name, UPLOAD, raw)
+
+                try:
+                    response = await self.handle_request(request, upstream)
+                except UPSTREAM_ERRORS as e:
+                    response = error_response(502, f"Upstream error: {e}")
+                    if upstream["writer"] is not None:
+                        upstream["writer"].close()
+                        upstream["writer"] = None
+
+                keep_alive = request.keep_alive and response.keep_alive
+                if not keep_alive:
+                    response.headers = response.without_headers("Connection") + [("Connection", "close")]
+                raw = response.serialize()
+                metrics.inc(BYTES_DOWN, len(raw))
+                metrics.inc(f'proxy_http_requests_total{{status="{response.status}"}}')
+                self.log(name, DOWNLOAD, raw)
+                writer.write(raw)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (OSError, asyncio.IncompleteReadError) as e:
+            print(f"[!] Error handling client {hostname}:{port}: {e}")
+        finally:
+            writer.close()
+            if upstream["writer"] is not None:
+                upstream["writer"].close()
+            if self.capture is not None:
+                self.capture.close_connection(name)
+            metrics.inc(CONNECTIONS_CLOSED)
+            print(f"[-] Closed connection: {hostname}:{port}")
+
+    def stats(self):
+        """Pool, coalescer, spool and token check stats as metric samples; a metrics collector."""
+        samples = {}
+        for prefix, component in (("pool", self.pool), ("coalesce", self.coalescer), ("spool", self.spool),
+                                  ("auth", self.auth)):
+            if component is not None:
+                samples.update(prefixed(prefix, component.stats()))
+        return samples
+
+    async def serve(self, listen_port, backlog, on_started=None, reuse_port=False):
+        server = await asyncio.start_server(
+            self.handle_client, "0.0.0.0", listen_port, backlog=backlog, limit=MAX_HEADER_SIZE,
+            reuse_address=True, reuse_port=reuse_port or None,
+        )
+        if on_started:
+            on_started()
+        tasks = []
+        if self.spool is not None:
+            tasks.append(asyncio.create_task(self.spool.drain(self.send_spooled)))
+        if self.pool is not None:
+            tasks.append(asyncio.create_task(self.pool.check_health()))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.pool is not None:
+                self.pool.close()
@@ -3,16 +3,43 @@
 
 set -e
 
+# Storage policies (.env); an empty value disables compression or retention
+IOTAWATT_CHUNK_INTERVAL="${IOTAWATT_CHUNK_INTERVAL:-7 days}"
+IOTAWATT_COMPRESS_AFTER="${IOTAWATT_COMPRESS_AFTER-7 days}"
+IOTAWATT_RAW_RETENTION="${IOTAWATT_RAW_RETENTION-}"
+
+# Row layout (.env), chosen before the first start:
+#   text        the hypertable $IOTAWATT_TABLE stores device and sensor names in every row
+#   normalized  the hypertable ${IOTAWATT_TABLE}_data stores SMALLINT ids from the
+#               ${IOTAWATT_TABLE}_devices and _sensors lookup tables; $IOTAWATT_TABLE becomes a
+#               view with the names and an INSTEAD OF trigger, so uploads and queries through
+#               PostgREST are unchanged
+IOTAWATT_LAYOUT="${IOTAWATT_LAYOUT:-text}"
+if [ "$IOTAWATT_LAYOUT" = normalized ]; then
+    DATA_TABLE="${IOTAWATT_TABLE}_data"
+    DEVICE_COL=device_id
+    SENSOR_COL=sensor_id
+    SERIES_TYPE=SMALLINT
+elif [ "$IOTAWATT_LAYOUT" = text ]; then
+    DATA_TABLE="$IOTAWATT_TABLE"
+    DEVICE_COL=device
+    SENSOR_COL=sensor
+    SERIES_TYPE=TEXT
+else
+    echo "IOTAWATT_LAYOUT must be text or normalized, not '$IOTAWATT_LAYOUT'" >&2
+    exit 1
+fi
+
 # Run the SQL directly with psql and environment variable substitution
 PGPASSWORD="$POSTGRES_PASSWORD" psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<EOF
 -- Enable TimescaleDB
 CREATE EXTENSION IF NOT EXISTS timescaledb;
 
--- Create the $IOTAWATT_TABLE table
-    CREATE TABLE IF NOT EXISTS $IOTAWATT_SCHEMA.$IOTAWATT_TABLE (
+-- Create the $DATA_TABLE table
+    CREATE TABLE IF NOT EXISTS $IOTAWATT_SCHEMA.$DATA_TABLE (
     timestamp TIMESTAMPTZ NOT NULL,
-    device TEXT NOT NULL,
-    sensor TEXT NOT NULL,
+    $DEVICE_COL $SERIES_TYPE NOT NULL,
+    $SENSOR_COL $SERIES_TYPE NOT NULL,
     "Watts" DOUBLE PRECISION,
     "Volts" DOUBLE PRECISION,
     "Amps" DOUBLE PRECISION,
@@ -24,8 +51,38 @@ CREATE EXTENSION IF NOT EXISTS timescaledb;
     "VARh" DOUBLE PRECISION
     );
 
--- Create Timescale hypertable
-SELECT create_hypertable('$IOTAWATT_SCHEMA.$IOTAWATT_TABLE', 'timestamp', if_not_exists => TRUE);
+-- Create Timescale hypertable. Size chunks so the most recent one with its indexes fits
+-- in about a quarter of the server's memory; a changed interval applies to new chunks.
+SELECT create_hypertable('$IOTAWATT_SCHEMA.$DATA_TABLE', 'timestamp',
+    chunk_time_interval => INTERVAL '$IOTAWATT_CHUNK_INTERVAL', if_not_exists => TRUE);
+SELECT set_chunk_time_interval('$IOTAWATT_SCHEMA.$DATA_TABLE', INTERVAL '$IOTAWATT_CHUNK_INTERVAL');
+
+-- Columnar compression: one compressed batch per (device, sensor) series, ordered by time,
+-- so per-device range queries decompress only their own series. Chunks older than
+-- IOTAWATT_COMPRESS_AFTER are compressed by a background policy; they stay writable.
+-- IOTAWATT_RAW_RETENTION drops raw chunks older than that; keep it well above the
+-- rollups' refresh windows (7 days) so the continuous aggregates keep the history.
+-- The policies follow .env each time this script runs.
+DO \$\$
+BEGIN
+    IF NOT (SELECT compression_enabled FROM timescaledb_information.hypertables
+            WHERE hypertable_schema = '$IOTAWATT_SCHEMA' AND hypertable_name = '$DATA_TABLE') THEN
+        ALTER TABLE $IOTAWATT_SCHEMA.$DATA_TABLE SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = '$DEVICE_COL, $SENSOR_COL',
+            timescaledb.compress_orderby = 'timestamp DESC'
+        );
+    END IF;
+    PERFORM remove_compression_policy('$IOTAWATT_SCHEMA.$DATA_TABLE', if_exists => TRUE);
+    IF '$IOTAWATT_COMPRESS_AFTER' <> '' THEN
+        PERFORM add_compression_policy('$IOTAWATT_SCHEMA.$DATA_TABLE', INTERVAL '$IOTAWATT_COMPRESS_AFTER');
+    END IF;
+    PERFORM remove_retention_policy('$IOTAWATT_SCHEMA.$DATA_TABLE', if_exists => TRUE);
+    IF '$IOTAWATT_RAW_RETENTION' <> '' THEN
+        PERFORM add_retention_policy('$IOTAWATT_SCHEMA.$DATA_TABLE', INTERVAL '$IOTAWATT_RAW_RETENTION');
+    END IF;
+END
+\$\$;
 
 -- Reader has read-only access direct to SQL AND via PostgREST
 -- Typically we write to DB via PostgREST using the writer role
@@ -64,11 +121,263 @@ GRANT $PG_READER_USER TO $PGRST_DB_USER;
 
 -- Grant access to iotawatt table
 GRANT USAGE ON SCHEMA $IOTAWATT_SCHEMA TO $PG_READER_USER, $PG_WRITER_USER;
-GRANT SELECT ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE TO $PG_READER_USER;
-GRANT SELECT, INSERT, UPDATE, DELETE ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE TO $PG_WRITER_USER;
+GRANT SELECT ON $IOTAWATT_SCHEMA.$DATA_TABLE TO $PG_READER_USER;
+GRANT SELECT, INSERT, UPDATE, DELETE ON $IOTAWATT_SCHEMA.$DATA_TABLE TO $PG_WRITER_USER;
 
 
 -- Create performance indexes
-CREATE INDEX IF NOT EXISTS idx_iotawatt_timestamp ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE (timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_iotawatt_device_timestamp ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE (device, timestamp DESC);
-EOF
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_iotawatt_timestamp ON $IOTAWATT_SCHEMA.$DATA_TABLE (timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_iotawatt_device_timestamp ON $IOTAWATT_SCHEMA.$DATA_TABLE ($DEVICE_COL, timestamp DESC);
+
+-- Table statistics for show_db.py, as the PostgREST RPC /rpc/${IOTAWATT_TABLE}_stats.
+-- Computed from catalog and chunk metadata, so it answers in milliseconds at any size:
+-- the row count comes from approximate_row_count(), distinct devices and sensors from
+-- the planner statistics of the hypertable and its chunks, first/last timestamps from
+-- the timestamp index. Falls back to exact counts while the table was never analyzed.
+-- ?exact=true counts everything exactly, which scans the whole table.
+CREATE OR REPLACE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_stats(exact BOOLEAN DEFAULT FALSE)
+RETURNS JSON
+LANGUAGE plpgsql STABLE
+AS \$\$
+DECLARE
+    total BIGINT;
+    devices BIGINT;
+    sensors BIGINT;
+    approximate BOOLEAN := NOT exact;
+BEGIN
+    IF exact THEN
+        SELECT count(*), count(DISTINCT $DEVICE_COL), count(DISTINCT $SENSOR_COL)
+        INTO total, devices, sensors
+        FROM $IOTAWATT_SCHEMA.$DATA_TABLE;
+    ELSE
+        total := approximate_row_count('$IOTAWATT_SCHEMA.$DATA_TABLE');
+        -- n_distinct < 0 is a fraction of the rows; take the widest estimate over the chunks
+        SELECT max(CASE WHEN s.attname = '$DEVICE_COL' THEN
+                   CASE WHEN s.n_distinct < 0 THEN -s.n_distinct * greatest(c.reltuples, 0) ELSE s.n_distinct END END),
+               max(CASE WHEN s.attname = '$SENSOR_COL' THEN
+                   CASE WHEN s.n_distinct < 0 THEN -s.n_distinct * greatest(c.reltuples, 0) ELSE s.n_distinct END END)
+        INTO devices, sensors
+        FROM pg_stats s
+        JOIN pg_namespace n ON n.nspname = s.schemaname
+        JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+        WHERE s.attname IN ('$DEVICE_COL', '$SENSOR_COL')
+          AND (s.schemaname, s.tablename) IN (
+              SELECT '$IOTAWATT_SCHEMA', '$DATA_TABLE'
+              UNION ALL
+              SELECT chunk_schema, chunk_name FROM timescaledb_information.chunks
+              WHERE hypertable_schema = '$IOTAWATT_SCHEMA' AND hypertable_name = '$DATA_TABLE'
+          );
+        IF coalesce(total, 0) = 0 OR devices IS NULL OR sensors IS NULL THEN
+            -- Not analyzed yet, so the table is new and small enough to count
+            SELECT count(*), count(DISTINCT $DEVICE_COL), count(DISTINCT $SENSOR_COL)
+            INTO total, devices, sensors
+            FROM $IOTAWATT_SCHEMA.$DATA_TABLE;
+            approximate := FALSE;
+        END IF;
+    END IF;
+
+    RETURN json_build_object(
+        'total_count', total,
+        'unique_devices', devices,
+        'unique_sensors', sensors,
+        'approximate', approximate,
+        'min_date', (SELECT timestamp FROM $IOTAWATT_SCHEMA.$DATA_TABLE ORDER BY timestamp ASC LIMIT 1),
+        'max_date', (SELECT timestamp FROM $IOTAWATT_SCHEMA.$DATA_TABLE ORDER BY timestamp DESC LIMIT 1),
+        'chunks', (SELECT count(*) FROM timescaledb_information.chunks
+                   WHERE hypertable_schema = '$IOTAWATT_SCHEMA' AND hypertable_name = '$DATA_TABLE'),
+        'total_bytes', hypertable_size('$IOTAWATT_SCHEMA.$DATA_TABLE')
+    );
+END
+\$\$;
+
+GRANT EXECUTE ON FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_stats(BOOLEAN) TO $PG_READER_USER, $PG_WRITER_USER;
+
+-- Rollups: hierarchical continuous aggregates of the raw table at 1 minute, 15 minutes,
+-- 1 hour and 1 day, each built from the next finer one. Exposed by PostgREST as
+-- /${IOTAWATT_TABLE}_1m, _15m, _1h and _1d (in the normalized layout, views that add the
+-- names); the bucket start is in "timestamp" so they are queried like the raw table.
+-- watts_avg is weighted by samples (readings with Watts) so it stays exact when rolled
+-- up. Real-time aggregation (materialized_only = false) adds the not yet materialized
+-- tail at query time. show_db.py picks the coarsest rollup that fits a query's range
+-- and resolution.
+CREATE MATERIALIZED VIEW IF NOT EXISTS $IOTAWATT_SCHEMA.${DATA_TABLE}_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket('1 minute', timestamp) AS timestamp, $DEVICE_COL, $SENSOR_COL,
+       count("Watts") AS samples,
+       avg("Watts") AS watts_avg,
+       min("Watts") AS watts_min,
+       max("Watts") AS watts_max,
+       sum("Wh") AS wh
+FROM $IOTAWATT_SCHEMA.$DATA_TABLE
+GROUP BY time_bucket('1 minute', timestamp), $DEVICE_COL, $SENSOR_COL
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS $IOTAWATT_SCHEMA.${DATA_TABLE}_15m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket('15 minutes', timestamp) AS timestamp, $DEVICE_COL, $SENSOR_COL,
+       sum(samples) AS samples,
+       sum(watts_avg * samples) / NULLIF(sum(samples), 0) AS watts_avg,
+       min(watts_min) AS watts_min,
+       max(watts_max) AS watts_max,
+       sum(wh) AS wh
+FROM $IOTAWATT_SCHEMA.${DATA_TABLE}_1m
+GROUP BY time_bucket('15 minutes', timestamp), $DEVICE_COL, $SENSOR_COL
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS $IOTAWATT_SCHEMA.${DATA_TABLE}_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket('1 hour', timestamp) AS timestamp, $DEVICE_COL, $SENSOR_COL,
+       sum(samples) AS samples,
+       sum(watts_avg * samples) / NULLIF(sum(samples), 0) AS watts_avg,
+       min(watts_min) AS watts_min,
+       max(watts_max) AS watts_max,
+       sum(wh) AS wh
+FROM $IOTAWATT_SCHEMA.${DATA_TABLE}_15m
+GROUP BY time_bucket('1 hour', timestamp), $DEVICE_COL, $SENSOR_COL
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS $IOTAWATT_SCHEMA.${DATA_TABLE}_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket('1 day', timestamp) AS timestamp, $DEVICE_COL, $SENSOR_COL,
+       sum(samples) AS samples,
+       sum(watts_avg * samples) / NULLIF(sum(samples), 0) AS watts_avg,
+       min(watts_min) AS watts_min,
+       max(watts_max) AS watts_max,
+       sum(wh) AS wh
+FROM $IOTAWATT_SCHEMA.${DATA_TABLE}_1h
+GROUP BY time_bucket('1 day', timestamp), $DEVICE_COL, $SENSOR_COL
+WITH NO DATA;
+
+-- Each level refreshes a window a few buckets deep behind the level below it;
+-- history loaded later (backfill.py) is refreshed explicitly by the loader
+SELECT add_continuous_aggregate_policy('$IOTAWATT_SCHEMA.${DATA_TABLE}_1m',
+    start_offset => INTERVAL '2 hours', end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('$IOTAWATT_SCHEMA.${DATA_TABLE}_15m',
+    start_offset => INTERVAL '1 day', end_offset => INTERVAL '15 minutes',
+    schedule_interval => INTERVAL '15 minutes', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('$IOTAWATT_SCHEMA.${DATA_TABLE}_1h',
+    start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes', if_not_exists => TRUE);
+SELECT add_continuous_aggregate_policy('$IOTAWATT_SCHEMA.${DATA_TABLE}_1d',
+    start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',
+    schedule_interval => INTERVAL '1 hour', if_not_exists => TRUE);
+
+GRANT SELECT ON $IOTAWATT_SCHEMA.${DATA_TABLE}_1m, $IOTAWATT_SCHEMA.${DATA_TABLE}_15m,
+    $IOTAWATT_SCHEMA.${DATA_TABLE}_1h, $IOTAWATT_SCHEMA.${DATA_TABLE}_1d
+    TO $PG_READER_USER, $PG_WRITER_USER;
+
+-- Let a running PostgREST pick up new functions
+NOTIFY pgrst, 'reload schema';
+EOF
+
+# Normalized layout: lookup tables, the $IOTAWATT_TABLE view and its triggers, and views
+# with names over the rollups
+if [ "$IOTAWATT_LAYOUT" = normalized ]; then
+    ROLLUP_VIEWS=""
+    for suffix in 1m 15m 1h 1d; do
+        ROLLUP_VIEWS+="
+CREATE OR REPLACE VIEW $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_$suffix AS
+SELECT r.timestamp, d.name AS device, s.name AS sensor, r.samples, r.watts_avg, r.watts_min, r.watts_max, r.wh
+FROM $IOTAWATT_SCHEMA.${DATA_TABLE}_$suffix r
+JOIN $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_devices d ON d.id = r.device_id
+JOIN $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_sensors s ON s.id = r.sensor_id;
+GRANT SELECT ON $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_$suffix TO $PG_READER_USER, $PG_WRITER_USER;
+"
+    done
+
+    PGPASSWORD="$POSTGRES_PASSWORD" psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<EOF
+CREATE TABLE IF NOT EXISTS $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_devices (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_sensors (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- Id of a device or sensor name (kind 'devices' or 'sensors'), added on first use.
+-- Ids never change, so each connection caches them in custom settings named
+-- iotawatt_ids.<kind>_<md5 of name>: after a connection has seen a name once, an insert
+-- costs no lookup. A rolled back insert rolls its setting back with it.
+CREATE OR REPLACE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_lookup_id(kind TEXT, lookup_name TEXT)
+RETURNS SMALLINT
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog, pg_temp
+AS \$\$
+DECLARE
+    setting TEXT := 'iotawatt_ids.' || kind || '_' || md5(lookup_name);
+    id_value SMALLINT := nullif(current_setting(setting, true), '')::SMALLINT;
+BEGIN
+    IF id_value IS NULL THEN
+        IF kind NOT IN ('devices', 'sensors') THEN
+            RAISE EXCEPTION 'Unknown lookup kind %', kind;
+        END IF;
+        EXECUTE format('SELECT id FROM %I.%I WHERE name = \$1', '$IOTAWATT_SCHEMA', '${IOTAWATT_TABLE}_' || kind)
+            INTO id_value USING lookup_name;
+        IF id_value IS NULL THEN
+            -- DO UPDATE rather than DO NOTHING so a concurrently added name still returns its id
+            EXECUTE format('INSERT INTO %I.%I (name) VALUES (\$1) '
+                           'ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id',
+                           '$IOTAWATT_SCHEMA', '${IOTAWATT_TABLE}_' || kind)
+                INTO id_value USING lookup_name;
+        END IF;
+        PERFORM set_config(setting, id_value::TEXT, false);
+    END IF;
+    RETURN id_value;
+END
+\$\$;
+
+-- SECURITY DEFINER and in the exposed schema: only the writer (the role the INSTEAD OF
+-- trigger runs as) may call it, or anon could fill the lookups via /rpc and use up the ids
+REVOKE EXECUTE ON FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_lookup_id(TEXT, TEXT) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_lookup_id(TEXT, TEXT) TO $PG_WRITER_USER;
+
+CREATE OR REPLACE VIEW $IOTAWATT_SCHEMA.$IOTAWATT_TABLE AS
+SELECT r.timestamp, d.name AS device, s.name AS sensor,
+       r."Watts", r."Volts", r."Amps", r."VA", r."Wh", r."PF", r."Hz", r."VAR", r."VARh"
+FROM $IOTAWATT_SCHEMA.$DATA_TABLE r
+JOIN $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_devices d ON d.id = r.device_id
+JOIN $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_sensors s ON s.id = r.sensor_id;
+
+CREATE OR REPLACE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS \$\$
+BEGIN
+    INSERT INTO $IOTAWATT_SCHEMA.$DATA_TABLE VALUES (
+        NEW.timestamp,
+        $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_lookup_id('devices', NEW.device),
+        $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_lookup_id('sensors', NEW.sensor),
+        NEW."Watts", NEW."Volts", NEW."Amps", NEW."VA", NEW."Wh", NEW."PF", NEW."Hz", NEW."VAR", NEW."VARh"
+    );
+    RETURN NEW;
+END
+\$\$;
+
+CREATE OR REPLACE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS \$\$
+BEGIN
+    DELETE FROM $IOTAWATT_SCHEMA.$DATA_TABLE
+    WHERE timestamp = OLD.timestamp
+      AND device_id = (SELECT id FROM $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_devices WHERE name = OLD.device)
+      AND sensor_id = (SELECT id FROM $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_sensors WHERE name = OLD.sensor);
+    RETURN OLD;
+END
+\$\$;
+
+CREATE OR REPLACE TRIGGER ${IOTAWATT_TABLE}_insert
+    INSTEAD OF INSERT ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE
+    FOR EACH ROW EXECUTE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_insert();
+CREATE OR REPLACE TRIGGER ${IOTAWATT_TABLE}_delete
+    INSTEAD OF DELETE ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE
+    FOR EACH ROW EXECUTE FUNCTION $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_delete();
+
+GRANT SELECT ON $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_devices, $IOTAWATT_SCHEMA.${IOTAWATT_TABLE}_sensors,
+    $IOTAWATT_SCHEMA.$IOTAWATT_TABLE TO $PG_READER_USER, $PG_WRITER_USER;
+GRANT INSERT, DELETE ON $IOTAWATT_SCHEMA.$IOTAWATT_TABLE TO $PG_WRITER_USER;
+$ROLLUP_VIEWS
+NOTIFY pgrst, 'reload schema';
+EOF
+fi
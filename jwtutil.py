@@ -4,13 +4,22 @@ JWT Token Generator for PostgREST API Authentication
 
 The tokens can be used to access the iotawatt data with different permission levels.
 
+Tokens are signed (HS256) with hmac from the standard library; PyJWT is
+only imported to verify them, and PGRST_JWT_SECRET is only checked when a
+token is signed or verified, so `roles`, `example` and --help start fast.
 """
 
+import base64
+import csv
+import hashlib
+import hmac
 import os
-import jwt
+import sys
+import threading
+import time
 import json
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional
 import typer
 
 
@@ -20,15 +29,11 @@ ROLE_CLAIM_KEY = os.environ.get("PGRST_ROLE_CLAIM_KEY", ".role").replace(".", ""
 POSTGREST_PORT = os.environ.get("POSTGREST_EXTERNAL_PORT", "3000")
 PG_READER_USER = os.environ.get("PG_READER_USER", "reader")
 PG_WRITER_USER = os.environ.get("PG_WRITER_USER", "writer")
+ISSUER = "iotawatt-jwt-generator"
+REFRESH_MARGIN = 300  # Seconds before exp at which a cached token is replaced
 
 app = typer.Typer(help="JWT Token Generator for PostgREST API")
 
-# Validate that JWT_SECRET is loaded
-if not JWT_SECRET:
-    print("Error: PGRST_JWT_SECRET not found in .env file!")
-    print("Please ensure your .env file contains a valid JWT secret.")
-    raise typer.Exit(1)
-
 # Available roles from init.sql
 ROLES = {
     "anon": {
@@ -46,6 +51,15 @@ ROLES = {
 }
 
 
+def jwt_secret() -> str:
+    """PGRST_JWT_SECRET; exits with an error if it is not set."""
+    if not JWT_SECRET:
+        print("Error: PGRST_JWT_SECRET not found in .env file!", file=sys.stderr)
+        print("Please ensure your .env file contains a valid JWT secret.", file=sys.stderr)
+        raise typer.Exit(1)
+    return JWT_SECRET
+
+
 def generate_jwt_token(
     role: str,
     exp_hours: Optional[int] = None,
@@ -60,7 +74,7 @@ def generate_jwt_token(
     payload = {
         "role": role,
         "iat": int(now.timestamp()),
-        "iss": "iotawatt-jwt-generator",
+        "iss": ISSUER,
     }
 
     if exp_hours is not None:
@@ -70,13 +84,75 @@ def generate_jwt_token(
     if additional_claims:
         payload.update(additional_claims)
 
-    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+    return sign_hs256(payload)
+
+
+_token_cache = {}  # (role, exp_hours, claims) -> (token, refresh at)
+_token_cache_lock = threading.Lock()
+
+
+def cached_jwt_token(
+    role: str,
+    exp_hours: Optional[int] = None,
+    additional_claims: Optional[dict] = None,
+) -> str:
+    """
+    Like generate_jwt_token, but reuse the token minted for the same role and
+    claims until shortly before it expires.
+    """
+    key = (role, exp_hours, json.dumps(additional_claims, sort_keys=True, default=str))
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None and now < cached[1]:
+            return cached[0]
+        token = generate_jwt_token(role, exp_hours, additional_claims)
+        lifetime = exp_hours * 3600 if exp_hours is not None else float("inf")
+        _token_cache[key] = (token, now + lifetime - min(REFRESH_MARGIN, lifetime / 10))
+        return token
+
+
+def b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+JWT_HEADER = b64url(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+
+def sign_hs256(claims: dict, signer=None) -> str:
+    """Encode claims as an HS256 JWT, the same token jwt.encode(claims, secret, "HS256") makes."""
+    if signer is None:
+        signer = hmac.new(jwt_secret().encode(), digestmod=hashlib.sha256)
+    payload = b64url(json.dumps(claims, separators=(",", ":"), default=str).encode())
+    signing_input = JWT_HEADER + b"." + payload
+    mac = signer.copy()
+    mac.update(signing_input)
+    return (signing_input + b"." + b64url(mac.digest())).decode()
 
 
-def decode_jwt_token(token: str) -> dict:
-    """Decode and verify a JWT token."""
+def mint_device_tokens(role: str, devices: List[str], exp_hours: Optional[int] = None):
+    """
+    Yield (device, token) with a `device` claim for each device.
+
+    The keyed hash is set up once and copied for every token.
+    """
+    if role not in ROLES:
+        raise typer.BadParameter(f"Invalid role '{role}'. Available roles: {list(ROLES.keys())}")
+    now = int(time.time())
+    claims = {"role": role, "iat": now, "iss": ISSUER}
+    if exp_hours is not None:
+        claims["exp"] = now + exp_hours * 3600
+    signer = hmac.new(jwt_secret().encode(), digestmod=hashlib.sha256)
+    for device in devices:
+        yield device, sign_hs256({**claims, "device": device}, signer)
+
+
+def decode_jwt_token(token: str, verify_exp: bool = True) -> dict:
+    """Decode and verify a JWT token; verify_exp=False accepts an expired one."""
+    import jwt  # PyJWT takes longer to import than the rest of this module
+
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        return jwt.decode(token, jwt_secret(), algorithms=["HS256"], options={"verify_exp": verify_exp})
     except jwt.ExpiredSignatureError:
         raise typer.BadParameter("Token has expired")
     except jwt.InvalidTokenError as e:
@@ -138,7 +214,7 @@ def example():
 
 @app.command()
 def generate(
-    role: str = typer.Argument(..., help="Database role (writer, reader, anon)"),
+    roles: List[str] = typer.Argument(..., help="Database role(s) (writer, reader, anon), one token per line"),
     hours: Optional[int] = typer.Option(None, "--hours", "-h", help="Token expiration in hours"),
     no_expiry: bool = typer.Option(False, "--no-expiry", help="Create token with no expiration"),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Enable verbose output"),
@@ -146,15 +222,51 @@ def generate(
     """Generate a JWT token for PostgREST authentication."""
     exp_hours = None if no_expiry else (hours or 24)
 
-    token = generate_jwt_token(role, exp_hours)
+    for role in roles:
+        token = generate_jwt_token(role, exp_hours)
 
-    print(token)
-    
+        print(token)
+
+        if verbose:
+            print(f"\nGenerated token for role: {role}", file=sys.stderr)
     if verbose:
-        print(f"\nGenerated token for role: {role}", file=__import__('sys').stderr)
         if exp_hours:
-            print(f"Token expires in: {exp_hours} hours", file=__import__('sys').stderr)
+            print(f"Token expires in: {exp_hours} hours", file=sys.stderr)
         else:
-            print("Token has no expiration", file=__import__('sys').stderr)
+            print("Token has no expiration", file=sys.stderr)
+
+
+@app.command("generate-batch")
+def generate_batch(
+    devices_file: Optional[str] = typer.Argument(None, help="File with one device name per line ('-' for stdin)"),
+    prefix: str = typer.Option("iotawatt-", "--prefix", help="Device name prefix when generating names"),
+    count: int = typer.Option(0, "--count", "-n", help="Generate names <prefix>0001..<prefix>N instead of a file"),
+    role: str = typer.Option(PG_WRITER_USER, "--role", "-r", help="Database role of the tokens"),
+    hours: Optional[int] = typer.Option(None, "--hours", "-h", help="Token expiration in hours (default: none)"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write device,token CSV here instead of stdout"),
+):
+    """Mint one token per device, with a `device` claim, for provisioning a fleet."""
+    if devices_file is not None:
+        source = sys.stdin if devices_file == "-" else open(devices_file)
+        with source:
+            devices = [line.strip() for line in source if line.strip()]
+    elif count > 0:
+        devices = [f"{prefix}{i:04d}" for i in range(1, count + 1)]
+    else:
+        raise typer.BadParameter("Give a devices file or --count")
+
+    started = time.perf_counter()
+    out = sys.stdout if output is None else open(output, "w")
+    try:
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["device", "token"])
+        writer.writerows(mint_device_tokens(role, devices, hours))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Minted {len(devices)} {role} tokens in {elapsed:.2f} s", file=sys.stderr)
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Live metrics for proxy.py: Prometheus text on an admin port, and on SIGUSR1.
+
+Relay code only touches a per-thread shard (a plain dict reached through a
+threading.local), so counting takes no lock on the hot path. Shards are
+merged on scrape; shards of finished threads are folded into a retired
+total. Component stats (pool, coalescer, spool, capture) are pulled from
+collectors at scrape time.
+
+A snapshot is a flat {sample: value} dict such as
+{'proxy_bytes_total{direction="upload"}': 1234}, so snapshots of --workers
+processes can be summed by the supervisor and rendered the same way.
+"""
+
+import signal
+import sys
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_DEVICES = 10000  # Distinct device label values before the rest count as "other"
+
+CONNECTIONS_OPENED = "proxy_connections_total"
+CONNECTIONS_CLOSED = "proxy_connections_closed_total"
+BYTES_UP = 'proxy_bytes_total{direction="upload"}'
+BYTES_DOWN = 'proxy_bytes_total{direction="download"}'
+RELAY_ERRORS_UP = 'proxy_relay_errors_total{direction="upload"}'
+RELAY_ERRORS_DOWN = 'proxy_relay_errors_total{direction="download"}'
+UPSTREAM_CONNECT_ERRORS = "proxy_upstream_connect_errors_total"
+UPSTREAM_CONNECT_SECONDS = "proxy_upstream_connect_seconds"
+TTFB_SECONDS = "proxy_ttfb_seconds"
+IDEMPOTENT_REPLAYS = "proxy_idempotent_replays_total"
+AUTH_REJECTED = "proxy_auth_rejected_total"
+
+HISTOGRAMS = {
+    UPSTREAM_CONNECT_SECONDS: "Time to open a TCP connection to the target",
+    TTFB_SECONDS: "Time from forwarding a request to the first response byte from the target",
+}
+HELP = {
+    "proxy_connections_total": "Client connections accepted",
+    "proxy_connections_active": "Client connections currently open",
+    "proxy_bytes_total": "Bytes relayed, by direction",
+    "proxy_relay_errors_total": "Relays that ended with an error, by direction",
+    "proxy_upstream_connect_errors_total": "Failed connection attempts to the target",
+    "proxy_http_requests_total": "HTTP requests answered, by status (http engine)",
+    "proxy_device_requests_total": "HTTP requests per IoTaWatt device (http engine)",
+    "proxy_idempotent_replays_total": "Retried inserts answered with the response of the first attempt",
+    "proxy_auth_rejected_total": "Requests refused by the proxy's token check, by status: 401 token, 429 rate limit",
+    **HISTOGRAMS,
+}
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Per-process registry of lock-free per-thread counters and histograms."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # (thread, shard)
+        self._retired = {}
+        self._lock = threading.RLock()  # Taken when a thread first counts and on scrape; SIGUSR1 may re-enter
+        self._devices = set()
+        self.collectors = []  # callables returning {sample: value}, called on scrape
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def inc(self, key, value=1):
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        """Add an observation to a histogram in HISTOGRAMS."""
+        shard = self._shard()
+        key = (name, bisect_left(LATENCY_BUCKETS, seconds))
+        shard[key] = shard.get(key, 0) + 1
+        key = (name, "sum")
+        shard[key] = shard.get(key, 0) + seconds
+
+    def device(self, device):
+        """Count one request from a device, bounding the number of label values."""
+        if device not in self._devices:
+            if len(self._devices) >= MAX_DEVICES:
+                device = "other"
+            self._devices.add(device)
+        self.inc(f'proxy_device_requests_total{{device="{label_value(device)}"}}')
+
+    def _merged(self):
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                    continue
+                # A finished thread never writes again; fold its shard once
+                for key, value in shard.items():
+                    self._retired[key] = self._retired.get(key, 0) + value
+            self._shards = alive
+            merged = dict(self._retired)
+            for _, shard in alive:
+                # dict() copies under the GIL, so the owning thread may keep counting
+                for key, value in dict(shard).items():
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def snapshot(self):
+        """Return all samples of this process as a flat {sample: value} dict."""
+        merged = self._merged()
+        samples = {}
+        opened = merged.pop(CONNECTIONS_OPENED, 0)
+        samples[CONNECTIONS_OPENED] = opened
+        samples["proxy_connections_active"] = opened - merged.pop(CONNECTIONS_CLOSED, 0)
+        for name in HISTOGRAMS:
+            count = 0
+            for i, bound in enumerate(LATENCY_BUCKETS + (float("inf"),)):
+                count += merged.pop((name, i), 0)
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples[f'{name}_bucket{{le="{le}"}}'] = count
+            samples[f"{name}_sum"] = merged.pop((name, "sum"), 0.0)
+            samples[f"{name}_count"] = count
+        samples.update(sorted(merged.items()))
+        for collect in self.collectors:
+            samples.update(collect())
+        return samples
+
+
+def prefixed(prefix, stats):
+    """Turn a component's stats() dict into samples, e.g. pool requests_total -> proxy_pool_requests_total."""
+    return {f"proxy_{prefix}_{key}": float(value) for key, value in stats.items()}
+
+
+def family(sample):
+    name = sample.split("{")[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in HISTOGRAMS:
+            return name[:-len(suffix)]
+    return name
+
+
+def is_counter(sample):
+    """Counters and histogram samples only grow; gauges do not survive their process."""
+    name = family(sample)
+    return name.endswith("_total") or name in HISTOGRAMS
+
+
+def render(samples):
+    """Render a snapshot in the Prometheus text exposition format."""
+    families = {}
+    for sample, value in samples.items():
+        families.setdefault(family(sample), []).append((sample, value))
+    lines = []
+    for name, entries in families.items():
+        if name in HISTOGRAMS:
+            kind = "histogram"
+        elif name.endswith("_total"):
+            kind = "counter"
+        else:
+            kind = "gauge"
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample, value in entries:
+            lines.append(f"{sample} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def install_dump_handler(snapshot_fn):
+    """Print render(snapshot_fn()) to stderr on SIGUSR1."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def dump(signum, frame):
+        sys.stderr.write(render(snapshot_fn()))
+        sys.stderr.flush()
+
+    signal.signal(signal.SIGUSR1, dump)
+
+
+class AdminHandler(BaseHTTPRequestHandler):
+    timeout = 5
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404, "Try /metrics")
+            return
+        body = render(self.server.snapshot_fn()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_admin(port, snapshot_fn):
+    """Serve GET /metrics on port from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), AdminHandler)
+    server.daemon_threads = True
+    server.snapshot_fn = snapshot_fn
+    threading.Thread(target=server.serve_forever, name="admin", daemon=True).start()
+    return server
+
+
+def admin_server(port, snapshot_fn):
+    """An admin server without threads, for a select() loop: call handle_request() when readable."""
+    server = HTTPServer(("0.0.0.0", port), AdminHandler)
+    server.snapshot_fn = snapshot_fn
+    return server
+
+
+metrics = Metrics()
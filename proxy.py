@@ -2,57 +2,262 @@
 """
 Port forwarding proxy with per-client logging.
 Logs each client connection to a separate file: <hostname>-<port>.txt
+
+Three engines are available:
+  threads  - one thread per client plus two relay threads (default)
+  asyncio  - single-process event loop, scales to thousands of connections
+  http     - event loop that parses HTTP requests, see http_proxy.py;
+             --coalesce merges IoTaWatt row inserts into bulk inserts,
+             --spool-dir rides out upstream outages (spool.py),
+             --verify-jwt rejects bad tokens locally (auth.py)
+
+When payloads are not logged (--log bytes / --log off) the threads engine
+relays through a fast path: os.splice() via a pipe on Linux, otherwise a
+preallocated recv_into() buffer. See benchmarks/relay.py.
+
+Log records are written off the relay path by capture.CaptureWriter, as
+per-client text files or one indexed binary capture (--capture-format
+binary) that `capture.py replay` can re-send to a staging target.
+
+With --workers N, a supervisor (workers.py) forks N copies of the chosen
+engine sharing the listen port through SO_REUSEPORT, to use more than one core.
+
+Counters and latency histograms (metrics.py) are served in Prometheus format
+on --admin-port and printed to stderr on SIGUSR1.
 """
 
+import asyncio
+import os
 import socket
 import threading
-import sys
-from datetime import datetime
+import time
+from enum import Enum
+from typing import List
 import typer
 
+from auth import DEFAULT_TOKEN_CACHE, RateLimiter, TokenVerifier, parse_rate_limits
+from capture import DEFAULT_QUEUE_SIZE, DOWNLOAD, UPLOAD, CaptureFormat, CaptureWriter, Compression, Overflow
+from http_proxy import (
+    DEFAULT_COALESCE_MS,
+    DEFAULT_COALESCE_ROWS,
+    DEFAULT_POOL_HEALTH_INTERVAL,
+    DEFAULT_POOL_IDLE_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TABLE,
+    DEFAULT_UPSTREAM_TIMEOUT,
+    HttpProxy,
+    UpstreamPool,
+    open_upstream,
+)
+from jwtutil import JWT_SECRET
+from metrics import (
+    BYTES_DOWN,
+    BYTES_UP,
+    CONNECTIONS_CLOSED,
+    CONNECTIONS_OPENED,
+    RELAY_ERRORS_DOWN,
+    RELAY_ERRORS_UP,
+    TTFB_SECONDS,
+    UPSTREAM_CONNECT_ERRORS,
+    UPSTREAM_CONNECT_SECONDS,
+    install_dump_handler,
+    metrics,
+    prefixed,
+    start_admin,
+)
+from spool import DEFAULT_DRAIN_RATE, DEFAULT_DRAIN_ROWS, Spool
+from workers import DEFAULT_STATS_INTERVAL, Supervisor, reuse_port_supported
+
+
+DEFAULT_BACKLOG = 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+COPY_CHUNK_SIZE = 4096
+FAST_CHUNK_SIZE = 1024 * 1024
+
+
+class Engine(str, Enum):
+    threads = "threads"
+    asyncio = "asyncio"
+    http = "http"
+
+
+class LogMode(str, Enum):
+    payload = "payload"
+    bytes = "bytes"
+    off = "off"
+
+
+class RelayMode(str, Enum):
+    auto = "auto"
+    copy = "copy"
+    buffer = "buffer"
+    splice = "splice"
+
+
+def relay_copy(src, dst, on_data=None, chunk_size=COPY_CHUNK_SIZE):
+    """Relay by copying each chunk through Python; on_data(data) sees every chunk."""
+    while True:
+        data = src.recv(chunk_size)
+        if not data:
+            break
+        if on_data:
+            on_data(data)
+        dst.sendall(data)
+
+
+def relay_buffer(src, dst, on_count=None, chunk_size=FAST_CHUNK_SIZE):
+    """Relay through one preallocated buffer; on_count(n) sees every chunk size."""
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        n = src.recv_into(buf)
+        if not n:
+            break
+        if on_count:
+            on_count(n)
+        dst.sendall(view[:n])
+
+
+def relay_splice(src, dst, on_count=None, chunk_size=FAST_CHUNK_SIZE):
+    """Relay socket to socket through a kernel pipe with os.splice (Linux only)."""
+    pipe_r, pipe_w = os.pipe()
+    try:
+        try:
+            import fcntl
+
+            fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, chunk_size)
+        except (ImportError, AttributeError, OSError):
+            pass  # Default pipe size still works, just moves less per call
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        while True:
+            n = os.splice(src_fd, pipe_w, chunk_size, flags=os.SPLICE_F_MOVE)
+            if not n:
+                break
+            if on_count:
+                on_count(n)
+            pending = n
+            while pending:
+                pending -= os.splice(pipe_r, dst_fd, pending, flags=os.SPLICE_F_MOVE)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+
+def select_relay(relay_mode, log_mode):
+    """Pick the relay function; fast paths are only possible when payloads are not logged."""
+    if relay_mode == RelayMode.auto:
+        if log_mode == LogMode.payload:
+            relay_mode = RelayMode.copy
+        elif hasattr(os, "splice"):
+            relay_mode = RelayMode.splice
+        else:
+            relay_mode = RelayMode.buffer
+    if relay_mode != RelayMode.copy and log_mode == LogMode.payload:
+        raise ValueError(f"relay mode '{relay_mode.value}' cannot log payloads, use --log bytes or --log off")
+    if relay_mode == RelayMode.splice and not hasattr(os, "splice"):
+        raise ValueError("relay mode 'splice' requires Linux (os.splice)")
+    return {
+        RelayMode.copy: relay_copy,
+        RelayMode.buffer: relay_buffer,
+        RelayMode.splice: relay_splice,
+    }[relay_mode]
+
 
-def handle_client(client_sock, client_addr, target_host, target_port, log_timestamps):
+class ConnectionMeter:
+    """
+    Relay callbacks for one connection: count bytes and time to first byte,
+    and feed the capture. A chunk is bytes (relay_copy, asyncio) or a byte
+    count (fast-path relays).
+    """
+
+    def __init__(self, capture, name, log_mode):
+        self.capture = capture if log_mode != LogMode.off else None
+        self.name = name
+        self.payload = log_mode == LogMode.payload
+        self.sent_at = None
+        self.answered = False
+
+    def upload(self, chunk):
+        nbytes = chunk if isinstance(chunk, int) else len(chunk)
+        metrics.inc(BYTES_UP, nbytes)
+        if self.sent_at is None:
+            self.sent_at = time.perf_counter()
+        if self.capture is not None:
+            if self.payload:
+                self.capture.record(self.name, UPLOAD, chunk)
+            else:
+                self.capture.record_count(self.name, UPLOAD, nbytes)
+
+    def download(self, chunk):
+        nbytes = chunk if isinstance(chunk, int) else len(chunk)
+        metrics.inc(BYTES_DOWN, nbytes)
+        if not self.answered:
+            self.answered = True
+            if self.sent_at is not None:
+                metrics.observe(TTFB_SECONDS, time.perf_counter() - self.sent_at)
+        if self.capture is not None:
+            if self.payload:
+                self.capture.record(self.name, DOWNLOAD, chunk)
+            else:
+                self.capture.record_count(self.name, DOWNLOAD, nbytes)
+
+
+def connect_upstream(target_host, target_port):
+    """Open a socket to the target, recording connect latency and failures."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    started = time.perf_counter()
+    try:
+        sock.connect((target_host, target_port))
+    except OSError:
+        metrics.inc(UPSTREAM_CONNECT_ERRORS)
+        sock.close()
+        raise
+    metrics.observe(UPSTREAM_CONNECT_SECONDS, time.perf_counter() - started)
+    return sock
+
+
+def handle_client(client_sock, client_addr, target_host, target_port, capture,
+                  log_mode=LogMode.payload, relay_fn=relay_copy):
     """Handle a single client connection and log traffic."""
     hostname, port = client_addr
-    log_file = f"{hostname}-{port}.txt"
+    name = f"{hostname}-{port}"
+    target_sock = None
+    metrics.inc(CONNECTIONS_OPENED)
 
     try:
         # Connect to target
-        target_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        target_sock.connect((target_host, target_port))
+        target_sock = connect_upstream(target_host, target_port)
 
         print(f"[+] New connection: {hostname}:{port} -> {target_host}:{target_port}")
-        print(f"    Logging to: {log_file}")
+        if capture is not None and log_mode != LogMode.off:
+            print(f"    Logging to: {capture.path_for(name)}")
 
-        def relay(src, dst, direction, log_file):
+        meter = ConnectionMeter(capture, name, log_mode)
+
+        def relay(src, dst, direction, on_chunk, error_key):
             """Relay data from src to dst and log it."""
             try:
-                with open(log_file, "ab") as f:
-                    while True:
-                        data = src.recv(4096)
-                        if not data:
-                            break
-
-                        # Log with optional timestamp
-                        if log_timestamps:
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-                            log_line = f"[{timestamp}] [{direction}] {len(data)} bytes\n"
-                        else:
-                            log_line = f"[{direction}] {len(data)} bytes\n"
-
-                        f.write(log_line.encode() + data + b"\n")
-                        f.flush()
-
-                        dst.send(data)
+                relay_fn(src, dst, on_chunk)
             except Exception as e:
+                metrics.inc(error_key)
                 print(f"[!] Relay error ({direction}): {e}")
-            finally:
-                src.close()
-                dst.close()
+                shutdown = [(src, socket.SHUT_RDWR), (dst, socket.SHUT_RDWR)]  # Abort both directions
+            else:
+                # Pass the EOF on; close() would not wake the other relay thread blocked in recv()
+                shutdown = [(dst, socket.SHUT_WR)]
+            for sock, how in shutdown:
+                try:
+                    sock.shutdown(how)
+                except OSError:
+                    pass  # Peer already gone
 
         # Start bidirectional relay
-        client_to_target = threading.Thread(target=relay, args=(client_sock, target_sock, "→", log_file), daemon=True)
-        target_to_client = threading.Thread(target=relay, args=(target_sock, client_sock, "←", log_file), daemon=True)
+        client_to_target = threading.Thread(
+            target=relay, args=(client_sock, target_sock, UPLOAD, meter.upload, RELAY_ERRORS_UP), daemon=True
+        )
+        target_to_client = threading.Thread(
+            target=relay, args=(target_sock, client_sock, DOWNLOAD, meter.download, RELAY_ERRORS_DOWN), daemon=True
+        )
 
         client_to_target.start()
         target_to_client.start()
@@ -60,33 +265,60 @@ def handle_client(client_sock, client_addr, target_host, target_port, log_timest
         # Wait for both directions to complete
         client_to_target.join()
         target_to_client.join()
+        target_sock.close()
 
     except Exception as e:
         print(f"[!] Error handling client {hostname}:{port}: {e}")
+        if target_sock is not None:
+            target_sock.close()
     finally:
         client_sock.close()
+        if capture is not None:
+            capture.close_connection(name)
+        metrics.inc(CONNECTIONS_CLOSED)
         print(f"[-] Closed connection: {hostname}:{port}")
 
 
-def start_proxy(listen_port, target_host, target_port, log_timestamps):
+def print_banner(listen_port, target_host, target_port, capture, engine, backlog, log_mode, relay_name,
+                 worker=None):
+    """Print the proxy startup banner; under --workers, only worker 0 prints it."""
+    if worker is not None and not worker.primary:
+        return False
+    print(f"[*] Proxy listening on 0.0.0.0:{listen_port}")
+    print(f"[*] Forwarding to {target_host}:{target_port}")
+    print(f"[*] Engine: {engine} (backlog {backlog})")
+    print(f"[*] Logging: {log_mode.value} (relay: {relay_name})")
+    if capture is not None and log_mode != LogMode.off:
+        print(f"[*] Timestamps: {'enabled' if capture.log_timestamps else 'disabled'}")
+        print(f"[*] Log files will be created in: {os.path.abspath(capture.directory)}")
+        print(f"[*] Capture: {capture.capture_format.value}, queue {capture.queue_size}, "
+              f"overflow {capture.overflow.value}, compression {capture.compression.value}")
+    if worker is not None:
+        print(f"[*] Workers: {worker.count} (SO_REUSEPORT)")
+    print()
+    return True
+
+
+def start_proxy(listen_port, target_host, target_port, capture, backlog=DEFAULT_BACKLOG,
+                log_mode=LogMode.payload, relay_mode=RelayMode.auto, worker=None):
     """Start the proxy server."""
+    relay_fn = select_relay(relay_mode, log_mode)
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if worker is not None:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
     try:
         server.bind(("0.0.0.0", listen_port))
-        server.listen(5)
-        print(f"[*] Proxy listening on 0.0.0.0:{listen_port}")
-        print(f"[*] Forwarding to {target_host}:{target_port}")
-        print(f"[*] Timestamps: {'enabled' if log_timestamps else 'disabled'}")
-        print(f"[*] Log files will be created in: {sys.path[0] or '.'}")
-        print()
+        server.listen(backlog)
+        print_banner(listen_port, target_host, target_port, capture, Engine.threads.value, backlog,
+                     log_mode, relay_fn.__name__, worker)
 
         while True:
             client_sock, client_addr = server.accept()
             client_thread = threading.Thread(
                 target=handle_client,
-                args=(client_sock, client_addr, target_host, target_port, log_timestamps),
+                args=(client_sock, client_addr, target_host, target_port, capture, log_mode, relay_fn),
                 daemon=True,
             )
             client_thread.start()
@@ -99,11 +331,230 @@ def start_proxy(listen_port, target_host, target_port, log_timestamps):
         server.close()
 
 
+async def handle_client_async(client_reader, client_writer, target_host, target_port, capture, buffer_size,
+                              log_mode=LogMode.payload):
+    """Handle a single client connection on the event loop and log traffic."""
+    hostname, port = client_writer.get_extra_info("peername")[:2]
+    name = f"{hostname}-{port}"
+    target_writer = None
+    metrics.inc(CONNECTIONS_OPENED)
+
+    try:
+        # Connect to target
+        target_reader, target_writer = await open_upstream(target_host, target_port, limit=buffer_size)
+
+        # Bound the write side too, so a slow peer pauses the other direction via drain()
+        client_writer.transport.set_write_buffer_limits(high=buffer_size)
+        target_writer.transport.set_write_buffer_limits(high=buffer_size)
+
+        print(f"[+] New connection: {hostname}:{port} -> {target_host}:{target_port}")
+        if capture is not None and log_mode != LogMode.off:
+            print(f"    Logging to: {capture.path_for(name)}")
+
+        meter = ConnectionMeter(capture, name, log_mode)
+
+        async def relay(src, dst, direction, on_chunk, error_key):
+            """Relay data from src to dst and log it."""
+            try:
+                while True:
+                    data = await src.read(buffer_size)
+                    if not data:
+                        break
+
+                    on_chunk(data)
+
+                    dst.write(data)
+                    await dst.drain()
+            except Exception as e:
+                metrics.inc(error_key)
+                print(f"[!] Relay error ({direction}): {e}")
+            finally:
+                dst.close()
+
+        await asyncio.gather(
+            relay(client_reader, target_writer, UPLOAD, meter.upload, RELAY_ERRORS_UP),
+            relay(target_reader, client_writer, DOWNLOAD, meter.download, RELAY_ERRORS_DOWN),
+        )
+
+    except Exception as e:
+        print(f"[!] Error handling client {hostname}:{port}: {e}")
+    finally:
+        client_writer.close()
+        if target_writer is not None:
+            target_writer.close()
+        if capture is not None:
+            capture.close_connection(name)
+        metrics.inc(CONNECTIONS_CLOSED)
+        print(f"[-] Closed connection: {hostname}:{port}")
+
+
+async def serve_async(listen_port, target_host, target_port, capture, backlog, buffer_size,
+                      log_mode=LogMode.payload, worker=None):
+    """Run the event-loop proxy server until cancelled."""
+
+    async def on_client(reader, writer):
+        await handle_client_async(reader, writer, target_host, target_port, capture, buffer_size, log_mode)
+
+    server = await asyncio.start_server(
+        on_client, "0.0.0.0", listen_port, backlog=backlog, limit=buffer_size, reuse_address=True,
+        reuse_port=worker is not None or None,
+    )
+    print_banner(listen_port, target_host, target_port, capture, Engine.asyncio.value, backlog,
+                 log_mode, "stream", worker)
+
+    async with server:
+        await server.serve_forever()
+
+
+def raise_fd_limit():
+    """Raise the soft open-file limit to the hard limit; each relayed connection needs two sockets."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def start_proxy_async(listen_port, target_host, target_port, capture,
+                      backlog=DEFAULT_BACKLOG, buffer_size=DEFAULT_BUFFER_SIZE, log_mode=LogMode.payload,
+                      worker=None):
+    """Start the event-loop proxy server."""
+    raise_fd_limit()
+    try:
+        asyncio.run(
+            serve_async(listen_port, target_host, target_port, capture, backlog, buffer_size, log_mode, worker)
+        )
+    except KeyboardInterrupt:
+        print("\n[*] Shutting down...")
+    except Exception as e:
+        print(f"[!] Server error: {e}")
+
+
+def start_proxy_http(listen_port, target_host, target_port, http_proxy, capture,
+                     backlog=DEFAULT_BACKLOG, log_mode=LogMode.payload, worker=None):
+    """Start the HTTP-aware event-loop proxy server."""
+    raise_fd_limit()
+
+    def banner():
+        if not print_banner(listen_port, target_host, target_port, capture, Engine.http.value, backlog, log_mode,
+                            "http", worker):
+            return
+        pool = http_proxy.pool
+        if pool is not None:
+            print(f"[*] Upstream pool: up to {pool.size} keep-alive connections, idle timeout "
+                  f"{pool.idle_timeout:g} s, health check every {pool.health_interval:g} s")
+        else:
+            print("[*] Upstream: one connection per client")
+        coalescer = http_proxy.coalescer
+        if coalescer is not None:
+            print(f"[*] Coalescing POST /{coalescer.table}: {coalescer.window * 1000:.0f} ms or "
+                  f"{coalescer.max_rows} rows per bulk insert")
+        spool = http_proxy.spool
+        if spool is not None:
+            print(f"[*] Spool: {os.path.abspath(spool.directory)}, drain {spool.drain_rows} rows per batch "
+                  f"at {spool.drain_rate} rows/s, upstream timeout {http_proxy.upstream_timeout:g} s"
+                  f"{', expired tokens re-signed' if http_proxy.spool_resign else ''}")
+            if spool.depth_entries:
+                print(spool.status_line())
+        auth = http_proxy.auth
+        if auth is not None:
+            limits = ", ".join(f"{role} {rate:g}/s burst {burst:g}" for role, (rate, burst) in
+                               auth.limiter.limits.items()) if auth.limiter is not None else "none"
+            print(f"[*] Verifying bearer tokens, {auth.cache_size} cached; rate limits: {limits}")
+        print()
+
+    try:
+        asyncio.run(http_proxy.serve(listen_port, backlog, on_started=banner, reuse_port=worker is not None))
+    except KeyboardInterrupt:
+        print("\n[*] Shutting down...")
+    except Exception as e:
+        print(f"[!] Server error: {e}")
+    coalescer = http_proxy.coalescer
+    if coalescer is not None and coalescer.batches:
+        print(f"[*] Coalesced {coalescer.requests} requests ({coalescer.rows} rows) "
+              f"into {coalescer.batches} bulk inserts")
+    if http_proxy.pool is not None and http_proxy.pool.requests:
+        print(http_proxy.pool.summary())
+    if http_proxy.spool is not None:
+        http_proxy.spool.close()
+        if http_proxy.spool.depth_entries:
+            print(http_proxy.spool.status_line())
+    if http_proxy.auth is not None:
+        print(http_proxy.auth.summary())
+
+
 def main(
     listen_port: int = typer.Argument(..., help="Port to listen on"),
     target_host: str = typer.Argument(..., help="Target host to forward to"),
     target_port: int = typer.Argument(..., help="Target port to forward to"),
     timestamps: bool = typer.Option(False, "--timestamps", "-t", help="Add timestamps to log entries"),
+    engine: Engine = typer.Option(Engine.threads, "--engine", "-e", help="Connection engine"),
+    backlog: int = typer.Option(DEFAULT_BACKLOG, "--backlog", "-b", help="Listen socket backlog"),
+    buffer_size: int = typer.Option(
+        DEFAULT_BUFFER_SIZE, "--buffer-size", help="Per-connection read/write buffer bound in bytes (asyncio engine)"
+    ),
+    log: LogMode = typer.Option(LogMode.payload, "--log", "-l", help="What to log per chunk: payload, bytes or off"),
+    relay: RelayMode = typer.Option(
+        RelayMode.auto, "--relay", "-r", help="Relay implementation (threads engine); auto uses splice if possible"
+    ),
+    log_dir: str = typer.Option(".", "--log-dir", help="Directory for per-client log files"),
+    capture_format: CaptureFormat = typer.Option(
+        CaptureFormat.text, "--capture-format", help="text: per-client files; binary: one indexed file for replay"
+    ),
+    capture_queue: int = typer.Option(DEFAULT_QUEUE_SIZE, "--capture-queue", help="Max log records queued for the writer"),
+    overflow: Overflow = typer.Option(
+        Overflow.block, "--overflow",
+        help="When the capture queue is full: block the relay or drop records (asyncio and http engines always drop)"
+    ),
+    compress: Compression = typer.Option(Compression.none, "--compress", help="Compress log files"),
+    rotate_mb: int = typer.Option(0, "--rotate-mb", help="Rotate a log file after this many MB (0 = never)"),
+    rotate_seconds: int = typer.Option(0, "--rotate-seconds", help="Rotate a log file after this age (0 = never)"),
+    table: str = typer.Option(DEFAULT_TABLE, "--table", help="IoTaWatt table name, as in POST /<table> (http engine)"),
+    coalesce: bool = typer.Option(False, "--coalesce", help="Merge row inserts into bulk inserts (http engine)"),
+    coalesce_ms: int = typer.Option(DEFAULT_COALESCE_MS, "--coalesce-ms", help="Max time rows wait for a batch"),
+    coalesce_rows: int = typer.Option(DEFAULT_COALESCE_ROWS, "--coalesce-rows", help="Flush a batch at this many rows"),
+    spool_dir: str = typer.Option(
+        None, "--spool-dir", help="Spool uploads here while the upstream is down, drain on recovery (http engine)"
+    ),
+    drain_rows: int = typer.Option(DEFAULT_DRAIN_ROWS, "--drain-rows", help="Rows per spool drain batch"),
+    drain_rate: int = typer.Option(DEFAULT_DRAIN_RATE, "--drain-rate", help="Max spool drain rate, rows/s"),
+    spool_resign: bool = typer.Option(
+        False, "--spool-resign", help="Re-sign spooled tokens that expire before they drain (needs PGRST_JWT_SECRET)"
+    ),
+    upstream_timeout: float = typer.Option(
+        DEFAULT_UPSTREAM_TIMEOUT, "--upstream-timeout",
+        help="Acknowledge an upload if the upstream takes longer, and spool it if it then fails (seconds)",
+    ),
+    pool_size: int = typer.Option(
+        DEFAULT_POOL_SIZE, "--pool-size", help="Keep-alive upstream connections (http engine); 0 = one per client"
+    ),
+    pool_idle_timeout: float = typer.Option(
+        DEFAULT_POOL_IDLE_TIMEOUT, "--pool-idle-timeout", help="Close pooled connections idle this long (seconds)"
+    ),
+    pool_health_interval: float = typer.Option(
+        DEFAULT_POOL_HEALTH_INTERVAL, "--pool-health-interval", help="Seconds between pool health checks"
+    ),
+    workers: int = typer.Option(
+        1, "--workers", "-w", help="Worker processes sharing the listen port via SO_REUSEPORT"
+    ),
+    stats_interval: int = typer.Option(
+        DEFAULT_STATS_INTERVAL, "--stats-interval", help="Seconds between aggregated worker stats lines (0 = off)"
+    ),
+    admin_port: int = typer.Option(
+        0, "--admin-port", help="Serve Prometheus metrics on this port at /metrics (0 = off); SIGUSR1 dumps them"
+    ),
+    verify_jwt: bool = typer.Option(
+        False, "--verify-jwt", help="Verify bearer tokens with PGRST_JWT_SECRET; answer bad ones with 401 (http engine)"
+    ),
+    token_cache: int = typer.Option(DEFAULT_TOKEN_CACHE, "--token-cache", help="Verified tokens kept until their exp"),
+    rate_limit: List[str] = typer.Option(
+        [], "--rate-limit", help="ROLE=RATE[:BURST] requests/s per role, '*' for other roles (with --verify-jwt)"
+    ),
 ):
     """
     Port forwarding proxy with per-client logging.
@@ -115,8 +566,129 @@ def main(
         proxy.py 8080 localhost 5432
         
         proxy.py 8080 localhost 5432 --timestamps
+
+        proxy.py 8080 localhost 5432 --engine asyncio --backlog 4096
+
+        proxy.py 8080 localhost 5432 --log bytes --relay splice
+
+        proxy.py 8080 localhost 5432 --overflow drop --compress gzip --rotate-mb 100
+
+        proxy.py 8080 localhost 3000 --capture-format binary --log-dir captures
+
+        proxy.py 8080 localhost 3000 --engine http --coalesce --coalesce-ms 100
+
+        proxy.py 8080 localhost 3000 --engine http --coalesce --spool-dir spool
+
+        proxy.py 8080 localhost 3000 --engine asyncio --log off --workers 4 --admin-port 9090
+
+        proxy.py 8080 localhost 3000 --engine http --verify-jwt --rate-limit writer=500 --rate-limit '*=20'
     """
-    start_proxy(listen_port, target_host, target_port, timestamps)
+    if coalesce and engine != Engine.http:
+        raise typer.BadParameter("--coalesce requires --engine http")
+    if spool_dir and engine != Engine.http:
+        raise typer.BadParameter("--spool-dir requires --engine http")
+    if verify_jwt and engine != Engine.http:
+        raise typer.BadParameter("--verify-jwt requires --engine http")
+    if verify_jwt and not JWT_SECRET:
+        raise typer.BadParameter("--verify-jwt requires PGRST_JWT_SECRET")
+    if spool_resign and not spool_dir:
+        raise typer.BadParameter("--spool-resign requires --spool-dir")
+    if spool_resign and not JWT_SECRET:
+        raise typer.BadParameter("--spool-resign requires PGRST_JWT_SECRET")
+    if rate_limit and not verify_jwt:
+        raise typer.BadParameter("--rate-limit requires --verify-jwt")
+    try:
+        limits = parse_rate_limits(rate_limit)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if workers < 1:
+        raise typer.BadParameter("--workers must be at least 1")
+    if workers > 1 and not reuse_port_supported():
+        raise typer.BadParameter("--workers requires fork() and SO_REUSEPORT (Linux, BSD or macOS)")
+    if engine == Engine.threads:
+        try:
+            select_relay(relay, log)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+
+    capture = None
+    if log != LogMode.off:
+        os.makedirs(log_dir, exist_ok=True)
+        try:
+            # Started in run(), after any fork: the writer thread must live in the worker
+            capture = CaptureWriter(
+                directory=log_dir,
+                log_timestamps=timestamps,
+                queue_size=capture_queue,
+                overflow=overflow,
+                compression=compress,
+                rotate_bytes=rotate_mb * 1024 * 1024,
+                rotate_seconds=rotate_seconds,
+                capture_format=capture_format,
+                event_loop=engine != Engine.threads,
+            )
+        except (ValueError, RuntimeError) as e:
+            raise typer.BadParameter(str(e))
+
+    def run(worker=None):
+        """Run one proxy process: the whole proxy, or one worker under the supervisor."""
+        if capture is not None:
+            capture.start()
+        http_proxy = None
+        try:
+            if engine == Engine.http:
+                spool = None
+                if spool_dir:
+                    # Workers each own a spool, so segments and cursors are never shared
+                    directory = spool_dir if worker is None else os.path.join(spool_dir, f"worker-{worker.index}")
+                    spool = Spool(directory, drain_rows=drain_rows, drain_rate=drain_rate).open()
+                http_proxy = HttpProxy(
+                    target_host,
+                    target_port,
+                    capture=capture,
+                    log_payload=log == LogMode.payload,
+                    table=table,
+                    coalesce=coalesce,
+                    coalesce_window=coalesce_ms / 1000,
+                    coalesce_rows=coalesce_rows,
+                    spool=spool,
+                    spool_resign=spool_resign,
+                    upstream_timeout=upstream_timeout,
+                    pool=UpstreamPool(
+                        target_host, target_port, pool_size, pool_idle_timeout, pool_health_interval
+                    ) if pool_size > 0 else None,
+                    auth=TokenVerifier(
+                        token_cache, RateLimiter(limits) if limits else None
+                    ) if verify_jwt else None,
+                )
+            if capture is not None:
+                metrics.collectors.append(lambda: prefixed("capture", capture.stats()))
+            if http_proxy is not None:
+                metrics.collectors.append(http_proxy.stats)
+            install_dump_handler(metrics.snapshot)
+            if worker is not None:
+                worker.report(metrics.snapshot)
+            elif admin_port:
+                start_admin(admin_port, metrics.snapshot)
+                print(f"[*] Metrics: http://0.0.0.0:{admin_port}/metrics")
+            if engine == Engine.http:
+                start_proxy_http(listen_port, target_host, target_port, http_proxy, capture, backlog, log, worker)
+            elif engine == Engine.asyncio:
+                start_proxy_async(listen_port, target_host, target_port, capture, backlog, buffer_size, log, worker)
+            else:
+                start_proxy(listen_port, target_host, target_port, capture, backlog, log, relay, worker)
+        finally:
+            if capture is not None:
+                capture.stop()
+                if capture.dropped:
+                    print(f"[!] Capture dropped {capture.dropped} records (queue full)")
+            if worker is not None:
+                worker.send(metrics.snapshot())
+
+    if workers > 1:
+        Supervisor(workers, run, stats_interval, admin_port).run()
+    else:
+        run()
 
 
 if __name__ == "__main__":
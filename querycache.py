@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Local on-disk cache of settled time-range query results for show_db.py.
+
+Readings older than a few minutes do not change, so a range query is split
+into fixed time buckets; buckets that ended more than `settle` seconds ago
+are stored in a SQLite file keyed by (table, device, sensor, bucket start)
+and served from there on repeat queries. Only the missing buckets and the
+recent tail go to PostgREST. "*" stands for "no filter" in the key.
+
+Rows are stored as zlib-compressed JSON, one blob per bucket. When the file
+holds more than max_bytes of blobs the least recently used buckets are
+evicted. History rewritten in the database (backfill.py --force, deletes)
+is not noticed: clear the affected range with `show_db.py cache clear`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+
+DEFAULT_PATH = os.path.expanduser(os.environ.get("SHOW_DB_CACHE_PATH", "~/.cache/iotawatt/show_db.sqlite"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("SHOW_DB_CACHE_MB", "256")) * 1024 * 1024)
+DEFAULT_BUCKET_SECONDS = 3600
+DEFAULT_SETTLE_SECONDS = int(os.environ.get("SHOW_DB_CACHE_SETTLE_SECONDS", "300"))
+EVICT_TO = 0.9  # Evict down to this share of max_bytes, so eviction does not run on every insert
+ANY = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    tbl TEXT NOT NULL,
+    device TEXT NOT NULL,
+    sensor TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    rows BLOB NOT NULL,
+    bytes INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (tbl, device, sensor, start)
+);
+CREATE INDEX IF NOT EXISTS buckets_used ON buckets (used);
+"""
+
+
+def epoch(value):
+    """Seconds since the epoch of an ISO 8601 timestamp (naive means UTC)."""
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00")) if isinstance(value, str) else value
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class QueryCache:
+    """
+    Bucketed row cache in one SQLite file, opened on first use.
+
+    Safe to share between the threads of show_db.fetch_range(): all access
+    goes through one connection under a lock.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, bucket_seconds=DEFAULT_BUCKET_SECONDS,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bucket_seconds = bucket_seconds
+        self.settle_seconds = settle_seconds
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._bytes = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM buckets").fetchone()[0]
+            self._db = db
+        return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, table, device, sensor, starts):
+        """Cached rows of the given buckets, {start: rows}; marks them recently used."""
+        with self._lock:
+            db = self._connect()
+            found = {}
+            for i in range(0, len(starts), 500):  # Below SQLite's host parameter limit
+                batch = starts[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                for start, blob in db.execute(
+                    f"SELECT start, rows FROM buckets WHERE tbl = ? AND device = ? AND sensor = ? "
+                    f"AND start IN ({marks})", (table, device, sensor, *batch)
+                ):
+                    found[start] = json.loads(zlib.decompress(blob))
+            if found:
+                now = time.time()
+                db.executemany("UPDATE buckets SET used = ? WHERE tbl = ? AND device = ? AND sensor = ? AND start = ?",
+                               [(now, table, device, sensor, start) for start in found])
+        return found
+
+    def put(self, table, device, sensor, buckets):
+        """Store {start: rows} and evict least recently used buckets beyond max_bytes."""
+        now = time.time()
+        records = []
+        for start, rows in buckets.items():
+            blob = zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 6)
+            records.append((table, device, sensor, start, blob, len(blob), now))
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            for record in records:
+                old = db.execute("SELECT bytes FROM buckets WHERE tbl = ? AND device = ? AND sensor = ? AND start = ?",
+                                 record[:4]).fetchone()
+                self._bytes += record[5] - (old[0] if old else 0)
+                db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?)", record)
+            db.execute("COMMIT")
+            if self._bytes > self.max_bytes:
+                self._evict(db)
+
+    def _evict(self, db):
+        target = self.max_bytes * EVICT_TO
+        victims = []
+        for rowid, size in db.execute("SELECT rowid, bytes FROM buckets ORDER BY used"):
+            if self._bytes <= target:
+                break
+            victims.append((rowid,))
+            self._bytes -= size
+        db.executemany("DELETE FROM buckets WHERE rowid = ?", victims)
+
+    def clear(self, table=None, device=None, start=None, end=None):
+        """Delete cached buckets (all, or of a table, a device, or overlapping [start, end)); returns the count."""
+        where, args = [], []
+        if table is not None:
+            where.append("tbl = ?")
+            args.append(table)
+        if device is not None:
+            where.append("device IN (?, ?)")  # Unfiltered buckets hold the device's rows too
+            args += [device, ANY]
+        if start is not None:
+            where.append("start > ?")
+            args.append(int(epoch(start)) - self.bucket_seconds)
+        if end is not None:
+            where.append("start < ?")
+            args.append(epoch(end))
+        sql = "DELETE FROM buckets" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            db = self._connect()
+            deleted = db.execute(sql, args).rowcount
+            self._bytes = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM buckets").fetchone()[0]
+            if not where:
+                db.execute("VACUUM")
+        return deleted
+
+    def info(self):
+        """Bucket count, stored bytes and covered time span per table."""
+        with self._lock:
+            db = self._connect()
+            rows = db.execute("SELECT tbl, COUNT(*), SUM(bytes), MIN(start), MAX(start) FROM buckets GROUP BY tbl")
+            return [
+                {"table": tbl, "buckets": count, "bytes": size,
+                 "first": datetime.fromtimestamp(first, timezone.utc),
+                 "last": datetime.fromtimestamp(last + self.bucket_seconds, timezone.utc)}
+                for tbl, count, size, first, last in rows
+            ]
+
+    def fetch(self, table, start, end, fetch_rows, device=None, sensor=None, settle_seconds=None):
+        """
+        Rows with start <= timestamp < end in (timestamp, device, sensor) order.
+
+        fetch_rows(lower, upper) gets rows from the API for an ISO 8601 range
+        in that order, or None on failure. Settled buckets come from the cache
+        where present and are fetched whole (then cached) where not, one
+        request per run of consecutive missing buckets. The unsettled tail is
+        always fetched. Returns None if a fetch failed.
+
+        settle_seconds overrides the cache's settle time, e.g. for rollups
+        whose rows keep changing until their own bucket has ended.
+        """
+        lower, upper = epoch(start), epoch(end)
+        if lower >= upper:
+            return []
+        size = self.bucket_seconds
+        settle = self.settle_seconds if settle_seconds is None else settle_seconds
+        settled = (int(time.time()) - settle) // size * size  # End of the last settled bucket
+        first = int(lower) // size * size
+        starts = list(range(first, min(int(-(-upper // size) * size), settled), size))
+        key = (table, device or ANY, sensor or ANY)
+
+        buckets = self.get(*key, starts) if starts else {}
+        self.hits += len(buckets)
+        missing = [s for s in starts if s not in buckets]
+        self.misses += len(missing)
+        runs = []
+        for s in missing:
+            if runs and runs[-1][1] == s:
+                runs[-1][1] = s + size
+            else:
+                runs.append([s, s + size])
+        for run_start, run_end in runs:
+            rows = fetch_rows(iso(run_start), iso(run_end))
+            if rows is None:
+                return None
+            fetched = {s: [] for s in range(run_start, run_end, size)}
+            for row in rows:
+                fetched[int(epoch(row["timestamp"])) // size * size].append(row)
+            self.put(*key, fetched)
+            buckets.update(fetched)
+
+        result = []
+        for s in starts:
+            rows = buckets[s]
+            if s < lower or s + size > upper:  # Partly outside the requested range
+                rows = [row for row in rows if lower <= epoch(row["timestamp"]) < upper]
+            result.extend(rows)
+        tail = max(lower, starts[-1] + size if starts else lower)
+        if tail < upper:
+            rows = fetch_rows(iso(tail), iso(upper))
+            if rows is None:
+                return None
+            result.extend(rows)
+        return result
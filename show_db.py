@@ -1,19 +1,42 @@
 #!/usr/bin/env python3
 """
 Display IoTaWatt data from PostgreSQL database via PostgREST API using JWT authentication.
+
+With --follow it keeps polling for rows newer than the last one seen and
+updates a live table of per-device aggregates. `export` streams the table
+(or a time range of it) to CSV or Parquet page by page, resuming where an
+interrupted export stopped. `fetch` pulls a time
+range split into shards fetched concurrently (see fetch_range()).
+
+`rollup` reads per-bucket Watts and Wh from the coarsest continuous
+aggregates that fit the range and resolution (see plan_rollup()).
+
+Time-range queries are served from a local cache of settled hourly buckets
+where possible (querycache.py); `cache info` and `cache clear` manage it.
 """
 
+import json
 import os
 import requests
-from rich.console import Console
+import typer
+from rich.console import Console, Group
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 from rich import box
+from rich.live import Live
+import csv
+import heapq
+import itertools
+from collections import deque
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any, Optional
-from datetime import datetime
-from jwtutil import generate_jwt_token
+from datetime import datetime, timedelta, timezone
+from jwtutil import cached_jwt_token
+from querycache import QueryCache
 
 # Load PostgREST configuration from .env file
 POSTGREST_PORT = os.getenv('POSTGREST_EXTERNAL_PORT', '3000')
@@ -27,27 +50,95 @@ API_CONFIG = {
     'token_expiry_hours': 24
 }
 
+EXPORT_PAGE_ROWS = 10000
+EXPORT_FILE_ROWS = 1_000_000  # Rows per Parquet part file
+KEY_COLUMNS = ('timestamp', 'device', 'sensor')
+FETCH_SHARD_HOURS = 24.0
+FETCH_WORKERS = 4
+MAX_CONNECTIONS = 32
+FOLLOW_INTERVAL = 5.0
+FOLLOW_WINDOW_MINUTES = 15.0
+FOLLOW_PAGE_ROWS = 5000
+FOLLOW_RECENT_ROWS = 15
+
+ROLLUPS = (('1d', 86400), ('1h', 3600), ('15m', 900), ('1m', 60))  # <table>_<name> from init_db.sh, coarsest first
+ROLLUP_TABLES = {f'{IOTAWATT_TABLE}_{name}': seconds for name, seconds in ROLLUPS}
+UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+CACHED_ORDERS = ('timestamp.asc', 'timestamp.asc,device.asc,sensor.asc')
+CACHE_OFF = ('', '0', 'off', 'false', 'no')
+
+# Settled time buckets of range queries, at SHOW_DB_CACHE_PATH; SHOW_DB_CACHE=off disables it
+query_cache = QueryCache() if os.getenv('SHOW_DB_CACHE', 'on').strip().lower() not in CACHE_OFF else None
+
+# One keep-alive session shared by all requests, including concurrent shard fetches
+http = requests.Session()
+http.mount('http://', HTTPAdapter(pool_maxsize=MAX_CONNECTIONS))
+http.mount('https://', HTTPAdapter(pool_maxsize=MAX_CONNECTIONS))
+
 console = Console()
+err_console = Console(stderr=True)
+app = typer.Typer(help="Display and export IoTaWatt data via the PostgREST API", invoke_without_command=True)
+cache_app = typer.Typer(help="Inspect or clear the local query cache")
+app.add_typer(cache_app, name="cache")
 
 
 def get_jwt_token(role: str = None) -> str:
-    """Get a JWT token for API authentication."""
+    """Get a JWT token for API authentication, reusing it until shortly before it expires."""
     if role is None:
         role = API_CONFIG['default_role']
     
     try:
-        token = generate_jwt_token(role, API_CONFIG['token_expiry_hours'])
+        token = cached_jwt_token(role, API_CONFIG['token_expiry_hours'])
         return token
     except Exception as e:
         console.print(f"[red]Error generating JWT token: {e}[/red]")
         sys.exit(1)
 
 
+def cacheable_range(endpoint: str, params) -> Optional[Dict[str, str]]:
+    """
+    The range and filters of a plain time-range query on the data table, or
+    None for anything the cache cannot answer (limits, selects, other orders...).
+    """
+    if (endpoint != IOTAWATT_TABLE and endpoint not in ROLLUP_TABLES) or not params:
+        return None
+    query = {}
+    for name, value in (params.items() if isinstance(params, dict) else params):
+        op, _, operand = str(value).partition('.')
+        bound = {'gte': 'start', 'lt': 'end'}.get(op)
+        if name == 'timestamp' and bound and bound not in query:  # A repeated bound is left to the server
+            query[bound] = operand
+        elif name in ('device', 'sensor') and op == 'eq' and name not in query:
+            query[name] = operand
+        elif name == 'order' and value in CACHED_ORDERS:
+            continue
+        else:
+            return None
+    return query if 'start' in query and 'end' in query else None
+
+
 def make_api_request(endpoint: str, params: Optional[Dict[str, Any]] = None, token: str = None) -> Optional[List[Dict]]:
-    """Make a request to the PostgREST API."""
+    """Make a request to the PostgREST API, answering time-range queries from the cache where it can."""
     if token is None:
         token = get_jwt_token()
-    
+    query = cacheable_range(endpoint, params) if query_cache is not None else None
+    if query is None:
+        return api_get(endpoint, params, token)
+
+    def fetch_rows(lower, upper):
+        filters = [('timestamp', f'gte.{lower}'), ('timestamp', f'lt.{upper}'),
+                   ('order', 'timestamp.asc,device.asc,sensor.asc')]
+        filters += [(name, f'eq.{query[name]}') for name in ('device', 'sensor') if name in query]
+        return api_get(endpoint, filters, token)
+
+    # A rollup row keeps changing until its own bucket has ended
+    settle = query_cache.settle_seconds + ROLLUP_TABLES.get(endpoint, 0)
+    return query_cache.fetch(endpoint, query['start'], query['end'], fetch_rows,
+                             query.get('device'), query.get('sensor'), settle)
+
+
+def api_get(endpoint: str, params, token: str) -> Optional[List[Dict]]:
+    """GET an endpoint and decode the JSON response; prints the error and returns None on failure."""
     url = f"{API_CONFIG['base_url']}/{endpoint}"
     headers = {
         'Authorization': f'Bearer {token}',
@@ -55,7 +146,7 @@ def make_api_request(endpoint: str, params: Optional[Dict[str, Any]] = None, tok
     }
     
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = http.get(url, headers=headers, params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -76,31 +167,158 @@ def fetch_iotawatt_data(limit: int = 100, token: str = None) -> List[Dict[str, A
     return data if data is not None else []
 
 
-def get_table_stats(token: str = None) -> dict:
-    """Get statistics about the iotawatt table via PostgREST API."""
-    try:
-        # Get all data to calculate stats (for small datasets)
-        # For large datasets, you'd want to use PostgREST aggregation functions
-        all_data = make_api_request(IOTAWATT_TABLE, {'select': 'timestamp,device,sensor'}, token)
-        
-        if not all_data:
-            return {}
-        
-        # Calculate statistics
-        timestamps = [datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00')) for row in all_data if row.get('timestamp')]
-        devices = {row['device'] for row in all_data if row.get('device')}
-        sensors = {row['sensor'] for row in all_data if row.get('sensor')}
-        
-        return {
-            'total_count': len(all_data),
-            'min_date': min(timestamps) if timestamps else None,
-            'max_date': max(timestamps) if timestamps else None,
-            'unique_devices': len(devices),
-            'unique_sensors': len(sensors)
-        }
-    except Exception as e:
-        console.print(f"[red]Error fetching stats: {e}[/red]")
+def get_table_stats(token: str = None, exact: bool = False) -> dict:
+    """
+    Get statistics about the iotawatt table from the <table>_stats RPC function
+    (see init_db.sh), computed in the database from chunk metadata.
+    """
+    params = {'exact': 'true'} if exact else None
+    stats = make_api_request(f"rpc/{IOTAWATT_TABLE}_stats", params, token)
+    if not stats:
+        console.print(f"[yellow]No stats: does the database have the {IOTAWATT_TABLE}_stats function "
+                      f"from init_db.sh?[/yellow]")
         return {}
+    for key in ('min_date', 'max_date'):
+        if stats.get(key):
+            stats[key] = datetime.fromisoformat(stats[key].replace('Z', '+00:00'))
+    return stats
+
+
+def list_devices(start: str, end: str, token: str = None) -> Optional[List[str]]:
+    """Devices with rows in [start, end), one indexed lookup per device (PostgREST has no DISTINCT)."""
+    devices = []
+    while True:
+        params = [('select', 'device'), ('order', 'device.asc'), ('limit', '1'),
+                  ('timestamp', f'gte.{start}'), ('timestamp', f'lt.{end}')]
+        if devices:
+            params.append(('device', f'gt.{devices[-1]}'))
+        rows = make_api_request(IOTAWATT_TABLE, params, token)
+        if rows is None:
+            return None
+        if not rows:
+            return devices
+        devices.append(rows[0]['device'])
+
+
+def fetch_range(start: datetime, end: datetime, device: Optional[str] = None, by: str = 'time',
+                shard_hours: float = FETCH_SHARD_HOURS, workers: int = FETCH_WORKERS,
+                token: str = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch all rows with start <= timestamp < end, in timestamp order.
+
+    The range is split into shards of shard_hours (by='time') or one shard per
+    device (by='device'), fetched concurrently by up to `workers` threads over
+    the shared session. Time shards are concatenated; device shards are
+    merged by timestamp. Returns None if any shard failed.
+    """
+    if token is None:
+        token = get_jwt_token()
+    if by == 'time':
+        step = timedelta(hours=shard_hours)
+        bounds = []
+        lower = start
+        while lower < end:
+            bounds.append((lower, min(lower + step, end)))
+            lower += step
+        shards = [[('timestamp', f'gte.{lo.isoformat()}'), ('timestamp', f'lt.{hi.isoformat()}')]
+                  + ([('device', f'eq.{device}')] if device else []) for lo, hi in bounds]
+    else:
+        devices = [device] if device else list_devices(start.isoformat(), end.isoformat(), token)
+        if devices is None:
+            return None
+        shards = [[('timestamp', f'gte.{start.isoformat()}'), ('timestamp', f'lt.{end.isoformat()}'),
+                   ('device', f'eq.{name}')] for name in devices]
+
+    def fetch_shard(filters):
+        return make_api_request(IOTAWATT_TABLE, filters + [('order', 'timestamp.asc,device.asc,sensor.asc')], token)
+
+    with ThreadPoolExecutor(max(1, min(workers, MAX_CONNECTIONS))) as pool:
+        results = list(pool.map(fetch_shard, shards))
+    if any(result is None for result in results):
+        return None
+    if by == 'time':
+        return list(itertools.chain.from_iterable(results))
+    return list(heapq.merge(*results, key=lambda row: row['timestamp']))
+
+
+def plan_rollup(start: datetime, end: datetime, resolution: int, rollups=ROLLUPS) -> list:
+    """
+    [(endpoint, bucket seconds, start, end)] segments covering start <= timestamp < end.
+    The part aligned to the coarsest rollup whose buckets divide the resolution is
+    read from it, so re-bucketing is exact; the unaligned edges (e.g. up to an end
+    of now) from finer rollups and, below the finest, from the raw table (bucket 0).
+    """
+    for index, (name, seconds) in enumerate(rollups):
+        if resolution % seconds:
+            continue
+        lo = -(-start.timestamp() // seconds) * seconds
+        hi = end.timestamp() // seconds * seconds
+        if lo >= hi:
+            continue
+        middle_start = datetime.fromtimestamp(lo, timezone.utc)
+        middle_end = datetime.fromtimestamp(hi, timezone.utc)
+        return (plan_rollup(start, middle_start, resolution, rollups[index + 1:])
+                + [(f'{IOTAWATT_TABLE}_{name}', seconds, middle_start, middle_end)]
+                + plan_rollup(middle_end, end, resolution, rollups[index + 1:]))
+    return [(IOTAWATT_TABLE, 0, start, end)] if start < end else []
+
+
+def rebucket(rows: List[Dict[str, Any]], resolution: int) -> List[Dict[str, Any]]:
+    """Combine raw and/or rollup rows into resolution-second buckets (samples-weighted average)."""
+    groups = {}
+    for row in rows:
+        ts = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00')).timestamp()
+        key = (int(ts) // resolution * resolution, row['device'], row['sensor'])
+        if 'samples' not in row:  # A raw row
+            watts = row.get('Watts')
+            samples, total = (0, 0.0) if watts is None else (1, watts)
+            low = high = watts
+            wh = row.get('Wh')
+        else:
+            samples = row['samples'] or 0
+            total = (row['watts_avg'] or 0.0) * samples
+            low, high, wh = row['watts_min'], row['watts_max'], row['wh']
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [samples, total, low, high, wh]
+            continue
+        group[0] += samples
+        group[1] += total
+        group[2] = low if group[2] is None else (group[2] if low is None else min(group[2], low))
+        group[3] = high if group[3] is None else (group[3] if high is None else max(group[3], high))
+        group[4] = wh if group[4] is None else (group[4] if wh is None else group[4] + wh)
+    return [
+        {'timestamp': datetime.fromtimestamp(bucket, timezone.utc).isoformat(), 'device': device, 'sensor': sensor,
+         'samples': samples, 'watts_avg': total / samples if samples else None,
+         'watts_min': low, 'watts_max': high, 'wh': wh}
+        for (bucket, device, sensor), (samples, total, low, high, wh) in sorted(groups.items())
+    ]
+
+
+def fetch_rollup(start: datetime, end: datetime, resolution: int, device: Optional[str] = None,
+                 sensor: Optional[str] = None, token: str = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Per-bucket samples, average/min/max Watts and summed Wh for start <= timestamp < end,
+    read from the coarsest rollups that fit (plan_rollup()) and re-bucketed to resolution.
+    """
+    def fetch_segment(segment):
+        endpoint, _, segment_start, segment_end = segment
+        if endpoint == IOTAWATT_TABLE:
+            rows = fetch_range(segment_start, segment_end, device, token=token)
+            return [row for row in rows if row['sensor'] == sensor] if rows is not None and sensor else rows
+        params = [('timestamp', f'gte.{segment_start.isoformat()}'), ('timestamp', f'lt.{segment_end.isoformat()}'),
+                  ('order', 'timestamp.asc,device.asc,sensor.asc')]
+        params += [(name, f'eq.{value}') for name, value in (('device', device), ('sensor', sensor)) if value]
+        return make_api_request(endpoint, params, token)
+
+    plan = plan_rollup(start, end, resolution)
+    if not plan:
+        return []
+    with ThreadPoolExecutor(max(1, min(len(plan), MAX_CONNECTIONS))) as pool:
+        results = list(pool.map(fetch_segment, plan))
+    if any(rows is None for rows in results):
+        return None
+    return rebucket(list(itertools.chain.from_iterable(results)), resolution)
 
 
 def create_data_table(data: List[Dict[str, Any]], title: str = "IoTaWatt Data") -> Table:
@@ -170,12 +388,16 @@ def display_stats(stats: dict):
     
     stats_text = Text()
     stats_text.append("📊 Database Statistics\n\n", style="bold blue")
+    about = "~" if stats.get('approximate') else ""  # Estimated from planner statistics
     stats_text.append("Total Records: ", style="bold")
-    stats_text.append(f"{stats['total_count']:,}\n", style="green")
+    stats_text.append(f"{about}{stats['total_count']:,}\n", style="green")
     stats_text.append("Unique Devices: ", style="bold")
-    stats_text.append(f"{stats['unique_devices']}\n", style="yellow")
+    stats_text.append(f"{about}{stats['unique_devices']}\n", style="yellow")
     stats_text.append("Unique Sensors: ", style="bold")
-    stats_text.append(f"{stats['unique_sensors']}\n", style="magenta")
+    stats_text.append(f"{about}{stats['unique_sensors']}\n", style="magenta")
+    if stats.get('total_bytes') is not None:
+        stats_text.append("Storage: ", style="bold")
+        stats_text.append(f"{stats['total_bytes'] / 1024 ** 2:,.1f} MB in {stats.get('chunks', 0)} chunks\n", style="blue")
     
     if stats['min_date'] and stats['max_date']:
         stats_text.append("Date Range: ", style="bold")
@@ -192,8 +414,25 @@ def display_stats(stats: dict):
     console.print(panel)
 
 
-def main():
-    """Main function to display IoTaWatt data."""
+@app.callback()
+def main(
+    ctx: typer.Context,
+    exact: bool = typer.Option(False, "--exact", help="Exact statistics (scans the whole table)"),
+    follow: bool = typer.Option(False, "--follow", "-f", help="Keep polling for new rows and show them live"),
+    interval: float = typer.Option(FOLLOW_INTERVAL, "--interval", help="Seconds between polls with --follow"),
+    window: float = typer.Option(FOLLOW_WINDOW_MINUTES, "--window", help="Minutes of data in --follow aggregates"),
+    sensor: str = typer.Option("Net", "--sensor", help="Sensor whose Watts are aggregated with --follow"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Answer time-range queries from the local cache"),
+):
+    """Show table statistics and the latest records."""
+    global query_cache
+    if not cache:
+        query_cache = None
+    if ctx.invoked_subcommand is not None:
+        return
+    if follow:
+        follow_latest(interval, timedelta(minutes=window), sensor)
+        return
     console.print("\n[bold blue]IoTaWatt PostgREST API Data Viewer (JWT Auth)[/bold blue]\n")
     
     # Show JWT info
@@ -205,7 +444,7 @@ def main():
     
     # Display statistics
     console.print("[dim]Fetching database statistics via API...[/dim]")
-    stats = get_table_stats(token)
+    stats = get_table_stats(token, exact=exact)
     display_stats(stats)
     console.print()
     
@@ -223,5 +462,471 @@ def main():
     console.print()
 
 
+def quote_value(value: str) -> str:
+    """Double-quote a value for a PostgREST logic tree, where , . : ( ) are reserved."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def keyset_params(key: Optional[List[str]]) -> List[tuple]:
+    """
+    Filters for the rows after key in (timestamp, device, sensor) order.
+
+    PostgREST has no row comparison, so this is the expanded OR; the extra
+    timestamp >= filter lets the database range-scan the timestamp index.
+    """
+    if key is None:
+        return []
+    ts, device, sensor = (quote_value(v) for v in key)
+    return [
+        ('timestamp', f'gte.{key[0]}'),
+        ('or', f'(timestamp.gt.{ts},and(timestamp.eq.{ts},device.gt.{device}),'
+               f'and(timestamp.eq.{ts},device.eq.{device},sensor.gt.{sensor}))'),
+    ]
+
+
+def last_key(page: str, header: List[str]) -> List[str]:
+    """(timestamp, device, sensor) of the last row of a CSV page."""
+    row = next(csv.reader([page.rstrip('\n').rsplit('\n', 1)[-1]]))
+    return [row[header.index(column)] for column in KEY_COLUMNS]
+
+
+class CsvExport:
+    """Append CSV pages to a file or stdout; the file can be cut back to the last saved cursor."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.file = sys.stdout if path == '-' else None
+        self.header_written = False
+
+    def open(self, state: Optional[dict]):
+        if self.file is not None:
+            return
+        self.file = open(self.path, 'r+' if state else 'w', newline='')
+        if state:
+            self.file.truncate(state['offset'])  # Drop a page written after the last cursor save
+            self.file.seek(state['offset'])
+            self.rows = state['rows']
+            self.header_written = True
+
+    def write(self, page: str):
+        header, _, body = page.partition('\n')
+        if not self.header_written:
+            self.file.write(header + '\n')
+            self.header_written = True
+        self.file.write(body if body.endswith('\n') else body + '\n')
+        self.rows += body.count('\n') + (not body.endswith('\n'))
+
+    def commit(self) -> Optional[dict]:
+        """Flush; returns the state to save with the cursor, None for stdout."""
+        self.file.flush()
+        if self.file is sys.stdout:
+            return None
+        return {'rows': self.rows, 'offset': self.file.tell()}
+
+    def close(self):
+        if self.file not in (None, sys.stdout):
+            self.file.close()
+
+
+class ParquetExport:
+    """Write pages as row groups to part-NNNNN.parquet files of about file_rows rows in a directory."""
+
+    def __init__(self, path: str, file_rows: int = EXPORT_FILE_ROWS):
+        try:
+            import pyarrow
+            import pyarrow.csv
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires the 'pyarrow' package (uv sync --extra parquet)")
+        self.pa = pyarrow
+        self.path = path
+        self.file_rows = file_rows
+        self.rows = 0
+        self.parts = 0
+        self.writer = None
+        self.part_rows = 0
+
+    def open(self, state: Optional[dict]):
+        os.makedirs(self.path, exist_ok=True)
+        if state:
+            self.rows, self.parts = state['rows'], state['parts']
+        for name in os.listdir(self.path):
+            # Parts not covered by the cursor are incomplete, or left from an earlier export
+            if name.startswith('part-') and name.endswith('.parquet') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(self.path, name))
+
+    def write(self, page: str):
+        pa = self.pa
+        header = page.partition('\n')[0].split(',')
+        types = {name: pa.string() if name in ('device', 'sensor') else pa.float64() for name in header}
+        types['timestamp'] = pa.timestamp('us', tz='UTC')
+        table = pa.csv.read_csv(
+            pa.py_buffer(page.encode()),
+            convert_options=pa.csv.ConvertOptions(column_types=types, strings_can_be_null=False),
+        )
+        if self.writer is None:
+            part = os.path.join(self.path, f'part-{self.parts:05d}.parquet')
+            self.writer = pa.parquet.ParquetWriter(part, table.schema, compression='zstd')
+        self.writer.write_table(table)
+        self.part_rows += table.num_rows
+        self.rows += table.num_rows
+
+    def commit(self) -> Optional[dict]:
+        """Close the part once it is full; only closed parts are safe to resume after."""
+        if self.writer is None or self.part_rows < self.file_rows:
+            return None
+        self.close()
+        return {'rows': self.rows, 'parts': self.parts}
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.parts += 1
+            self.part_rows = 0
+
+
+@app.command()
+def export(
+    output: str = typer.Argument(..., help="CSV file, '-' for stdout, or a directory for --format parquet"),
+    export_format: str = typer.Option("csv", "--format", "-f", help="csv or parquet"),
+    start: Optional[str] = typer.Option(None, "--start", help="Only rows at or after this time (ISO 8601)"),
+    end: Optional[str] = typer.Option(None, "--end", help="Only rows before this time (ISO 8601)"),
+    device: Optional[str] = typer.Option(None, "--device", "-d", help="Only this device"),
+    page_rows: int = typer.Option(EXPORT_PAGE_ROWS, "--page-rows", help="Rows fetched per request"),
+    file_rows: int = typer.Option(EXPORT_FILE_ROWS, "--file-rows", help="Rows per Parquet part file"),
+    resume: bool = typer.Option(True, "--resume/--restart", help="Continue an interrupted export of the same output"),
+):
+    """
+    Stream rows in (timestamp, device, sensor) order to CSV or Parquet.
+
+    Pages are fetched as CSV with a keyset on the last row instead of OFFSET,
+    so each request costs the same however deep the export is, and only one
+    page is held in memory. A <output>.cursor file records progress; re-running
+    the same command continues from it.
+    """
+    if export_format not in ('csv', 'parquet'):
+        raise typer.BadParameter("--format must be csv or parquet")
+    if export_format == 'parquet' and output == '-':
+        raise typer.BadParameter("Parquet export needs a directory, not stdout")
+    try:
+        writer = CsvExport(output) if export_format == 'csv' else ParquetExport(output, file_rows)
+    except RuntimeError as e:
+        err_console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+    cursor_path = None if output == '-' else output.rstrip('/') + '.cursor'
+    state = None
+    if cursor_path and resume and os.path.exists(cursor_path):
+        with open(cursor_path) as f:
+            state = json.load(f)
+        err_console.print(f"[dim]Resuming after {state['rows']:,} rows at {state['key'][0]}[/dim]")
+    writer.open(state)
+    key = state['key'] if state else None
+
+    base_params = [('order', 'timestamp.asc,device.asc,sensor.asc'), ('limit', str(page_rows))]
+    if start:
+        base_params.append(('timestamp', f'gte.{start}'))
+    if end:
+        base_params.append(('timestamp', f'lt.{end}'))
+    if device:
+        base_params.append(('device', f'eq.{device}'))
+    session = requests.Session()
+    url = f"{API_CONFIG['base_url']}/{IOTAWATT_TABLE}"
+    started = time.monotonic()
+    fetched = 0
+    try:
+        while True:
+            headers = {'Authorization': f'Bearer {get_jwt_token()}', 'Accept': 'text/csv'}
+            try:
+                response = session.get(url, headers=headers, params=base_params + keyset_params(key))
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                err_console.print(f"[red]Export stopped after {writer.rows:,} rows: {e}[/red]")
+                if cursor_path:
+                    err_console.print("[dim]Run the same command again to resume[/dim]")
+                raise typer.Exit(1)
+            page = response.text
+            if not page.partition('\n')[2].strip():
+                break
+            writer.write(page)
+            fetched += 1
+            key = last_key(page, page.partition('\n')[0].split(','))
+            saved = writer.commit()
+            if saved is not None and cursor_path:
+                with open(cursor_path + '.tmp', 'w') as f:
+                    json.dump({**saved, 'key': key}, f)
+                os.replace(cursor_path + '.tmp', cursor_path)
+            if fetched % 10 == 0:
+                rate = writer.rows / max(time.monotonic() - started, 1e-9)
+                err_console.print(f"[dim]{writer.rows:,} rows, up to {key[0]} ({rate:,.0f} rows/s)[/dim]")
+    finally:
+        writer.close()
+
+    if cursor_path and os.path.exists(cursor_path):
+        os.remove(cursor_path)
+    elapsed = time.monotonic() - started
+    err_console.print(f"[green]Exported {writer.rows:,} rows to {output} in {elapsed:.1f} s[/green]")
+
+
+class DeviceWindow:
+    """Rolling aggregates of one device's readings, updated per new row and expired from the front."""
+
+    def __init__(self):
+        self.readings = deque()  # (timestamp, watts) in arrival order
+        self.peaks = deque()  # Decreasing watts, for the window maximum
+        self.total = 0.0
+        self.rows = 0
+        self.last_seen = None
+        self.latest = None
+
+    def add(self, ts: datetime, watts: Optional[float]):
+        self.rows += 1
+        self.last_seen = ts if self.last_seen is None else max(self.last_seen, ts)
+        if watts is None:
+            return
+        self.latest = watts
+        self.readings.append((ts, watts))
+        self.total += watts
+        while self.peaks and self.peaks[-1][1] <= watts:
+            self.peaks.pop()
+        self.peaks.append((ts, watts))
+
+    def expire(self, cutoff: datetime):
+        while self.readings and self.readings[0][0] < cutoff:
+            _, watts = self.readings.popleft()
+            self.total -= watts
+        while self.peaks and self.peaks[0][0] < cutoff:
+            self.peaks.popleft()
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.total / len(self.readings) if self.readings else None
+
+    @property
+    def peak(self) -> Optional[float]:
+        return self.peaks[0][1] if self.peaks else None
+
+
+def follow_table(windows: Dict[str, DeviceWindow], recent: deque, span: timedelta, sensor: str,
+                 polls: int, new_rows: int) -> Group:
+    table = Table(title=f"Devices, last {span.total_seconds() / 60:g} min ({sensor} Watts)", box=box.ROUNDED,
+                  title_style="bold blue", header_style="bold cyan")
+    table.add_column("Device", style="yellow")
+    table.add_column("Last Seen", style="green")
+    table.add_column("Latest W", style="red", justify="right")
+    table.add_column("Avg W", style="red", justify="right")
+    table.add_column("Peak W", style="red", justify="right")
+    table.add_column("Rows", justify="right")
+    for device in sorted(windows):
+        w = windows[device]
+        fmt = lambda value: f"{value:.1f}" if value is not None else "N/A"  # noqa: E731
+        table.add_row(device, w.last_seen.strftime("%Y-%m-%d %H:%M:%S"), fmt(w.latest), fmt(w.average),
+                      fmt(w.peak), f"{w.rows:,}")
+
+    rows = Table(title="Latest rows", box=box.SIMPLE, header_style="bold cyan")
+    for column in ("Timestamp", "Device", "Sensor", "Watts"):
+        rows.add_column(column, justify="right" if column == "Watts" else "left")
+    for row in reversed(recent):
+        watts = row.get('Watts')
+        rows.add_row(row['timestamp'], str(row['device']), str(row['sensor']),
+                     f"{watts:.1f}" if watts is not None else "N/A")
+    status = Text(f"Poll {polls}: {new_rows} new rows. Ctrl-C to stop.", style="dim")
+    return Group(table, rows, status)
+
+
+def follow_latest(interval: float = FOLLOW_INTERVAL, span: timedelta = timedelta(minutes=FOLLOW_WINDOW_MINUTES),
+                  sensor: str = 'Net'):
+    """
+    Poll for rows after the newest one seen, keyed on (timestamp, device, sensor),
+    and keep per-device aggregates over the last `span` of data up to date.
+
+    Each poll fetches and processes only the new rows. Rows that arrive with
+    timestamps older than the newest one already seen are not picked up.
+    """
+    windows: Dict[str, DeviceWindow] = {}
+    recent = deque(maxlen=FOLLOW_RECENT_ROWS)
+    newest = None
+
+    # Start from the last `span` of data so the aggregates are filled from the first frame
+    latest = make_api_request(IOTAWATT_TABLE, {'select': 'timestamp', 'order': 'timestamp.desc', 'limit': 1})
+    if latest is None:
+        raise typer.Exit(1)
+    key = None
+    start = None
+    if latest:
+        start = datetime.fromisoformat(latest[0]['timestamp'].replace('Z', '+00:00')) - span
+
+    polls = 0
+    with Live(follow_table(windows, recent, span, sensor, polls, 0), console=console, refresh_per_second=4) as live:
+        try:
+            while True:
+                new_rows = 0
+                while True:
+                    params = [('order', 'timestamp.asc,device.asc,sensor.asc'), ('limit', str(FOLLOW_PAGE_ROWS))]
+                    if key is None and start is not None:
+                        params.append(('timestamp', f'gte.{start.isoformat()}'))
+                    rows = make_api_request(IOTAWATT_TABLE, params + keyset_params(key))
+                    if not rows:
+                        break
+                    for row in rows:
+                        ts = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00'))
+                        newest = ts if newest is None else max(newest, ts)
+                        window = windows.setdefault(row['device'], DeviceWindow())
+                        window.add(ts, row.get('Watts') if row['sensor'] == sensor else None)
+                        recent.append(row)
+                    key = [rows[-1][column] for column in KEY_COLUMNS]
+                    new_rows += len(rows)
+                    if len(rows) < FOLLOW_PAGE_ROWS:
+                        break
+                if newest is not None:
+                    for window in windows.values():
+                        window.expire(newest - span)
+                polls += 1
+                live.update(follow_table(windows, recent, span, sensor, polls, new_rows))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def parse_time(value: str) -> datetime:
+    """ISO 8601 time, UTC if no offset is given."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise typer.BadParameter(f"Not an ISO 8601 time: {value}")
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+
+def parse_duration(value: str) -> int:
+    """Seconds in a duration such as 90s, 15m, 1h or 7d."""
+    try:
+        seconds = int(float(value[:-1]) * UNIT_SECONDS[value[-1]])
+    except (KeyError, ValueError, IndexError):
+        raise typer.BadParameter(f"Not a duration like 15m, 1h or 1d: {value}")
+    if seconds < 1:
+        raise typer.BadParameter(f"Duration must be at least 1s: {value}")
+    return seconds
+
+
+@app.command()
+def rollup(
+    start: str = typer.Option(..., "--start", help="Range start (ISO 8601, UTC if no offset)"),
+    end: Optional[str] = typer.Option(None, "--end", help="Range end (default: now)"),
+    resolution: str = typer.Option("1h", "--resolution", "-r", help="Bucket size: 90s, 15m, 1h, 1d..."),
+    device: Optional[str] = typer.Option(None, "--device", "-d", help="Only this device"),
+    sensor: Optional[str] = typer.Option(None, "--sensor", "-s", help="Only this sensor"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write CSV here instead of showing a table"),
+):
+    """
+    Show or save per-bucket Watts and Wh, read from the coarsest continuous aggregates
+    that fit the range and resolution instead of the raw rows.
+    """
+    range_start = parse_time(start)
+    range_end = parse_time(end) if end else datetime.now(timezone.utc)
+    seconds = parse_duration(resolution)
+    plan = plan_rollup(range_start, range_end, seconds)
+    endpoint = ", ".join(dict.fromkeys(segment[0] for segment in plan)) or IOTAWATT_TABLE
+    err_console.print(f"[dim]Reading {resolution} buckets from {endpoint}[/dim]")
+    started = time.monotonic()
+    rows = fetch_rollup(range_start, range_end, seconds, device, sensor)
+    if rows is None:
+        raise typer.Exit(1)
+    elapsed = time.monotonic() - started
+    if output:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['timestamp'])
+            writer.writeheader()
+            writer.writerows(rows)
+        err_console.print(f"[green]Wrote {len(rows):,} buckets to {output} in {elapsed:.2f} s[/green]")
+        return
+    table = Table(title=f"{resolution} buckets from {endpoint}", box=box.ROUNDED, title_style="bold blue",
+                  header_style="bold cyan")
+    for column in ("Bucket", "Device", "Sensor", "Samples", "Avg W", "Min W", "Max W", "Wh"):
+        table.add_column(column, justify="left" if column in ("Bucket", "Device", "Sensor") else "right")
+    fmt = lambda value: f"{value:.1f}" if value is not None else "N/A"  # noqa: E731
+    for row in rows:
+        table.add_row(row['timestamp'][:16].replace('T', ' '), str(row['device']), str(row['sensor']),
+                      f"{row['samples']:,}", fmt(row['watts_avg']), fmt(row['watts_min']), fmt(row['watts_max']), fmt(row['wh']))
+    console.print(table)
+    err_console.print(f"[dim]{len(rows):,} buckets in {elapsed:.2f} s[/dim]")
+
+
+@app.command()
+def fetch(
+    start: str = typer.Option(..., "--start", help="Range start (ISO 8601, UTC if no offset)"),
+    end: Optional[str] = typer.Option(None, "--end", help="Range end, exclusive (default: now)"),
+    device: Optional[str] = typer.Option(None, "--device", "-d", help="Only this device"),
+    by: str = typer.Option("time", "--by", help="Shard by time or by device"),
+    shard_hours: float = typer.Option(FETCH_SHARD_HOURS, "--shard-hours", help="Hours per time shard"),
+    workers: int = typer.Option(FETCH_WORKERS, "--workers", "-w", help="Concurrent shard requests"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write rows as CSV here ('-' for stdout)"),
+):
+    """Fetch a time range with concurrent sharded requests, in timestamp order."""
+    if by not in ('time', 'device'):
+        raise typer.BadParameter("--by must be time or device")
+    if shard_hours <= 0:
+        raise typer.BadParameter("--shard-hours must be > 0")
+    range_start = parse_time(start)
+    range_end = parse_time(end) if end else datetime.now(timezone.utc)
+
+    started = time.monotonic()
+    rows = fetch_range(range_start, range_end, device, by, shard_hours, workers)
+    elapsed = time.monotonic() - started
+    if rows is None:
+        raise typer.Exit(1)
+    if output:
+        out = sys.stdout if output == '-' else open(output, 'w', newline='')
+        try:
+            if rows:
+                writer = csv.DictWriter(out, fieldnames=list(rows[0]), lineterminator='\n')
+                writer.writeheader()
+                writer.writerows(rows)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    err_console.print(f"[green]Fetched {len(rows):,} rows in {elapsed:.2f} s "
+                      f"({len(rows) / max(elapsed, 1e-9):,.0f} rows/s), by {by}, {workers} workers[/green]")
+
+
+@cache_app.command("info")
+def cache_info():
+    """Show what the local query cache holds."""
+    if query_cache is None:
+        console.print("[yellow]The query cache is disabled (SHOW_DB_CACHE=off or --no-cache)[/yellow]")
+        return
+    tables = query_cache.info()
+    console.print(f"[dim]{query_cache.path}, limit {query_cache.max_bytes / 2**20:,.0f} MB, "
+                  f"{query_cache.bucket_seconds // 60} min buckets, settled after "
+                  f"{query_cache.settle_seconds} s[/dim]")
+    if not tables:
+        console.print("[yellow]The query cache is empty.[/yellow]")
+        return
+    table = Table(title="Query Cache", box=box.ROUNDED, title_style="bold blue", header_style="bold cyan")
+    for column in ("Table", "Buckets", "MB", "From", "To"):
+        table.add_column(column, justify="right" if column in ("Buckets", "MB") else "left")
+    for t in tables:
+        table.add_row(t['table'], f"{t['buckets']:,}", f"{t['bytes'] / 2**20:,.1f}",
+                      t['first'].strftime("%Y-%m-%d %H:%M"), t['last'].strftime("%Y-%m-%d %H:%M"))
+    console.print(table)
+
+
+@cache_app.command("clear")
+def cache_clear(
+    start: Optional[str] = typer.Option(None, "--start", help="Only buckets ending after this time (ISO 8601)"),
+    end: Optional[str] = typer.Option(None, "--end", help="Only buckets starting before this time (ISO 8601)"),
+    device: Optional[str] = typer.Option(None, "--device", "-d", help="Only buckets that can hold this device"),
+    table: Optional[str] = typer.Option(None, "--table", help="Only buckets of this table"),
+):
+    """Invalidate cached buckets, e.g. after a backfill rewrote history."""
+    if query_cache is None:
+        console.print("[yellow]The query cache is disabled (SHOW_DB_CACHE=off or --no-cache)[/yellow]")
+        return
+    deleted = query_cache.clear(table, device, parse_time(start) if start else None,
+                                parse_time(end) if end else None)
+    console.print(f"[green]Removed {deleted:,} cached buckets[/green]")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    app()
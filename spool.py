@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Durable store-and-forward spool for the HTTP proxy engine.
+
+While PostgREST or TimescaleDB is down or slow, the proxy appends accepted
+IoTaWatt uploads to segment files here and acknowledges the device. A
+background drainer sends the spooled rows upstream in large batches, rate
+limited, once the upstream answers again, so recovering devices do not all
+hit the database at once.
+
+Layout of the spool directory:
+    segment-<seq>.jsonl   one JSON object per upload: {"ts", "auth", "rows"} and, if the
+                          upload asked for any, its Prefer options: "prefer"
+    cursor.json           segment and byte offset the drainer has reached
+    rejected.jsonl        uploads the upstream refused with a 4xx
+
+Entries keep the device's Authorization header to replay the upload as the
+same role, so the directory is created 0700 and its files 0600. A token
+that expires while its upload waits is refused on replay (401) and the
+upload ends up in rejected.jsonl, unless the proxy re-signs such tokens
+(proxy.py --spool-resign, see auth.renew_authorization).
+"""
+
+import asyncio
+import json
+import os
+import time
+
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_DRAIN_ROWS = 5000
+DEFAULT_DRAIN_RATE = 20000  # rows per second
+RETRY_MIN = 1.0
+RETRY_MAX = 30.0
+FSYNC_INTERVAL = 1.0
+STATUS_INTERVAL = 10.0
+
+
+def private(path, flags):
+    """open() opener for files only the owner can read: entries hold bearer tokens."""
+    return os.open(path, flags, 0o600)
+
+
+class UpstreamDown(Exception):
+    """The upstream did not accept a drained batch; retry later."""
+
+
+class Spool:
+    """
+    Segment-file spool with a persistent drain cursor.
+
+    append() is called from the event loop and only writes and flushes; the
+    drainer fsyncs the active segment every FSYNC_INTERVAL seconds, so at most
+    that much acknowledged data is exposed to a power loss. Delivery is
+    at-least-once: an upload that timed out upstream may also be spooled.
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, drain_rows=DEFAULT_DRAIN_ROWS,
+                 drain_rate=DEFAULT_DRAIN_RATE):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.drain_rows = drain_rows
+        self.drain_rate = drain_rate
+        self.healthy = True
+        self.depth_entries = 0
+        self.depth_rows = 0
+        self.spooled_rows = 0
+        self.drained_rows = 0
+        self.rejected_rows = 0
+        self.drain_rows_per_sec = 0.0
+        self._oldest = []  # append timestamps of pending entries, oldest first
+        self._writer = None
+        self._write_seq = 0
+        self._dirty = False
+        self._cursor = {"segment": 0, "offset": 0}
+
+    def segment_path(self, seq):
+        return os.path.join(self.directory, f"segment-{seq:08d}.jsonl")
+
+    def _segments(self):
+        return sorted(
+            int(name[8:16]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".jsonl")
+        )
+
+    def open(self):
+        """Create the directory, restore the cursor and count what is still pending."""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.chmod(self.directory, 0o700)  # Also for a directory made before files were private
+        cursor_path = os.path.join(self.directory, "cursor.json")
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                self._cursor = json.load(f)
+
+        segments = self._segments()
+        for seq in segments:
+            if seq < self._cursor["segment"]:
+                os.remove(self.segment_path(seq))
+                continue
+            offset = self._cursor["offset"] if seq == self._cursor["segment"] else 0
+            for entry, _ in self._read_entries(seq, offset):
+                self.depth_entries += 1
+                self.depth_rows += len(entry["rows"])
+                self._oldest.append(entry["ts"])
+
+        if segments and segments[-1] >= self._cursor["segment"]:
+            self._write_seq = segments[-1]
+        else:
+            self._write_seq = self._cursor["segment"]
+            self._cursor["offset"] = 0
+        self._writer = open(self.segment_path(self._write_seq), "ab", opener=private)
+        return self
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer = None
+
+    @property
+    def engaged(self):
+        """New uploads go to the spool while the upstream is down or a backlog remains, to keep order."""
+        return not self.healthy or self.depth_entries > 0
+
+    def mark_down(self, reason):
+        if self.healthy:
+            print(f"[!] Upstream unavailable, spooling uploads: {reason}")
+        self.healthy = False
+
+    def append(self, auth, rows, prefer=""):
+        """Durably queue one upload's rows, with its Prefer options other than return=."""
+        now = time.time()
+        entry = {"ts": now, "auth": auth, "rows": rows}
+        if prefer:
+            entry["prefer"] = prefer
+        line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+        self._writer.write(line)
+        self._writer.flush()
+        self._dirty = True
+        self.depth_entries += 1
+        self.depth_rows += len(rows)
+        self.spooled_rows += len(rows)
+        self._oldest.append(now)
+        if self._writer.tell() >= self.segment_bytes:
+            self._roll()
+
+    def _roll(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._write_seq += 1
+        self._writer = open(self.segment_path(self._write_seq), "ab", opener=private)
+        self._dirty = False
+
+    def _read_entries(self, seq, offset, limit_rows=None):
+        """Yield (entry, end offset) from a segment, skipping a torn trailing line."""
+        rows = 0
+        with open(self.segment_path(seq), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                yield entry, offset
+                rows += len(entry["rows"])
+                if limit_rows is not None and rows >= limit_rows:
+                    break
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, "cursor.json")
+        with open(path + ".tmp", "w", opener=private) as f:
+            json.dump(self._cursor, f)
+        os.replace(path + ".tmp", path)
+
+    def _next_batch(self):
+        """Return (entries, end cursor) for the next batch of up to drain_rows rows."""
+        seq, offset = self._cursor["segment"], self._cursor["offset"]
+        while True:
+            path = self.segment_path(seq)
+            entries, end = [], offset
+            if os.path.exists(path):
+                for entry, end in self._read_entries(seq, offset, self.drain_rows):
+                    entries.append(entry)
+            if entries or seq >= self._write_seq:
+                return entries, {"segment": seq, "offset": end}
+            # Fully drained segment that is no longer written to
+            if os.path.exists(path):
+                os.remove(path)
+            seq, offset = seq + 1, 0
+            self._cursor = {"segment": seq, "offset": 0}
+            self._save_cursor()
+
+    def _reject(self, entries, status):
+        with open(os.path.join(self.directory, "rejected.jsonl"), "ab", opener=private) as f:
+            for entry in entries:
+                entry["status"] = status
+                f.write(json.dumps(entry, separators=(",", ":")).encode() + b"\n")
+        print(f"[!] Upstream rejected {len(entries)} spooled upload(s) ({status}), see rejected.jsonl")
+
+    def reject(self, auth, rows, status, prefer=""):
+        """Record an upload the upstream refused outside the drainer (see HttpProxy.settle_late)."""
+        entry = {"ts": time.time(), "auth": auth, "rows": rows}
+        if prefer:
+            entry["prefer"] = prefer
+        self._reject([entry], status)
+        self.rejected_rows += len(rows)
+
+    async def _send(self, send_rows, entries):
+        """Send entries grouped by Authorization and Prefer options; returns rows delivered."""
+        groups = {}
+        for entry in entries:
+            groups.setdefault((entry["auth"], entry.get("prefer", "")), []).append(entry)
+        delivered = 0
+        for key, group in groups.items():
+            delivered += await self._send_group(send_rows, key, group)
+        return delivered
+
+    async def _send_group(self, send_rows, key, group):
+        auth, prefer = key
+        rows = [row for entry in group for row in entry["rows"]]
+        status = await send_rows(auth, rows, prefer, max(entry["ts"] for entry in group))
+        if status >= 500:
+            raise UpstreamDown(f"status {status}")
+        if status < 400:
+            return len(rows)
+        if len(group) == 1:
+            self._reject(group, status)
+            self.rejected_rows += len(rows)
+            return 0
+        # One bad upload fails the whole insert; isolate it instead of rejecting the batch
+        delivered = 0
+        for entry in group:
+            delivered += await self._send_group(send_rows, key, [entry])
+        return delivered
+
+    def stats(self):
+        return {
+            "depth_entries": self.depth_entries,
+            "depth_rows": self.depth_rows,
+            "oldest_age_seconds": time.time() - self._oldest[0] if self._oldest else 0.0,
+            "drain_rows_per_second": self.drain_rows_per_sec,
+            "spooled_rows_total": self.spooled_rows,
+            "drained_rows_total": self.drained_rows,
+            "rejected_rows_total": self.rejected_rows,
+            "healthy": self.healthy,
+        }
+
+    def status_line(self):
+        s = self.stats()
+        return (f"[*] Spool: {s['depth_entries']} uploads / {s['depth_rows']} rows pending, "
+                f"oldest {s['oldest_age_seconds']:.0f} s, draining {s['drain_rows_per_second']:.0f} rows/s")
+
+    async def drain(self, send_rows):
+        """
+        Run forever: send spooled rows upstream in batches of up to drain_rows,
+        at most drain_rate rows per second, backing off while the upstream is down.
+
+        send_rows(auth, rows, prefer, spooled_at) is an async callable returning the HTTP status and
+        raising OSError/ConnectionError/TimeoutError if the upstream is unreachable.
+        """
+        retry = RETRY_MIN
+        last_fsync = last_status = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if self._dirty and now - last_fsync >= FSYNC_INTERVAL:
+                self._dirty = False
+                last_fsync = now
+                try:
+                    await asyncio.to_thread(os.fsync, self._writer.fileno())
+                except OSError:
+                    pass  # Segment rolled (and fsynced) meanwhile
+            if self.depth_entries and now - last_status >= STATUS_INTERVAL:
+                print(self.status_line())
+                last_status = now
+
+            if not self.depth_entries:
+                self.drain_rows_per_sec = 0.0
+                await asyncio.sleep(0.1 if self.healthy else retry)
+                if not self.healthy and not self.depth_entries:
+                    # Nothing spooled yet since the failure; let live traffic probe the upstream
+                    self.healthy = True
+                continue
+
+            entries, end = self._next_batch()
+            if not entries:
+                await asyncio.sleep(0.1)
+                continue
+
+            started = time.monotonic()
+            try:
+                delivered = await self._send(send_rows, entries)
+            except (OSError, ConnectionError, asyncio.TimeoutError, UpstreamDown) as e:
+                self.mark_down(str(e) or type(e).__name__)
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, RETRY_MAX)
+                continue
+
+            if not self.healthy:
+                print("[*] Upstream recovered, draining spool")
+            self.healthy = True
+            retry = RETRY_MIN
+            self._cursor = end
+            self._save_cursor()
+            rows = sum(len(entry["rows"]) for entry in entries)
+            self.depth_entries -= len(entries)
+            self.depth_rows -= rows
+            del self._oldest[:len(entries)]
+            self.drained_rows += delivered
+
+            # Rate limit: a batch of n rows occupies n / drain_rate seconds
+            elapsed = time.monotonic() - started
+            pause = rows / self.drain_rate - elapsed if self.drain_rate else 0
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self.drain_rows_per_sec = rows / max(time.monotonic() - started, 1e-6)
+            if not self.depth_entries:
+                print(f"[*] Spool drained ({self.drained_rows} rows delivered so far)")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Storage report for the IoTaWatt hypertable: sizes, compression and query latency.
+
+init_db.sh sets the chunk interval, compression and retention from .env.
+This tool shows what they achieve: table, TOAST and per-index sizes,
+compressed versus uncompressed bytes, chunk counts, the active policies, and
+the median execution time of a few representative queries (EXPLAIN ANALYZE,
+so only database time is measured). With IOTAWATT_LAYOUT=normalized the
+sizes are those of the id hypertable and the queries go through the view.
+
+Save a report, change the policies or compress, then compare:
+
+    uv run storage.py report -o before.json
+    uv run storage.py compress --older-than "7 days"
+    uv run storage.py report -o after.json --compare before.json
+"""
+
+import json
+import statistics
+import time
+from typing import Optional
+
+import typer
+
+from backfill import DATA_TABLE, IOTAWATT_SCHEMA, IOTAWATT_TABLE, default_dsn, import_psycopg2
+
+
+DEFAULT_REPEAT = 5
+
+# Representative queries; %(device)s and %(latest)s come from the newest row
+QUERIES = {
+    "latest_50": """
+        SELECT * FROM {table} ORDER BY timestamp DESC LIMIT 50""",
+    "device_last_day": """
+        SELECT * FROM {table}
+        WHERE device = %(device)s AND timestamp >= %(latest)s::timestamptz - INTERVAL '1 day'
+        ORDER BY timestamp DESC""",
+    "device_week_a_month_ago": """
+        SELECT * FROM {table}
+        WHERE device = %(device)s
+          AND timestamp >= %(latest)s::timestamptz - INTERVAL '37 days'
+          AND timestamp < %(latest)s::timestamptz - INTERVAL '30 days'""",
+    "energy_by_device_30_days": """
+        SELECT device, sensor, sum("Wh") FROM {table}
+        WHERE timestamp >= %(latest)s::timestamptz - INTERVAL '30 days'
+        GROUP BY device, sensor""",
+}
+
+app = typer.Typer(help="Hypertable size, compression and query latency report")
+
+
+def connect(dsn):
+    try:
+        psycopg2 = import_psycopg2()
+    except RuntimeError as e:
+        print(f"[-] {e}")
+        raise typer.Exit(1)
+    try:
+        conn = psycopg2.connect(dsn or default_dsn())
+    except psycopg2.Error as e:
+        print(f"[-] Cannot connect: {str(e).strip()}")
+        raise typer.Exit(1)
+    conn.autocommit = True
+    return conn
+
+
+def table_name():
+    """The table or view that PostgREST serves."""
+    return f"{IOTAWATT_SCHEMA}.{IOTAWATT_TABLE}"
+
+
+def hypertable_name():
+    """The hypertable holding the rows: the same table, or the id table of the normalized layout."""
+    return f"{IOTAWATT_SCHEMA}.{DATA_TABLE}"
+
+
+def collect_sizes(cur):
+    """Sizes in bytes, chunk and compression counts, and policies of the hypertable."""
+    name = hypertable_name()
+    report = {}
+    cur.execute("SELECT table_bytes, index_bytes, toast_bytes, total_bytes FROM hypertable_detailed_size(%s)",
+                (name,))
+    report.update(zip(("table_bytes", "index_bytes", "toast_bytes", "total_bytes"), cur.fetchone()))
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = %s AND tablename = %s ORDER BY indexname",
+                (IOTAWATT_SCHEMA, DATA_TABLE))
+    for (index,) in cur.fetchall():
+        cur.execute("SELECT hypertable_index_size(format('%%I.%%I', %s::text, %s::text)::regclass)",
+                    (IOTAWATT_SCHEMA, index))
+        report[f"index_bytes.{index}"] = cur.fetchone()[0]
+    cur.execute("""
+        SELECT count(*), count(*) FILTER (WHERE is_compressed) FROM timescaledb_information.chunks
+        WHERE hypertable_schema = %s AND hypertable_name = %s""", (IOTAWATT_SCHEMA, DATA_TABLE))
+    report["chunks"], report["compressed_chunks"] = cur.fetchone()
+    cur.execute("SELECT before_compression_total_bytes, after_compression_total_bytes "
+                "FROM hypertable_compression_stats(%s)", (name,))
+    row = cur.fetchone()
+    report["before_compression_bytes"], report["after_compression_bytes"] = row if row else (None, None)
+    cur.execute("""
+        SELECT time_interval::text FROM timescaledb_information.dimensions
+        WHERE hypertable_schema = %s AND hypertable_name = %s AND dimension_number = 1""",
+                (IOTAWATT_SCHEMA, DATA_TABLE))
+    report["chunk_interval"] = cur.fetchone()[0]
+    cur.execute("""
+        SELECT proc_name, config::text FROM timescaledb_information.jobs
+        WHERE hypertable_schema = %s AND hypertable_name = %s ORDER BY proc_name""",
+                (IOTAWATT_SCHEMA, DATA_TABLE))
+    report["policies"] = {proc: json.loads(config) if config else {} for proc, config in cur.fetchall()}
+    return report
+
+
+def time_queries(cur, repeat):
+    """Median EXPLAIN ANALYZE execution time in ms of each of QUERIES."""
+    cur.execute(f"SELECT device, timestamp FROM {table_name()} ORDER BY timestamp DESC LIMIT 1")
+    row = cur.fetchone()
+    if row is None:
+        return {}
+    params = {"device": row[0], "latest": row[1]}
+    timings = {}
+    for label, sql in QUERIES.items():
+        statement = "EXPLAIN (ANALYZE, FORMAT JSON) " + sql.format(table=table_name())
+        samples = []
+        for _ in range(repeat):
+            cur.execute(statement, params)
+            plan = cur.fetchone()[0]
+            samples.append(plan[0]["Execution Time"])
+        timings[f"query_ms.{label}"] = round(statistics.median(samples), 3)
+    return timings
+
+
+def show(report, baseline=None):
+    print(f"{'metric':<44} {'value':>16}" + (f" {'baseline':>16} {'change':>8}" if baseline else ""))
+    for key, value in report.items():
+        if isinstance(value, dict):
+            continue
+        line = f"{key:<44} {format_value(key, value):>16}"
+        if baseline:
+            before = baseline.get(key)
+            line += f" {format_value(key, before):>16}"
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                line += f" {(value - before) / before * 100:>+7.1f}%"
+        print(line)
+    for proc, config in report.get("policies", {}).items():
+        print(f"[*] Policy {proc}: {config}")
+
+
+def format_value(key, value):
+    if value is None:
+        return "-"
+    if "bytes" in key:
+        return f"{value / 1024 ** 2:,.1f} MB"
+    if isinstance(value, float):
+        return f"{value:,.3f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+@app.command()
+def report(
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Save the report as JSON"),
+    compare: Optional[str] = typer.Option(None, "--compare", "-c", help="JSON report to compare against"),
+    repeat: int = typer.Option(DEFAULT_REPEAT, "--repeat", help="Runs per query; the median is reported"),
+    queries: bool = typer.Option(True, "--queries/--no-queries", help="Time the representative queries"),
+    dsn: Optional[str] = typer.Option(None, "--dsn", help="libpq connection string (default from POSTGRES_* in .env)"),
+):
+    """Show sizes, compression, policies and query latency of the hypertable."""
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            result = {"table": table_name(), "taken_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+            result.update(collect_sizes(cur))
+            if queries:
+                result.update(time_queries(cur, max(1, repeat)))
+    finally:
+        conn.close()
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+    show(result, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"[+] Saved report to {output}")
+
+
+@app.command()
+def compress(
+    older_than: str = typer.Option("7 days", "--older-than", help="Compress chunks older than this interval"),
+    dsn: Optional[str] = typer.Option(None, "--dsn", help="libpq connection string (default from POSTGRES_* in .env)"),
+):
+    """Compress eligible chunks now instead of waiting for the compression policy."""
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT show_chunks(%s, older_than => %s::interval)", (hypertable_name(), older_than))
+            chunks = [chunk for (chunk,) in cur.fetchall()]
+            started = time.monotonic()
+            for i, chunk in enumerate(chunks, 1):
+                cur.execute("SELECT compress_chunk(%s, if_not_compressed => TRUE)", (chunk,))
+                print(f"[*] {i}/{len(chunks)} {chunk}")
+    finally:
+        conn.close()
+    print(f"[+] Compressed {len(chunks)} chunks in {time.monotonic() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,7 +1,6 @@
 #!/bin/bash
 
-JWT_TOKEN_READER=$(uv run jwtutil.py generate reader)
-JWT_TOKEN_WRITER=$(uv run jwtutil.py generate writer)
+{ read -r JWT_TOKEN_READER; read -r JWT_TOKEN_WRITER; } < <(uv run jwtutil.py generate reader writer)
 PGRST=http://localhost:$POSTGREST_EXTERNAL_PORT
 
 echo "Using PostgREST endpoint: $PGRST"
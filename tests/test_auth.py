@@ -0,0 +1,107 @@
+import time
+
+import jwt
+import pytest
+
+import jwtutil
+from auth import AuthError, RateLimiter, TokenVerifier, parse_rate_limits
+
+SECRET = "auth-test-secret-auth-test-secret"
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(jwtutil, "JWT_SECRET", SECRET)
+    jwtutil._token_cache.clear()
+    yield
+    jwtutil._token_cache.clear()
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_signed_tokens_match_pyjwt():
+    claims = {"role": "writer", "iat": 1700000000, "iss": jwtutil.ISSUER, "device": "d1"}
+    assert jwtutil.sign_hs256(claims) == jwt.encode(claims, SECRET, algorithm="HS256")
+    (device, token), = jwtutil.mint_device_tokens("writer", ["d1"], exp_hours=1)
+    assert device == "d1" and jwtutil.decode_jwt_token(token)["device"] == "d1"
+
+
+def test_cached_token_is_reused_until_it_is_due_for_refresh(monkeypatch):
+    token = jwtutil.cached_jwt_token("writer", 1)
+    assert jwtutil.cached_jwt_token("writer", 1) == token
+    assert jwtutil.cached_jwt_token("writer", 1, {"device": "d1"}) != token
+    due = jwtutil._token_cache[("writer", 1, "null")][1]
+    monkeypatch.setattr(jwtutil.time, "time", lambda: due + 1)
+    jwtutil.cached_jwt_token("writer", 1)  # Minted again
+    assert jwtutil._token_cache[("writer", 1, "null")][1] > due
+
+
+def test_verified_tokens_are_cached():
+    verifier = TokenVerifier()
+    token = jwtutil.generate_jwt_token("writer", 1)
+    assert [verifier.check(f"Bearer {token}") for _ in range(3)] == ["writer"] * 3
+    assert (verifier.misses, verifier.hits) == (1, 2)
+
+
+@pytest.mark.parametrize("authorization", [
+    None,
+    "",
+    "Basic dXNlcjpwYXNz",
+    "Bearer ",
+    "Bearer not-a-token",
+    "Bearer " + jwt.encode({"role": "writer"}, "some-other-secret-some-other-secret", algorithm="HS256"),
+    "Bearer " + jwt.encode({"role": "writer", "exp": int(time.time()) - 10}, SECRET, algorithm="HS256"),
+])
+def test_missing_forged_and_expired_tokens_are_refused(authorization):
+    verifier = TokenVerifier()
+    with pytest.raises(AuthError) as caught:
+        verifier.check(authorization)
+    assert caught.value.status == 401
+    assert verifier.rejected == 1 and not verifier.cache
+
+
+def test_cached_token_is_refused_once_it_expires():
+    clock = Clock(time.time())
+    verifier = TokenVerifier(clock=clock)
+    token = jwt.encode({"role": "writer", "exp": int(clock.now) + 60}, SECRET, algorithm="HS256")
+    assert verifier.check(f"Bearer {token}") == "writer"
+    clock.now += 61
+    with pytest.raises(AuthError) as caught:
+        verifier.check(f"Bearer {token}")
+    assert caught.value.status == 401 and token not in verifier.cache
+
+
+def test_token_cache_is_bounded():
+    verifier = TokenVerifier(cache_size=2)
+    tokens = [jwtutil.generate_jwt_token("writer", 1, {"device": f"d{i}"}) for i in range(3)]
+    for token in tokens:
+        verifier.check(f"Bearer {token}")
+    assert list(verifier.cache) == tokens[1:]
+
+
+def test_rate_limit_per_role():
+    clock = Clock()
+    verifier = TokenVerifier(limiter=RateLimiter(parse_rate_limits(["writer=2:2"]), clock=clock))
+    writer, reader = jwtutil.generate_jwt_token("writer", 1), jwtutil.generate_jwt_token("reader", 1)
+    assert verifier.check(f"Bearer {writer}") == verifier.check(f"Bearer {writer}") == "writer"
+    with pytest.raises(AuthError) as caught:
+        verifier.check(f"Bearer {writer}")
+    assert caught.value.status == 429 and caught.value.retry_after == 1
+    assert all(verifier.check(f"Bearer {reader}") == "reader" for _ in range(5))  # Not limited
+    clock.now += 0.5
+    assert verifier.check(f"Bearer {writer}") == "writer"
+    assert verifier.limiter.limited == 1
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits(["writer=5", "*=0.5:3"]) == {"writer": (5.0, 5.0), "*": (0.5, 3.0)}
+    assert parse_rate_limits(["reader=0.2"]) == {"reader": (0.2, 1.0)}
+    for spec in ("writer", "=5", "writer=0", "writer=x", "writer=5:0.5"):
+        with pytest.raises(ValueError):
+            parse_rate_limits([spec])
@@ -0,0 +1,185 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import backfill
+
+TEST_DSN = os.environ.get("IOTAWATT_TEST_DSN")  # A scratch database; tests create and drop their own schema
+
+
+def write_history(path, hours, sensors=("main", "solar"), device="dev1"):
+    """Narrow CSV whose rows cycle through `hours` hours, so consecutive rows land in different chunks."""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with open(path, "w") as f:
+        f.write("timestamp,device,sensor,Watts,Wh\n")
+        for minute in range(3):
+            for hour in range(hours):
+                ts = start + timedelta(hours=hour, minutes=minute)
+                for i, sensor in enumerate(sensors):
+                    f.write(f"{ts.isoformat()},{device},{sensor},{hour * 10 + i}.5,{minute}\n")
+
+
+@pytest.mark.parametrize("copy_format", list(backfill.CopyFormat))
+def test_spill_bounds_open_files(tmp_path, monkeypatch, copy_format):
+    source = str(tmp_path / "history.csv")
+    write_history(source, hours=50)
+    expected_dir, bounded_dir = tmp_path / "expected", tmp_path / "bounded"
+    expected_dir.mkdir()
+    bounded_dir.mkdir()
+    expected = backfill.spill([source], None, str(expected_dir), 1, copy_format)
+
+    opened, peak = [], [0]
+    real_open = open
+
+    def counting_open(path, mode="r", *args, **kwargs):
+        f = real_open(path, mode, *args, **kwargs)
+        if str(path).startswith(str(bounded_dir)):
+            opened.append(f)
+            peak[0] = max(peak[0], sum(not other.closed for other in opened))
+        return f
+
+    monkeypatch.setattr(backfill, "MAX_OPEN_CHUNKS", 4)
+    monkeypatch.setattr("builtins.open", counting_open)
+    try:
+        chunks = backfill.spill([source], None, str(bounded_dir), 1, copy_format)
+    finally:
+        monkeypatch.undo()
+    assert len(chunks) == 50
+    assert len(opened) > 50  # Suspended chunks were reopened
+    assert all(f.closed for f in opened)
+    assert peak[0] <= 5  # MAX_OPEN_CHUNKS, plus a new chunk's file before the oldest is suspended
+    assert [c.checksum for c in chunks] == [c.checksum for c in expected]
+    for chunk, reference in zip(chunks, expected):
+        with open(chunk.path, "rb") as a, open(reference.path, "rb") as b:
+            assert a.read() == b.read()
+        assert set(chunk.series) == {("dev1", "main"), ("dev1", "solar")}
+    assert sorted(os.listdir(bounded_dir)) == sorted(os.listdir(expected_dir))
+
+
+def test_chunk_tracks_each_series_span(tmp_path):
+    source = str(tmp_path / "today.csv")
+    with open(source, "w") as f:
+        f.write("timestamp,device,sensor,Watts\n")
+        f.write("2025-01-01T11:00:00Z,dev1,main,1\n2025-01-01T10:00:00Z,dev1,main,2\n")
+        f.write("2025-01-01T10:30:00Z,dev1,solar,3\n2025-01-01T11:59:00Z,dev1,main,4\n")
+    chunk, = backfill.spill([source], None, str(tmp_path), 24, backfill.CopyFormat.csv)
+    at = lambda text: datetime.fromisoformat(text).replace(tzinfo=timezone.utc)  # noqa: E731
+    assert chunk.delete_params() == (
+        ["dev1", "dev1"], ["main", "solar"],
+        [at("2025-01-01T10:00"), at("2025-01-01T10:30")], [at("2025-01-01T11:59"), at("2025-01-01T10:30")],
+        at("2025-01-01T10:00"), at("2025-01-01T11:59"),
+    )
+
+
+def make_schema(monkeypatch, layout):
+    """A schema with the layout's tables and the backfill module pointed at it; yields (connection, schema)."""
+    if not TEST_DSN:
+        pytest.skip("IOTAWATT_TEST_DSN is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    schema = f"backfill_test_{os.getpid()}"
+    measures = ", ".join(f'"{name}" DOUBLE PRECISION' for name in backfill.MEASURES)
+    conn = psycopg2.connect(TEST_DSN)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        if layout == "normalized":
+            for kind in ("devices", "sensors"):
+                cur.execute(f"CREATE TABLE {schema}.iotawatt_{kind} "
+                            f"(id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+            cur.execute(f"CREATE TABLE {schema}.iotawatt_data "
+                        f"(timestamp TIMESTAMPTZ NOT NULL, device_id SMALLINT, sensor_id SMALLINT, {measures})")
+        else:
+            cur.execute(f"CREATE TABLE {schema}.iotawatt "
+                        f"(timestamp TIMESTAMPTZ NOT NULL, device TEXT, sensor TEXT, {measures})")
+    monkeypatch.setattr(backfill, "IOTAWATT_SCHEMA", schema)
+    monkeypatch.setattr(backfill, "IOTAWATT_TABLE", "iotawatt")
+    monkeypatch.setattr(backfill, "IOTAWATT_LAYOUT", layout)
+    monkeypatch.setattr(backfill, "DATA_TABLE", "iotawatt_data" if layout == "normalized" else "iotawatt")
+    try:
+        yield conn, schema
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+
+@pytest.fixture
+def normalized_schema(monkeypatch):
+    yield from make_schema(monkeypatch, "normalized")
+
+
+@pytest.fixture(params=["text", "normalized"])
+def any_schema(monkeypatch, request):
+    yield from make_schema(monkeypatch, request.param)
+
+
+def assert_dense_ids(conn, schema, devices, sensors):
+    with conn.cursor() as cur:
+        for kind, expected in (("devices", devices), ("sensors", sensors)):
+            cur.execute(f"SELECT count(*), max(id) FROM {schema}.iotawatt_{kind}")
+            assert cur.fetchone() == (expected, expected), kind
+
+
+def test_load_keeps_lookup_ids_dense(tmp_path, normalized_schema):
+    conn, schema = normalized_schema
+    sensors = [f"ct{i}" for i in range(14)]
+    source = str(tmp_path / "history.csv")
+    write_history(source, hours=200, sensors=sensors)
+    chunks = backfill.spill([source], None, str(tmp_path), 1, backfill.CopyFormat.csv)
+    loader = backfill.Loader(TEST_DSN, backfill.CopyFormat.csv)
+    try:
+        loader.create_ledger()
+        for chunk in chunks:  # Without add_names(): every chunk's after_copy meets names already there
+            assert loader.load(chunk) == chunk.rows
+    finally:
+        loader.close()
+    assert_dense_ids(conn, schema, 1, len(sensors))
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {schema}.iotawatt_data")
+        assert cur.fetchone()[0] == sum(chunk.rows for chunk in chunks)
+
+
+def test_parallel_backfill_keeps_lookup_ids_dense(tmp_path, normalized_schema):
+    conn, schema = normalized_schema
+    sensors = [f"ct{i}" for i in range(14)]
+    files = []
+    for device in ("dev1", "dev2", "dev3"):
+        files.append(str(tmp_path / f"{device}.csv"))
+        write_history(files[-1], hours=100, sensors=sensors, device=device)
+    for force in (False, True):  # Reloading every chunk adds no names
+        backfill.backfill(files=files, device=None, workers=4, chunk_hours=1, copy_format=backfill.CopyFormat.binary,
+                          dsn=TEST_DSN, force=force, spill_dir=str(tmp_path), refresh=False)
+    assert_dense_ids(conn, schema, 3, len(sensors))
+
+
+def test_backfill_keeps_rows_outside_the_input_span(tmp_path, any_schema):
+    conn, schema = any_schema
+    # A day of live rows for two sensors, one a minute
+    live = ("SELECT t, {device}, {sensor}, 1.0 FROM generate_series("
+            "'2025-01-01T00:00Z'::timestamptz, '2025-01-01T23:59Z', '1 minute') t")
+    with conn.cursor() as cur:
+        if backfill.IOTAWATT_LAYOUT == "normalized":
+            cur.execute(f"INSERT INTO {schema}.iotawatt_devices (name) VALUES ('dev1')")
+            cur.execute(f"INSERT INTO {schema}.iotawatt_sensors (name) VALUES ('main'), ('solar')")
+            for sensor_id in (1, 2):
+                cur.execute(f'INSERT INTO {schema}.iotawatt_data (timestamp, device_id, sensor_id, "Watts") '
+                            + live.format(device=1, sensor=sensor_id))
+        else:
+            for sensor in ("main", "solar"):
+                cur.execute(f'INSERT INTO {schema}.iotawatt (timestamp, device, sensor, "Watts") '
+                            + live.format(device="'dev1'", sensor=f"'{sensor}'"))
+    # Two hours of history for one sensor, with a 24 h chunk around them
+    source = str(tmp_path / "today.csv")
+    with open(source, "w") as f:
+        f.write("timestamp,device,sensor,Watts\n")
+        for minute in range(120):
+            f.write(f"{datetime(2025, 1, 1, 10, tzinfo=timezone.utc) + timedelta(minutes=minute)},dev1,main,2.0\n")
+    backfill.backfill(files=[source], device=None, workers=1, chunk_hours=24, copy_format=backfill.CopyFormat.csv,
+                      dsn=TEST_DSN, force=False, spill_dir=str(tmp_path), refresh=False)
+    view = (f"{schema}.iotawatt" if backfill.IOTAWATT_LAYOUT == "text" else
+            f"(SELECT r.*, s.name AS sensor FROM {schema}.iotawatt_data r "
+            f"JOIN {schema}.iotawatt_sensors s ON s.id = r.sensor_id) v")
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT sensor, "Watts", count(*) FROM {view} GROUP BY 1, 2 ORDER BY 1, 2')
+        assert cur.fetchall() == [("main", 1.0, 24 * 60 - 120), ("main", 2.0, 120), ("solar", 1.0, 24 * 60)]
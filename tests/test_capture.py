@@ -0,0 +1,58 @@
+import os
+
+import capture
+from capture import DOWNLOAD, UPLOAD, CaptureFormat, CaptureReader, CaptureWriter
+
+
+def write_binary_capture(directory, rotate_bytes=0):
+    writer = CaptureWriter(str(directory), capture_format=CaptureFormat.binary, rotate_bytes=rotate_bytes).start()
+    writer.record("10.0.0.1-5000", UPLOAD, b"POST /iotawatt HTTP/1.1\r\n\r\n")
+    writer.record("10.0.0.2-5001", UPLOAD, b"GET / HTTP/1.1\r\n\r\n")
+    writer.record_count("10.0.0.1-5000", DOWNLOAD, 123)
+    writer.close_connection("10.0.0.1-5000")
+    writer.stop()
+    return writer
+
+
+def test_binary_capture_round_trip(tmp_path):
+    writer = write_binary_capture(tmp_path)
+    assert writer.written == 3 and writer.dropped == 0
+    path = writer.path_for("any")
+    with CaptureReader(path) as reader:
+        offsets = reader.offsets()
+        assert list(offsets) == list(reader.scan_offsets())  # The .idx file matches the records
+        records = [reader.record(offset) for offset in offsets]
+        kinds = [kind for _, _, _, kind, _, _ in records]
+        assert kinds == [capture.KIND_OPEN, capture.KIND_DATA, capture.KIND_OPEN, capture.KIND_DATA,
+                         capture.KIND_COUNT, capture.KIND_CLOSE]
+        _, _, _, _, start, length = records[4]
+        assert capture.COUNT.unpack(reader.mm[start:start + length]) == (123,)
+        connections = capture.load_connections(reader)
+        assert [(conn["name"], conn["closed"], len(conn["sends"])) for conn in connections] == [
+            ("10.0.0.1-5000", True, 1), ("10.0.0.2-5001", False, 1)]
+        _, start, length = connections[0]["sends"][0]
+        assert bytes(reader.mm[start:start + length]) == b"POST /iotawatt HTTP/1.1\r\n\r\n"
+
+
+def test_index_is_rebuilt_from_the_records(tmp_path):
+    path = write_binary_capture(tmp_path).path_for("any")
+    with CaptureReader(path) as reader:
+        expected = list(reader.offsets())
+    os.remove(path + ".idx")
+    assert capture.build_index(path) == len(expected)
+    with CaptureReader(path) as reader:
+        assert list(reader.offsets()) == expected
+
+
+def test_rotation_re_announces_open_connections(tmp_path):
+    write_binary_capture(tmp_path, rotate_bytes=64)
+    paths = list(tmp_path.glob("*.iwcap"))
+    assert len(paths) > 1
+    for path in paths:  # Every connection a file mentions is named in that file before its records
+        with CaptureReader(str(path)) as reader:
+            named = set()
+            for offset in reader.offsets():
+                _, conn_id, _, kind, _, _ = reader.record(offset)
+                if kind == capture.KIND_OPEN:
+                    named.add(conn_id)
+                assert conn_id in named
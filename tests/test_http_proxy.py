@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from http_proxy import HttpProxy, HttpRequest, make_response
+from spool import Spool
+
+ROWS = [{"timestamp": "2025-01-01T00:00:00Z", "device": "d1", "sensor": "s1", "Watts": 1.0}]
+
+
+def insert(prefer="return=minimal", auth="Bearer a", rows=ROWS):
+    headers = [("Content-Type", "application/json"), ("Authorization", auth), ("Prefer", prefer)]
+    return HttpRequest("POST /iotawatt HTTP/1.1", headers, json.dumps(rows).encode())
+
+
+class FakeUpstream:
+    """Records the inserts sent upstream; answers each with `status` after `delay` seconds."""
+
+    def __init__(self, status=201, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        if isinstance(self.status, Exception):
+            raise self.status
+        return make_response(self.status)
+
+    request = __call__  # As a connection pool
+
+
+def make_proxy(tmp_path, upstream, coalesce=True):
+    spool = Spool(str(tmp_path / "spool")).open()
+    proxy = HttpProxy("upstream", 3000, log_payload=False, coalesce=coalesce, coalesce_window=0.01,
+                      spool=spool, upstream_timeout=0.05, pool=upstream)
+    if proxy.coalescer is not None:
+        proxy.coalescer.send = upstream
+    return proxy, spool
+
+
+def spooled_entries(spool):
+    spool._writer.flush()
+    with open(spool.segment_path(spool._write_seq)) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+def test_slow_insert_that_commits_is_not_spooled(tmp_path, coalesce):
+    upstream = FakeUpstream(201, delay=0.2)
+    proxy, spool = make_proxy(tmp_path, upstream, coalesce)
+
+    async def run():
+        response = await proxy.handle_request(insert(), {"reader": None, "writer": None})
+        assert response.status == 201 and response.header("X-Proxy-Spooled") == "pending"
+        await asyncio.gather(*proxy.late)
+
+    asyncio.run(run())
+    assert len(upstream.requests) == 1
+    assert spool.depth_rows == 0 and not proxy.late
+
+
+@pytest.mark.parametrize("outcome", [503, ConnectionError("reset")])
+def test_slow_insert_that_fails_is_spooled_once_it_fails(tmp_path, outcome):
+    upstream = FakeUpstream(outcome, delay=0.2)
+    proxy, spool = make_proxy(tmp_path, upstream)
+
+    async def run():
+        await proxy.handle_request(insert(), {"reader": None, "writer": None})
+        assert spool.depth_rows == 0  # Still in flight
+        await asyncio.gather(*proxy.late, return_exceptions=True)
+
+    asyncio.run(run())
+    assert spool.depth_rows == len(ROWS)
+    assert [entry["rows"] for entry in spooled_entries(spool)] == [ROWS]
+
+
+def test_slow_insert_that_is_refused_is_recorded_as_rejected(tmp_path):
+    proxy, spool = make_proxy(tmp_path, FakeUpstream(400, delay=0.2))
+
+    async def run():
+        await proxy.handle_request(insert(), {"reader": None, "writer": None})
+        await asyncio.gather(*proxy.late)
+
+    asyncio.run(run())
+    assert spool.depth_rows == 0 and spool.rejected_rows == len(ROWS)
+    with open(os.path.join(spool.directory, "rejected.jsonl")) as f:
+        assert json.loads(f.readline())["status"] == 400
+
+
+def test_coalesced_and_spooled_inserts_keep_prefer_options(tmp_path):
+    upstream = FakeUpstream(201)
+    proxy, spool = make_proxy(tmp_path, upstream)
+    merge = "return=minimal, resolution=merge-duplicates"
+
+    async def run():
+        await asyncio.gather(*(proxy.handle_request(request, {"reader": None, "writer": None})
+                               for request in (insert(merge), insert(), insert(merge))))
+        spool.mark_down("test")
+        await proxy.handle_request(insert(merge), {"reader": None, "writer": None})
+
+    asyncio.run(run())
+    prefers = sorted(request.header("Prefer") for request in upstream.requests)
+    assert prefers == ["return=minimal", merge]  # One bulk insert per set of options
+    merged = next(r for r in upstream.requests if "resolution" in r.header("Prefer"))
+    assert len(json.loads(merged.body)) == 2
+    assert [entry.get("prefer") for entry in spooled_entries(spool)] == ["resolution=merge-duplicates"]
@@ -0,0 +1,105 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SHOW_DB_CACHE", "off")
+
+import show_db  # noqa: E402
+from querycache import QueryCache  # noqa: E402
+
+T = show_db.IOTAWATT_TABLE
+
+
+def utc(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc)
+
+
+def test_plan_aligned_range_reads_one_rollup():
+    plan = show_db.plan_rollup(utc("2025-01-01T00:00"), utc("2025-02-01T00:00"), 86400)
+    assert plan == [(f"{T}_1d", 86400, utc("2025-01-01T00:00"), utc("2025-02-01T00:00"))]
+
+
+def test_plan_unaligned_end_reads_middle_from_rollup_and_edge_from_finer():
+    start, end = utc("2025-01-01T06:00"), utc("2025-01-01T14:37:23.500000")
+    plan = show_db.plan_rollup(start, end, 3600)
+    assert [(endpoint, lo, hi) for endpoint, _, lo, hi in plan] == [
+        (f"{T}_1h", start, utc("2025-01-01T14:00")),
+        (f"{T}_15m", utc("2025-01-01T14:00"), utc("2025-01-01T14:30")),
+        (f"{T}_1m", utc("2025-01-01T14:30"), utc("2025-01-01T14:37")),
+        (T, utc("2025-01-01T14:37"), end),
+    ]
+
+
+def test_plan_unaligned_start_and_resolution_not_divisible():
+    start, end = utc("2025-01-01T06:07:30"), utc("2025-01-01T08:00")
+    plan = show_db.plan_rollup(start, end, 3600)
+    assert [endpoint for endpoint, *_ in plan] == [T, f"{T}_1m", f"{T}_15m", f"{T}_1h"]
+    assert plan[0][2:] == (start, utc("2025-01-01T06:08"))
+    assert show_db.plan_rollup(start, end, 90) == [(T, 0, start, end)]
+
+
+def test_fetch_rollup_with_default_end_combines_rollup_and_raw_rows(monkeypatch):
+    start, end = utc("2025-01-01T13:00"), utc("2025-01-01T14:15:10")
+    requested = []
+
+    def make_api_request(endpoint, params, token=None):
+        requested.append(endpoint)
+        ts = params[0][1][len("gte."):]
+        return [{"timestamp": ts, "device": "d1", "sensor": "s1", "samples": 10, "watts_avg": 100.0,
+                 "watts_min": 90.0, "watts_max": 110.0, "wh": 5.0}]
+
+    def fetch_range(lo, hi, device=None, token=None):
+        requested.append(T)
+        return [{"timestamp": lo.isoformat(), "device": "d1", "sensor": "s1", "Watts": 200.0, "Wh": 1.0},
+                {"timestamp": lo.isoformat(), "device": "d1", "sensor": "s2", "Watts": 50.0, "Wh": 0.5}]
+
+    monkeypatch.setattr(show_db, "make_api_request", make_api_request)
+    monkeypatch.setattr(show_db, "fetch_range", fetch_range)
+    rows = show_db.fetch_rollup(start, end, 3600, sensor="s1")
+    assert sorted(requested) == sorted([f"{T}_1h", f"{T}_15m", T])
+    assert [(row["timestamp"], row["samples"], row["wh"]) for row in rows] == [
+        ("2025-01-01T13:00:00+00:00", 10, 5.0),
+        ("2025-01-01T14:00:00+00:00", 11, 6.0),
+    ]
+    assert rows[1]["watts_avg"] == (10 * 100.0 + 200.0) / 11
+    assert rows[1]["watts_max"] == 200.0
+
+
+def test_cacheable_range_reads_a_plain_time_range():
+    params = [("timestamp", "gte.2025-01-01T00:00:00+00:00"), ("timestamp", "lt.2025-01-02T00:00:00+00:00"),
+              ("device", "eq.d1"), ("order", "timestamp.asc")]
+    assert show_db.cacheable_range(T, params) == {
+        "start": "2025-01-01T00:00:00+00:00", "end": "2025-01-02T00:00:00+00:00", "device": "d1"}
+
+
+def test_cacheable_range_leaves_repeated_bounds_to_the_server():
+    start, end = ("timestamp", "gte.2025-01-01T00:00:00+00:00"), ("timestamp", "lt.2025-01-02T00:00:00+00:00")
+    for extra in (("timestamp", "gte.2025-01-01T12:00:00+00:00"), ("timestamp", "lt.2025-01-01T06:00:00+00:00"),
+                  ("device", "eq.d2")):
+        assert show_db.cacheable_range(T, [start, end, ("device", "eq.d1"), extra]) is None
+    assert show_db.cacheable_range(T, [start, end, ("limit", "10")]) is None
+    assert show_db.cacheable_range("other", [start, end]) is None
+
+
+def test_make_api_request_serves_repeat_ranges_from_the_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def api_get(endpoint, params, token):
+        lower, upper = (datetime.fromisoformat(value[len(op):]) for (_, value), op in zip(params, ("gte.", "lt.")))
+        calls.append((lower, upper))
+        rows, ts = [], lower
+        while ts < upper:
+            rows.append({"timestamp": ts.isoformat(), "device": "d1", "sensor": "s1", "Watts": 1.0})
+            ts += timedelta(minutes=30)
+        return rows
+
+    monkeypatch.setattr(show_db, "query_cache", QueryCache(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(show_db, "api_get", api_get)
+    params = [("timestamp", "gte.2025-01-01T01:00:00+00:00"), ("timestamp", "lt.2025-01-01T05:00:00+00:00"),
+              ("order", "timestamp.asc")]
+    first = show_db.make_api_request(T, params, token="t")
+    assert len(first) == 8 and len(calls) == 1
+    assert show_db.make_api_request(T, params, token="t") == first
+    assert len(calls) == 1  # Settled buckets, all from the cache
+    # A repeated bound is not cacheable: the query goes to the server as it is
+    show_db.make_api_request(T, params + [("timestamp", "lt.2025-01-01T03:00:00+00:00")], token="t")
+    assert len(calls) == 2
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import stat
+import time
+
+import pytest
+
+import jwtutil
+from http_proxy import HttpProxy, make_response
+from spool import Spool
+
+SECRET = "spool-test-secret-spool-test-secret"
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def drain_until_empty(spool, send_rows, timeout=5.0):
+    async def run():
+        task = asyncio.create_task(spool.drain(send_rows))
+        deadline = time.monotonic() + timeout
+        while spool.depth_entries and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run())
+
+
+def test_spool_files_are_private(tmp_path):
+    spool = Spool(str(tmp_path / "spool")).open()
+    spool.append("Bearer secret", [{"device": "d1"}])
+    spool.reject("Bearer secret", [{"device": "d1"}], 400)
+    spool._save_cursor()
+    spool.close()
+    assert mode(spool.directory) == 0o700
+    assert {name: mode(os.path.join(spool.directory, name)) for name in os.listdir(spool.directory)} == {
+        "segment-00000000.jsonl": 0o600, "rejected.jsonl": 0o600, "cursor.json": 0o600}
+
+
+def test_pending_uploads_survive_a_restart(tmp_path):
+    spool = Spool(str(tmp_path / "spool")).open()
+    spool.append("Bearer a", [{"n": 1}, {"n": 2}])
+    spool.append("Bearer a", [{"n": 3}], "resolution=ignore-duplicates")
+    spool.close()
+    reopened = Spool(spool.directory).open()
+    assert (reopened.depth_entries, reopened.depth_rows) == (2, 3)
+
+
+def test_drain_groups_by_auth_and_prefer_and_isolates_rejected_uploads(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), drain_rate=0).open()
+    spool.append("Bearer a", [{"n": 1}])
+    spool.append("Bearer b", [{"n": 2}])
+    spool.append("Bearer a", [{"n": 3}], "resolution=merge-duplicates")
+    spool.append("Bearer a", [{"n": 4, "bad": True}])
+    sent = []
+
+    async def send_rows(auth, rows, prefer, spooled_at):
+        sent.append((auth, prefer, [row["n"] for row in rows]))
+        return 400 if any(row.get("bad") for row in rows) else 201
+
+    drain_until_empty(spool, send_rows)
+    assert sent == [("Bearer a", "", [1, 4]), ("Bearer a", "", [1]), ("Bearer a", "", [4]),
+                    ("Bearer b", "", [2]), ("Bearer a", "resolution=merge-duplicates", [3])]
+    assert (spool.drained_rows, spool.rejected_rows) == (3, 1)
+    with open(os.path.join(spool.directory, "rejected.jsonl")) as f:
+        assert [json.loads(line)["rows"] for line in f] == [[{"n": 4, "bad": True}]]
+
+
+@pytest.fixture
+def signed(monkeypatch):
+    monkeypatch.setattr(jwtutil, "JWT_SECRET", SECRET)
+    jwtutil._token_cache.clear()
+
+    def token(exp, iat=None):
+        now = int(time.time())
+        claims = {"role": "writer", "iat": iat or now - 7200, "iss": jwtutil.ISSUER, "device": "d1", "exp": exp}
+        return "Bearer " + jwtutil.sign_hs256(claims)
+
+    return token
+
+
+@pytest.mark.parametrize("resign", [False, True])
+def test_replay_re_signs_tokens_that_expired_while_spooled(tmp_path, signed, resign):
+    seen = []
+
+    async def upstream(request):
+        seen.append(request.header("Authorization"))
+        return make_response(201)
+
+    proxy = HttpProxy("upstream", 3000, spool_resign=resign, pool=None)
+    proxy.send_upstream = upstream
+    now = time.time()
+    expired = signed(int(now) - 10)
+    assert asyncio.run(proxy.send_spooled(expired, [{"n": 1}], "", spooled_at=now - 3600)) == 201
+    if not resign:
+        assert seen == [expired]
+        return
+    claims = jwtutil.decode_jwt_token(seen[0].split()[1])
+    assert claims["role"] == "writer" and claims["device"] == "d1" and claims["exp"] > now
+
+
+def test_replay_leaves_forged_and_already_expired_tokens_alone(tmp_path, signed):
+    seen = []
+
+    async def upstream(request):
+        seen.append(request.header("Authorization"))
+        return make_response(401)
+
+    proxy = HttpProxy("upstream", 3000, spool_resign=True)
+    proxy.send_upstream = upstream
+    now = time.time()
+    expired = signed(int(now) - 10)
+    forged = expired[:-4] + ("AAAA" if not expired.endswith("AAAA") else "BBBB")
+    for auth, spooled_at in ((forged, now - 3600), (expired, now)):  # The second expired before it was spooled
+        asyncio.run(proxy.send_spooled(auth, [{"n": 1}], "", spooled_at=spooled_at))
+    assert seen == [forged, expired]
@@ -0,0 +1,73 @@
+import socket
+
+import pytest
+import requests
+
+import uploader
+from uploader import UploadError, Uploader
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ""
+
+
+def make_uploader(monkeypatch, outcomes, proxy=False):
+    """An Uploader whose POSTs return or raise `outcomes` in turn; returns (uploader, list of POSTs made)."""
+    monkeypatch.setattr(uploader, "backoff", lambda attempt: 0)
+    client = Uploader("http://example.invalid/iotawatt", token="t", retries=3, log_path=None, proxy=proxy)
+    posts = []
+
+    def post(url, data=None, headers=None, timeout=None):
+        posts.append(headers["Idempotency-Key"])
+        outcome = outcomes[min(len(posts), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client.session, "post", post)
+    return client, posts
+
+
+@pytest.mark.parametrize("outcome", [
+    requests.exceptions.ReadTimeout("read timed out"),
+    requests.exceptions.ConnectionError("Connection aborted."),
+    FakeResponse(500),
+    FakeResponse(502),
+    FakeResponse(503),  # Without Retry-After
+])
+def test_direct_uploads_do_not_retry_what_may_have_committed(monkeypatch, outcome):
+    client, posts = make_uploader(monkeypatch, [outcome, FakeResponse(201)])
+    with pytest.raises(UploadError):
+        client.post("timestamp,device\n")
+    assert len(posts) == 1
+
+
+@pytest.mark.parametrize("outcome", [
+    requests.exceptions.ConnectTimeout("connect timed out"),
+    FakeResponse(429, {"Retry-After": "0"}),
+    FakeResponse(503, {"Retry-After": "0"}),
+])
+def test_direct_uploads_retry_what_never_reached_the_server(monkeypatch, outcome):
+    client, posts = make_uploader(monkeypatch, [outcome, FakeResponse(201)])
+    assert client.post("timestamp,device\n").status_code == 201
+    assert len(posts) == 2
+
+
+@pytest.mark.parametrize("outcome", [requests.exceptions.ReadTimeout("read timed out"), FakeResponse(500)])
+def test_proxy_uploads_retry_with_the_same_idempotency_key(monkeypatch, outcome):
+    client, posts = make_uploader(monkeypatch, [outcome, FakeResponse(201)], proxy=True)
+    assert client.post("timestamp,device\n").status_code == 201
+    assert len(posts) == 2 and posts[0] == posts[1]
+
+
+def test_refused_connection_never_reached_the_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]  # Closed again before the request: nothing listens there
+    with pytest.raises(requests.exceptions.ConnectionError) as caught:
+        requests.post(f"http://127.0.0.1:{port}/iotawatt", data=b"x", timeout=5)
+    assert uploader.never_sent(caught.value)
+    assert not uploader.never_sent(requests.exceptions.ReadTimeout("read timed out"))
@@ -0,0 +1,47 @@
+import json
+import os
+import threading
+
+from workers import Supervisor, Worker
+
+
+class Recording(dict):
+    """Supervisor._stats that keeps every report, not just the last one per worker."""
+
+    def __init__(self):
+        super().__init__()
+        self.reports = []
+
+    def __setitem__(self, key, value):
+        self.reports.append(value)
+        super().__setitem__(key, value)
+
+
+def test_large_stats_lines_from_two_threads_arrive_whole():
+    read_fd, write_fd = os.pipe()
+    worker = Worker(0, 1, write_fd)
+    # Per-device labels make a snapshot far larger than PIPE_BUF (4 KiB on Linux)
+    snapshots = [{f'proxy_device_bytes_total{{device="dev{i:05d}"}}': n for i in range(2000)} for n in range(20)]
+    assert len(json.dumps(snapshots[0])) > 16 * 4096
+
+    supervisor = Supervisor(1, None)
+    supervisor._pipes[read_fd] = 0
+    supervisor._buffers[read_fd] = b""
+    supervisor._stats = Recording()
+
+    def read_until_eof():
+        while read_fd in supervisor._pipes:
+            supervisor._read(read_fd)
+
+    reader = threading.Thread(target=read_until_eof)
+    reader.start()
+    senders = [threading.Thread(target=lambda part=part: [worker.send(s) for s in part])
+               for part in (snapshots[:10], snapshots[10:])]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    os.close(write_fd)
+    reader.join()
+    first_key = 'proxy_device_bytes_total{device="dev00000"}'
+    assert sorted(supervisor._stats.reports, key=lambda s: s[first_key]) == snapshots
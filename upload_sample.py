@@ -1,10 +1,23 @@
 #!/usr/bin/env python3
 """
 Upload sample IoTaWatt data to PostgREST API for testing purposes.
+
+`bulk` synthesizes realistic time series for a fleet with NumPy and streams
+them as chunked CSV uploads; `load` simulates a fleet of devices at a target
+rows/second and reports throughput and latency percentiles; `stand-in` runs
+a local stand-in for PostgREST to measure them without a database.
 """
+import heapq
+import itertools
+import json
 import os
-import requests
-from datetime import datetime, timezone
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import typer
 import random
 import logging
@@ -13,7 +26,6 @@ from jwtutil import generate_jwt_token
 
 
 # Configuration from .env file
-JWT_SECRET = os.environ.get("PGRST_JWT_SECRET", "").strip()
 POSTGREST_PORT = os.environ.get("POSTGREST_EXTERNAL_PORT", "3333")
 POSTGREST_HOST = os.environ.get("POSTGREST_HOST", "localhost")
 IOTAWATT_TABLE = os.environ.get("IOTAWATT_TABLE", "iotawatt_data")
@@ -25,28 +37,28 @@ app = typer.Typer(help="Upload sample IoTaWatt data to PostgREST")
 console_logger = logging.getLogger("console")
 console_logger.addHandler(logging.StreamHandler())  # Also log to console
 console_logger.setLevel(logging.INFO)
-file_logger = logging.getLogger('file_logger')
-file_logger.addHandler(logging.FileHandler('upload.log'))
-file_logger.setLevel(logging.DEBUG)
 
-# Validate configuration
-if not JWT_SECRET:
-    console_logger.error("Error: PGRST_JWT_SECRET not found in env!")
-    raise typer.Exit(1)
+
+def sensor_names(count: int) -> list[str]:
+    """Sensor names as an IoTaWatt reports them: Net, then Circuit1, Circuit2, ..."""
+    return (["Net"] + [f"Circuit{i}" for i in range(1, count)])[:count]
 
 
-def generate_sample_data(num_readings: int = 5, device: str = "hfs02a") -> str:
+def generate_sample_data(num_readings: int = 5, device: str = "hfs02a", sensors: list[str] | None = None,
+                         now: datetime | None = None) -> str:
     """
     Generate sample IoTaWatt readings in CSV format.
     
     Returns CSV string with header and data rows.
     """
-    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)  
+    if now is None:
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
     
     # CSV header matching PostgREST table columns
-    csv_lines = ["timestamp,device,sensor,Watts,Volts,Amps,VA,Wh,PF"]
+    csv_lines = ["timestamp,device,sensor,Watts,Volts,Amps,VA,Wh,PF,Hz"]
     
-    sensors = ["Net", "Circuit1", "Circuit2", "Circuit3", "Circuit4", "Circuit5", "Circuit6"]
+    if sensors is None:
+        sensors = sensor_names(7)
     
     for i in range(num_readings):
         sensor = sensors[i % len(sensors)]
@@ -77,8 +89,12 @@ def generate(
     num_readings: int = typer.Option(5, "--count", "-n", help="Number of readings to generate"),
     device: str = typer.Option("hfs02a", "--device", "-d", help="Device name"),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Enable verbose logging"),
+    compress: bool = typer.Option(False, "--gzip", help="Gzip the body (only through the proxy's http engine)"),
+    log_sample: float = typer.Option(1.0, "--log-sample", help="Share of uploads logged to upload.log"),
 ):
-    """Generate sample CSV data without uploading."""
+    """Generate sample CSV data and upload it."""
+    from uploader import UploadError, Uploader  # requests is only needed by the commands that upload
+
     if verbose:
         console_logger.setLevel(logging.DEBUG)
 
@@ -88,47 +104,430 @@ def generate(
     token = generate_jwt_token(PG_WRITER_USER, exp_hours=1)
     console_logger.info(f"Generated JWT Token (1 hr expiry):\n{token}")
     
-    # Generate sample data
-    csv_data = generate_sample_data(num_readings, device)
-    
     # Log the CSV data being uploaded
     console_logger.info(f"Uploading {num_readings} readings for device '{device}' chars: {len(csv_data)}")
     
     
     # PostgREST endpoint
     url = f"http://{POSTGREST_HOST}:{POSTGREST_PORT}/{IOTAWATT_TABLE}"
-    
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "text/csv",
-        "Prefer": "return=representation",  # Return inserted rows
-    }
-    
     console_logger.info(f"POST request to: {url}")
-    
+
+    with Uploader(url, token, compress=compress, log_sample=log_sample) as uploader:
+        try:
+            uploader.upload_csv(csv_data, representation=True)  # Return inserted rows
+        except UploadError as e:
+            console_logger.error(str(e))
+            raise typer.Exit(1)
+    console_logger.info(f"Successfully uploaded {num_readings} readings")
+
+
+CSV_HEADER = b"timestamp,device,sensor,Watts,Volts,Amps,VA,Wh,PF,Hz\n"
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_REQUEST_ROWS = 1_000_000
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("bulk synthesis requires the 'numpy' package (uv sync --extra synth)")
+    return numpy
+
+
+def synthesize_chunks(devices: list[str], sensors: list[str], start: datetime, end: datetime,
+                      interval: int = 60, chunk_rows: int = DEFAULT_CHUNK_ROWS, seed: int | None = None):
+    """
+    Yield (row count, CSV rows without header) for every reading from start to end.
+
+    Rows are built with NumPy one block of timestamps at a time (about
+    chunk_rows rows), so memory stays constant whatever the time range.
+    Circuits follow a daily load curve with morning and evening peaks, per
+    circuit scale and power factor, and some circuits switched off; Net is
+    the sum of a device's circuits minus solar generation. Volts and Hz are
+    only reported on Net, and Amps/VA/Wh/PF are NULL when a circuit draws
+    nothing, as on a real IoTaWatt.
+    """
+    np = import_numpy()
+    strings = np.dtypes.StringDType()
+    rng = np.random.default_rng(seed)
+    n_dev, n_sens = len(devices), len(sensors)
+    per_ts = n_dev * n_sens
+    block = max(1, chunk_rows // per_ts)
+
+    # Fixed per-device and per-circuit characteristics
+    scale = rng.lognormal(np.log(250), 0.8, (n_dev, n_sens - 1))  # Typical circuit watts
+    base_pf = rng.uniform(0.8, 0.99, (n_dev, n_sens))
+    p_off = rng.uniform(0.0, 0.3, (n_dev, n_sens - 1))  # Share of readings a circuit is off
+    solar = rng.choice([0.0, 3000.0, 5000.0, 6600.0], n_dev)  # System size, watts
+    phase = rng.uniform(-1.0, 1.0, n_dev)  # Households do not all wake up at the same time
+    device_col = np.array(devices, dtype=strings).reshape(1, n_dev, 1)
+    sensor_col = np.array(sensors, dtype=strings).reshape(1, 1, n_sens)
+    is_net = (np.arange(n_sens) == 0).reshape(1, 1, n_sens)
+
+    def fmt(values, decimals, null):
+        text = np.round(values, decimals).astype(strings)
+        return np.where(null, "NULL", text)
+
+    first, last = int(start.timestamp()), int(end.timestamp())
+    for t0 in range(first, last, block * interval):
+        ts = np.arange(t0, min(t0 + block * interval, last), interval, dtype=np.int64)
+        n_ts = len(ts)
+        shape = (n_ts, n_dev, n_sens)
+        hours = ((ts % 86400) / 3600.0).reshape(n_ts, 1) + phase  # (ts, device)
+
+        profile = (0.25 + 0.5 * np.exp(-(((hours - 7.5) / 1.5) ** 2))
+                   + 0.9 * np.exp(-(((hours - 19.0) / 2.5) ** 2)))
+        circuits = scale * profile[:, :, None] * rng.lognormal(0.0, 0.15, (n_ts, n_dev, n_sens - 1))
+        circuits[rng.random((n_ts, n_dev, n_sens - 1)) < p_off] = 0.0
+        sun = np.clip(np.sin(np.pi * (hours - 6.0) / 12.0), 0.0, None) * rng.uniform(0.6, 1.0, (n_ts, n_dev))
+        net = circuits.sum(axis=2) - solar * sun
+        watts = np.concatenate([net[:, :, None], circuits], axis=2)
+
+        volts = 240.0 + 3.0 * np.sin(2 * np.pi * hours / 24.0) + rng.normal(0.0, 0.8, (n_ts, n_dev))
+        hz = 60.0 + rng.normal(0.0, 0.02, (n_ts, n_dev))
+        # Power factor improves as a circuit approaches its typical load
+        load_ratio = np.abs(watts) / (np.abs(watts).mean(axis=0, keepdims=True) + 1.0)
+        pf_mag = np.clip(base_pf + 0.05 * np.tanh(load_ratio - 1.0), 0.5, 1.0)
+        va = np.abs(watts) / pf_mag
+        amps = np.sign(watts) * va / volts[:, :, None]
+        wh = np.abs(watts) * interval / 3600.0
+        pf = np.sign(watts) * pf_mag
+
+        off = np.round(watts, 1) == 0
+        not_net = np.broadcast_to(~is_net, shape)
+        stamps = np.datetime_as_string(ts.astype("datetime64[s]"), timezone="UTC").astype(strings)
+        columns = [
+            np.broadcast_to(stamps.reshape(n_ts, 1, 1), shape),
+            np.broadcast_to(device_col, shape),
+            np.broadcast_to(sensor_col, shape),
+            fmt(watts, 1, False),
+            fmt(np.broadcast_to(volts[:, :, None], shape), 1, not_net),
+            fmt(amps, 2, off),
+            fmt(va, 1, off),
+            fmt(wh, 3, off),
+            fmt(pf, 3, off),
+            fmt(np.broadcast_to(hz[:, :, None], shape), 2, not_net),
+        ]
+        line = columns[0]
+        for column in columns[1:]:
+            line = np.strings.add(np.strings.add(line, ","), column)
+        yield n_ts * per_ts, ("\n".join(line.ravel().tolist()) + "\n").encode()
+
+
+def request_bodies(chunks, request_rows: int):
+    """Group synthesized chunks into request bodies of about request_rows rows, each a generator of bytes."""
+    chunks = iter(chunks)
+    pending = next(chunks, None)
+    while pending is not None:
+        state = {"rows": 0}
+
+        def body(first=pending):
+            yield CSV_HEADER
+            current = first
+            while current is not None:
+                rows, data = current
+                state["rows"] += rows
+                yield data
+                current = next(chunks, None)
+                if current is None or state["rows"] >= request_rows:
+                    state["next"] = current
+                    return
+
+        yield state, body()
+        pending = state.get("next")
+
+
+@app.command()
+def bulk(
+    devices: int = typer.Option(10, "--devices", "-d", help="Number of devices"),
+    sensors: int = typer.Option(14, "--sensors", "-s", help="Sensors per device (Net plus circuits)"),
+    days: float = typer.Option(1.0, "--days", help="Days of data, ending now unless --start is given"),
+    start: str = typer.Option(None, "--start", help="ISO start time (UTC if no offset), e.g. 2025-01-01"),
+    interval: int = typer.Option(60, "--interval", "-i", help="Seconds between readings"),
+    chunk_rows: int = typer.Option(DEFAULT_CHUNK_ROWS, "--chunk-rows", help="Rows synthesized per chunk"),
+    request_rows: int = typer.Option(DEFAULT_REQUEST_ROWS, "--request-rows", help="Rows streamed per POST"),
+    seed: int = typer.Option(None, "--seed", help="Random seed for reproducible data"),
+    output: str = typer.Option(None, "--output", "-o", help="Write CSV to this file ('-' for stdout) instead of uploading"),
+    url: str = typer.Option(
+        f"http://{POSTGREST_HOST}:{POSTGREST_PORT}/{IOTAWATT_TABLE}", "--url", help="Insert endpoint"
+    ),
+):
+    """
+    Synthesize realistic readings for a whole fleet and time range and stream them
+    to PostgREST as chunked CSV uploads, in constant memory.
+    """
+    if start is None:
+        now = int(time.time()) // interval * interval
+        begin = datetime.fromtimestamp(now, timezone.utc) - timedelta(days=days)
+    else:
+        begin = datetime.fromisoformat(start)
+        if begin.tzinfo is None:
+            begin = begin.replace(tzinfo=timezone.utc)
+    end = begin + timedelta(days=days)
+    fleet = [f"synth{i:04d}" for i in range(devices)]
+    try:
+        chunks = synthesize_chunks(fleet, sensor_names(sensors), begin, end, interval, chunk_rows, seed)
+        first = next(chunks, None)
+    except RuntimeError as e:
+        console_logger.error(str(e))
+        raise typer.Exit(1)
+    chunks = itertools.chain([first] if first else [], chunks)
+    expected = devices * sensors * int((end - begin).total_seconds() // interval)
+    console_logger.info(f"Synthesizing ~{expected} rows: {devices} devices x {sensors} sensors, "
+                        f"{begin.isoformat()} to {end.isoformat()} every {interval} s")
+
+    started = time.monotonic()
+    total = 0
+    if output:
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            out.write(CSV_HEADER)
+            for rows, data in chunks:
+                out.write(data)
+                total += rows
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    else:
+        from uploader import UploadError, Uploader
+
+        uploader = Uploader(url, timeout=(5.0, None))  # No read timeout: the server reads as we synthesize
+        console_logger.info(f"POST to: {url}, {request_rows} rows per request")
+        for state, body in request_bodies(chunks, request_rows):
+            try:
+                uploader.post(body)  # A generator body is sent chunked
+            except UploadError as e:
+                console_logger.error(f"{e} (after {total} rows)")
+                raise typer.Exit(1)
+            total += state["rows"]
+            elapsed = time.monotonic() - started
+            console_logger.info(f"Uploaded {total} rows, {total / elapsed:.0f} rows/s")
+
+    elapsed = time.monotonic() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    console_logger.info(f"Done: {total} rows in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.0f} rows/s), "
+                        f"peak memory {peak_mb:.0f} MB")
+
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+PROGRESS_INTERVAL = 5.0
+
+
+class LoadStats:
+    """Results of one load worker; each worker thread owns one, merged at the end."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.rows = 0
+        self.lag = 0.0  # Worst delay behind schedule, seconds
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.rows += other.rows
+        self.lag = max(self.lag, other.lag)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def load_worker(url: str, headers: dict, devices: list[str], sensors: list[str], period: float,
+                start: float, deadline: float, stats: LoadStats, timeout: float):
+    """Upload one batch of readings per device every `period` seconds until the deadline."""
+    import requests
+
+    session = requests.Session()  # Keep-alive: one connection per worker, not per upload
+    # Spread first uploads over the period, like a fleet that was not switched on at once
+    due = [(start + period * i / len(devices), i, device) for i, device in enumerate(devices)]
+    heapq.heapify(due)
+    while due:
+        when, i, device = heapq.heappop(due)
+        if when >= deadline:
+            break
+        delay = when - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            stats.lag = max(stats.lag, -delay)
+        body = generate_sample_data(len(sensors), device, sensors, datetime.now(timezone.utc))
+        started = time.perf_counter()
+        try:
+            response = session.post(url, data=body, headers=headers, timeout=timeout)
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        stats.latencies.append(time.perf_counter() - started)
+        stats.statuses[status] += 1
+        if status in (200, 201):
+            stats.rows += len(sensors)
+        heapq.heappush(due, (when + period, i, device))
+
+
+@app.command()
+def load(
+    devices: int = typer.Option(100, "--devices", "-d", help="Number of simulated devices"),
+    sensors: int = typer.Option(7, "--sensors", "-s", help="Sensors (rows) per device upload"),
+    rate: float = typer.Option(1000.0, "--rate", "-r", help="Target rows per second across the fleet"),
+    duration: float = typer.Option(30.0, "--duration", "-t", help="Test duration in seconds"),
+    workers: int = typer.Option(32, "--workers", "-w", help="Uploader threads, each with its own HTTP session"),
+    url: str = typer.Option(
+        f"http://{POSTGREST_HOST}:{POSTGREST_PORT}/{IOTAWATT_TABLE}", "--url", help="Insert endpoint"
+    ),
+    timeout: float = typer.Option(30.0, "--timeout", help="Per-request timeout in seconds"),
+):
+    """
+    Simulate a fleet of DEVICES x SENSORS uploading at a target rows/second.
+
+    Each device uploads one CSV batch of SENSORS rows every DEVICES * SENSORS / RATE
+    seconds. Reports achieved throughput and p50/p95/p99 latency.
+    """
+    workers = max(1, min(workers, devices))
+    period = devices * sensors / rate
+    token = generate_jwt_token(PG_WRITER_USER, exp_hours=1)
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "text/csv",
-        "Prefer": "return=representation",  # Return inserted rows
+        "Prefer": "return=minimal",
     }
-    try:
-        response = requests.post(url, data=csv_data, headers=headers)
-        file_logger.info(f"\nREQUEST HEADERS\n{headers}")
-        file_logger.info(f"\nREQUEST BODY\n({len(csv_data)} chars):\n{csv_data}")
-        file_logger.info(f"\nRESPONSE STATUS\n{response.status_code}")
-        file_logger.info(f"\nRESPONSE BODY\n({len(response.text)} chars):\n{response.text}")
-        
-        if response.status_code in [200, 201]:
-            console_logger.info(f"Successfully uploaded {num_readings} readings")
-           
+    names = sensor_names(sensors)
+    fleet = [f"load{i:05d}" for i in range(devices)]
+
+    console_logger.info(f"Load: {devices} devices x {sensors} sensors, target {rate:g} rows/s "
+                        f"(one upload per device every {period:.2f} s) for {duration:g} s, {workers} workers")
+    console_logger.info(f"POST to: {url}")
+
+    start = time.monotonic() + 0.5
+    deadline = start + duration
+    results = [LoadStats() for _ in range(workers)]
+    threads = [
+        threading.Thread(
+            target=load_worker,
+            args=(url, headers, fleet[w::workers], names, period, start, deadline, results[w], timeout),
+            daemon=True,
+        )
+        for w in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    last_rows, last_time = 0, start
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(min(PROGRESS_INTERVAL, max(deadline - time.monotonic(), 0.1)))
+        now = time.monotonic()
+        rows = sum(r.rows for r in results)
+        errors = sum(n for r in results for status, n in r.statuses.items() if status not in (200, 201))
+        if now > last_time:
+            console_logger.info(f"[{now - start:5.0f}s] {(rows - last_rows) / (now - last_time):8.0f} rows/s, "
+                                f"{errors} errors")
+        last_rows, last_time = rows, now
+
+    total = LoadStats()
+    for result in results:
+        total.merge(result)
+    elapsed = min(time.monotonic(), deadline) - start
+    latencies = sorted(total.latencies)
+    achieved = total.rows / elapsed if elapsed > 0 else 0.0
+
+    console_logger.info("\nResults")
+    statuses = ", ".join(f"{status}: {n}" for status, n in total.statuses.most_common())
+    console_logger.info(f"  Requests:   {len(latencies)} ({statuses})")
+    console_logger.info(f"  Throughput: {achieved:.0f} rows/s ({achieved / rate:.0%} of target), "
+                        f"{len(latencies) / elapsed:.0f} requests/s")
+    console_logger.info(f"  Behind schedule by at most {total.lag * 1000:.0f} ms")
+    if latencies:
+        console_logger.info(
+            f"  Latency ms: p50 {percentile(latencies, 50) * 1000:.1f}  p95 {percentile(latencies, 95) * 1000:.1f}  "
+            f"p99 {percentile(latencies, 99) * 1000:.1f}  max {latencies[-1] * 1000:.1f}"
+        )
+        console_logger.info("  Latency histogram:")
+        lower = 0
+        for bound in LATENCY_BUCKETS_MS + (None,):
+            n = sum(1 for x in latencies if lower <= x * 1000 < (bound if bound is not None else float("inf")))
+            if n:
+                label = f"{lower}-{bound} ms" if bound is not None else f">= {lower} ms"
+                console_logger.info(f"    {label:>14} {n:8d} {'#' * max(1, round(40 * n / len(latencies)))}")
+            lower = bound
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accepts PostgREST-style inserts and counts rows; no database behind it."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like PostgREST
+
+    def body_chunks(self):
+        """Yield the request body, decoding Transfer-Encoding: chunked as sent by `bulk`."""
+        if "chunked" not in self.headers.get("Transfer-Encoding", ""):
+            yield self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            return
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass  # Trailers
+                return
+            yield self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_POST(self):
+        if "json" in self.headers.get("Content-Type", ""):
+            rows = json.loads(b"".join(self.body_chunks()))
+            count = len(rows) if isinstance(rows, list) else 1
         else:
-            console_logger.error(f"Upload failed: {response.status_code} - {response.text}")
+            # Count newlines as the body streams in, so huge uploads are not held in memory
+            newlines, last = 0, b""
+            for chunk in self.body_chunks():
+                if chunk:
+                    newlines += chunk.count(b"\n")
+                    last = chunk
+            count = newlines - last.endswith(b"\n") if last.strip() else 0  # Minus the header line
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            server.rows += count
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
 
-            raise typer.Exit(1)
-            
-    except requests.exceptions.RequestException as e:
-        console_logger.error(f"Request exception: {e}")
-        raise typer.Exit(1)
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    request_queue_size = 1024  # The default listen backlog of 5 drops connections under load
+    daemon_threads = True
+
+
+@app.command("stand-in")
+def stand_in(
+    port: int = typer.Option(int(POSTGREST_PORT), "--port", "-p", help="Port to listen on"),
+    latency_ms: float = typer.Option(0.0, "--latency-ms", help="Simulated insert latency per request"),
+):
+    """Run a local stand-in for PostgREST that accepts inserts and reports rows/second."""
+    server = StandInServer(("0.0.0.0", port), StandInHandler)
+    server.latency = latency_ms / 1000
+    server.lock = threading.Lock()
+    server.requests = server.rows = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    console_logger.info(f"Stand-in PostgREST on port {port}, {latency_ms:g} ms per insert")
+    last_rows, last_time = 0, time.monotonic()
+    try:
+        while True:
+            time.sleep(PROGRESS_INTERVAL)
+            now = time.monotonic()
+            if server.rows != last_rows:
+                console_logger.info(f"{server.requests} requests, {server.rows} rows, "
+                                    f"{(server.rows - last_rows) / (now - last_time):.0f} rows/s")
+            last_rows, last_time = server.rows, now
+    except KeyboardInterrupt:
+        server.shutdown()
 
 
 if __name__ == "__main__":
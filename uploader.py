@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Standard client for pushing IoTaWatt rows to PostgREST.
+
+    from uploader import Uploader
+
+    with Uploader() as uploader:
+        uploader.upload_csv(csv_text)
+        uploader.upload_rows([{"timestamp": ..., "device": ..., "sensor": ..., "Watts": ...}])
+
+An Uploader keeps one requests.Session with a pool of keep-alive
+connections and can be shared between threads. Failed uploads are retried
+with jittered exponential backoff. Every upload carries an Idempotency-Key
+that stays the same across its retries, but only the proxy's http engine
+honours it, answering a retried upload that already committed from its
+cache instead of inserting the rows twice. PostgREST ignores the key, so by
+default only failures that never reached the server are retried: refused or
+timed out connects, and 429 or 503 with Retry-After. With proxy=True (the URL
+is the proxy's http engine) read timeouts, dropped connections and 408, 500,
+502 and 504 are retried too.
+
+With compress=True bodies are sent with Content-Encoding: gzip. The proxy's
+http engine decompresses them; PostgREST itself does not, so only enable
+it when uploading through the proxy.
+
+Request and response bodies are logged to a file from a background thread
+(logging.handlers.QueueListener), for a sample of uploads and every failure.
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+
+POSTGREST_PORT = os.environ.get("POSTGREST_EXTERNAL_PORT", "3333")
+POSTGREST_HOST = os.environ.get("POSTGREST_HOST", "localhost")
+IOTAWATT_TABLE = os.environ.get("IOTAWATT_TABLE", "iotawatt_data")
+PG_WRITER_USER = os.environ.get("PG_WRITER_USER", "writer")
+
+DEFAULT_URL = f"http://{POSTGREST_HOST}:{POSTGREST_PORT}/{IOTAWATT_TABLE}"
+DEFAULT_TIMEOUT = (5.0, 30.0)  # connect, read
+DEFAULT_RETRIES = 5
+DEFAULT_POOL_SIZE = 10
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}  # Through the proxy, which deduplicates retries
+UNSENT_STATUSES = {429, 503}  # Refused before inserting; retried without the proxy only with Retry-After
+GZIP_MIN_BYTES = 1024  # Smaller bodies are not worth compressing
+GZIP_LEVEL = 5
+TOKEN_HOURS = 24
+DEFAULT_LOG_PATH = "upload.log"
+DEFAULT_LOG_SAMPLE = 0.01
+LOG_QUEUE_SIZE = 1000
+LOG_BODY_LIMIT = 64 * 1024  # Characters of each body written to the log
+
+body_logger = logging.getLogger("uploader.bodies")
+body_logger.propagate = False
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_body_log(path=DEFAULT_LOG_PATH):
+    """Write sampled bodies to path from a background thread; the first call wins."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        body_logger.addHandler(DroppingQueueHandler(log_queue))
+        body_logger.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(log_queue, logging.FileHandler(path, delay=True))
+        _listener.start()
+        atexit.register(_listener.stop)  # Flushes what is still queued
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never block an upload on the log: drop records while the writer is behind."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class UploadError(Exception):
+    """An upload that failed for good: a non-retryable status, or retries exhausted."""
+
+    def __init__(self, message, status=None, body=""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def backoff(attempt):
+    """Full jitter: uniform between 0 and the capped exponential delay."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(response):
+    try:
+        return min(float(response.headers.get("Retry-After", "")), BACKOFF_MAX)
+    except ValueError:
+        return None
+
+
+def never_sent(error):
+    """Whether a failed request provably never reached the server: no connection was made."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    # NewConnectionError (refused, unresolvable) is a ConnectTimeoutError in urllib3
+    return (isinstance(error, requests.exceptions.ConnectionError)
+            and isinstance(reason, urllib3.exceptions.ConnectTimeoutError))
+
+
+class Uploader:
+    """Uploads rows to a PostgREST table over pooled keep-alive connections."""
+
+    def __init__(self, url=DEFAULT_URL, token=None, role=PG_WRITER_USER, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, compress=False, pool_size=DEFAULT_POOL_SIZE,
+                 log_path=DEFAULT_LOG_PATH, log_sample=DEFAULT_LOG_SAMPLE, proxy=False):
+        self.url = url
+        self.proxy = proxy
+        self.role = role
+        self.timeout = timeout
+        self.retries = retries
+        self.compress = compress
+        self.log_sample = log_sample
+        self.retried = 0
+        self._token = token
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if log_path:
+            start_body_log(log_path)
+
+    @property
+    def token(self):
+        if self._token is not None:
+            return self._token
+        from jwtutil import cached_jwt_token  # Exits without PGRST_JWT_SECRET; not needed with a token
+        return cached_jwt_token(self.role, exp_hours=TOKEN_HOURS)  # Renewed before it expires
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def retryable(self, response):
+        """Whether a failed response may be retried without risking a duplicate insert."""
+        if self.proxy:
+            return response.status_code in RETRY_STATUSES
+        return response.status_code in UNSENT_STATUSES and retry_after(response) is not None
+
+    def post(self, body, content_type="text/csv", representation=False, headers=None):
+        """
+        POST a body to the table, retrying transient failures; returns the response.
+
+        body is bytes or str. An iterable of bytes is streamed with chunked
+        encoding, but then cannot be retried or compressed.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": content_type,
+            "Prefer": "return=representation" if representation else "return=minimal",
+            "Idempotency-Key": uuid.uuid4().hex,
+            **(headers or {}),
+        }
+        if isinstance(body, str):
+            body = body.encode()
+        streamed = not isinstance(body, bytes)
+        raw = body
+        if not streamed and self.compress and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+
+        attempts = 1 if streamed else self.retries + 1
+        for attempt in range(attempts):
+            if attempt:
+                self.retried += 1
+            try:
+                response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                if attempt + 1 >= attempts or not (self.proxy or never_sent(e)):
+                    self.log(headers, raw, None, str(e), failed=True)
+                    raise UploadError(f"Upload failed after {attempt + 1} attempt(s): {e}")
+                time.sleep(backoff(attempt))
+                continue
+            ok = response.status_code < 400
+            if ok or not self.retryable(response) or attempt + 1 >= attempts:
+                self.log(headers, raw, response.status_code, response.text, failed=not ok)
+                if not ok:
+                    raise UploadError(f"Upload failed: {response.status_code} - {response.text}",
+                                      response.status_code, response.text)
+                return response
+            time.sleep(retry_after(response) or backoff(attempt))
+
+    def upload_csv(self, csv_data, representation=False):
+        """Upload CSV with a header row; returns the response."""
+        return self.post(csv_data, "text/csv", representation)
+
+    def upload_rows(self, rows, representation=False):
+        """Upload a list of row dicts as JSON; returns the response."""
+        return self.post(json.dumps(rows), "application/json", representation)
+
+    def log(self, headers, body, status, response_text, failed=False):
+        """Queue the exchange for the body log: always on failure, else for a log_sample share."""
+        if not body_logger.handlers or not (failed or random.random() < self.log_sample):
+            return
+        shown = {k: ("Bearer ..." if k == "Authorization" else v) for k, v in headers.items()}
+        if isinstance(body, bytes):
+            request_text = body[:LOG_BODY_LIMIT].decode("utf-8", "replace")
+            size = len(body)
+        else:
+            request_text, size = "(streamed)", "?"
+        body_logger.info(
+            f"\nREQUEST HEADERS\n{shown}"
+            f"\nREQUEST BODY\n({size} bytes):\n{request_text}"
+            f"\nRESPONSE STATUS\n{status}"
+            f"\nRESPONSE BODY\n({len(response_text)} chars):\n{response_text[:LOG_BODY_LIMIT]}"
+        )
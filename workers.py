@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Multi-process supervisor for proxy.py (--workers N).
+
+A single proxy process is bound to one core by the GIL. The supervisor forks
+N worker processes that each run a full proxy engine on a listen socket with
+SO_REUSEPORT set, so the kernel spreads incoming connections across them.
+Workers that exit unexpectedly are restarted with a backoff.
+
+Each worker reports its metrics snapshot (metrics.py) to the supervisor as
+JSON lines over a pipe (framed by newlines, so a snapshot may be any size);
+the supervisor sums them into one view of the whole proxy, served on
+--admin-port and dumped on SIGUSR1. Counters survive worker restarts.
+"""
+
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from metrics import admin_server, install_dump_handler, is_counter
+
+
+REPORT_INTERVAL = 1.0
+DEFAULT_STATS_INTERVAL = 60
+RESTART_MIN = 1.0
+RESTART_MAX = 30.0
+STABLE_SECONDS = 10.0  # A worker that ran this long resets its restart backoff
+STOP_TIMEOUT = 10.0
+
+
+def reuse_port_supported():
+    return hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork")
+
+
+def aggregate(stats_list):
+    """
+    Combine per-worker stats: *_max and *age_seconds take the maximum, *healthy
+    the minimum (any unhealthy worker makes the whole proxy unhealthy), the rest add up.
+    """
+    combined = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if key not in combined:
+                combined[key] = value
+            elif key.endswith(("_max", "age_seconds")):
+                combined[key] = max(combined[key], value)
+            elif key.endswith("healthy"):
+                combined[key] = min(combined[key], value)
+            else:
+                combined[key] += value
+    return combined
+
+
+class Worker:
+    """The worker's side of the supervisor link, passed to the worker target."""
+
+    def __init__(self, index, count, stats_fd):
+        self.index = index
+        self.count = count
+        self.stats_fd = stats_fd
+        self._send_lock = threading.Lock()  # The reporter thread and the final send share the pipe
+
+    @property
+    def primary(self):
+        """Worker 0 prints the banner and other once-per-proxy output."""
+        return self.index == 0
+
+    def report(self, stats_fn, interval=REPORT_INTERVAL):
+        """Send stats_fn() to the supervisor every interval seconds from a daemon thread."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.send(stats_fn())
+
+        threading.Thread(target=run, name="stats-reporter", daemon=True).start()
+
+    def send(self, stats):
+        """
+        Write one stats line. With per-device labels a line can exceed PIPE_BUF, so it is not
+        written atomically: writes are serialized and short writes completed instead.
+        """
+        data = memoryview(json.dumps(stats, separators=(",", ":")).encode() + b"\n")
+        with self._send_lock:
+            try:
+                while data:
+                    data = data[os.write(self.stats_fd, data):]
+            except OSError:
+                pass  # Supervisor gone; it will not be reading anyway
+
+
+class Supervisor:
+    """Fork, watch and restart worker processes; aggregate their stats."""
+
+    def __init__(self, count, target, stats_interval=DEFAULT_STATS_INTERVAL, admin_port=0):
+        self.count = count
+        self.target = target  # callable(Worker), runs a proxy engine until interrupted
+        self.stats_interval = stats_interval
+        self.admin_port = admin_port
+        self.restarts = 0
+        self._pids = {}  # pid -> index
+        self._started = {}  # index -> monotonic start time
+        self._backoff = {}  # index -> seconds to wait before the next restart
+        self._pending = {}  # index -> monotonic time to restart at
+        self._pipes = {}  # read fd -> index
+        self._buffers = {}  # read fd -> partial line
+        self._stats = {}  # index -> last reported stats
+        self._retired = {}  # counters of exited workers
+        self._stopping = False
+        self._admin = None
+
+    def _spawn(self, index):
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()  # Or the child inherits and repeats buffered output
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for fd in self._pipes:
+                os.close(fd)
+            if self._admin is not None:
+                self._admin.socket.close()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                self.target(Worker(index, self.count, write_fd))
+            except KeyboardInterrupt:
+                pass
+            except BaseException as e:
+                print(f"[!] Worker {index} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        os.close(write_fd)
+        self._pids[pid] = index
+        self._started[index] = time.monotonic()
+        self._pipes[read_fd] = index
+        self._buffers[read_fd] = b""
+
+    def _read(self, fd):
+        try:
+            data = os.read(fd, 65536)
+        except OSError:
+            data = b""
+        if not data:
+            os.close(fd)
+            del self._pipes[fd]
+            del self._buffers[fd]
+            return
+        *lines, self._buffers[fd] = (self._buffers[fd] + data).split(b"\n")
+        for line in lines:
+            try:
+                self._stats[self._pipes[fd]] = json.loads(line)
+            except ValueError:
+                continue
+
+    def _retire(self, index):
+        """Keep an exited worker's counters so totals do not go backwards."""
+        for fd in [fd for fd, i in self._pipes.items() if i == index]:
+            while fd in self._pipes:  # The worker is gone, so this reads its last report up to EOF
+                self._read(fd)
+        stats = self._stats.pop(index, {})
+        totals = {key: value for key, value in stats.items() if is_counter(key)}
+        self._retired = aggregate([self._retired, totals])
+
+    def _reap(self):
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self._pids.pop(pid)
+            self._retire(index)
+            if self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            uptime = time.monotonic() - self._started[index]
+            delay = RESTART_MIN if uptime >= STABLE_SECONDS else self._backoff.get(index, RESTART_MIN)
+            self._backoff[index] = min(delay * 2, RESTART_MAX)
+            self._pending[index] = time.monotonic() + delay
+            print(f"[!] Worker {index} (pid {pid}) exited with {code}, restarting in {delay:.0f} s")
+
+    def stats(self):
+        """Aggregated stats of all workers, with totals of exited workers included."""
+        stats = aggregate([self._retired] + list(self._stats.values()))
+        stats["proxy_workers_up"] = len(self._pids)
+        stats["proxy_worker_restarts_total"] = self.restarts
+        return stats
+
+    def status_line(self):
+        s = self.stats()
+        line = (f"[*] Workers: {s['proxy_workers_up']}/{self.count} up, {self.restarts} restarts, "
+                f"connections {s.get('proxy_connections_active', 0)} active / "
+                f"{s.get('proxy_connections_total', 0)} total")
+        if "proxy_capture_dropped_total" in s:
+            line += f", capture dropped {s['proxy_capture_dropped_total']:.0f}"
+        return line
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        """Start the workers and supervise them until SIGINT or SIGTERM."""
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        install_dump_handler(self.stats)  # Workers install their own after the fork
+        print(f"[*] Supervisor pid {os.getpid()}: {self.count} workers sharing the listen port (SO_REUSEPORT)")
+        admin = None
+        if self.admin_port:
+            # Served from this loop rather than a thread, so forking restarted workers stays safe
+            admin = self._admin = admin_server(self.admin_port, self.stats)
+            print(f"[*] Metrics: http://0.0.0.0:{self.admin_port}/metrics (all workers)")
+        for index in range(self.count):
+            self._spawn(index)
+
+        last_status = time.monotonic()
+        while not self._stopping:
+            readable = list(self._pipes) + ([admin] if admin is not None else [])
+            try:
+                ready, _, _ = select.select(readable, [], [], 0.5)
+            except InterruptedError:
+                ready = []
+            for fd in ready:
+                if fd is admin:
+                    admin.handle_request()
+                else:
+                    self._read(fd)
+            self._reap()
+            now = time.monotonic()
+            for index, when in list(self._pending.items()):
+                if now >= when and not self._stopping:
+                    del self._pending[index]
+                    self.restarts += 1
+                    self._spawn(index)
+            if self.stats_interval and now - last_status >= self.stats_interval:
+                print(self.status_line())
+                last_status = now
+
+        print("\n[*] Stopping workers...")
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while self._pids and time.monotonic() < deadline:
+            for fd in select.select(list(self._pipes), [], [], 0.1)[0]:
+                self._read(fd)
+            self._reap()
+        for pid in self._pids:
+            print(f"[!] Worker pid {pid} did not stop, killing it")
+            os.kill(pid, signal.SIGKILL)
+        if admin is not None:
+            admin.server_close()
+        print(self.status_line())